@@ -0,0 +1,98 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import HTMLResponse, Response
+from typing import Optional
+import hmac
+
+from app.config import ADMIN_TOKEN
+from app.db.session import AsyncSessionLocal
+from app.services.events import event_hub
+from app.services.ipfs_cache import ipfs_cache
+from app.services.near_duplicates import near_duplicate_index
+from app.services.outbox import outbox_dispatcher
+from app.services.price_history import rebuild_price_history
+from app.services.ranking import ranking_job
+from app.services.reconcile import metadata_reconciler
+from app.services.profiling import Profiler, profile_store, render_profile
+
+router = APIRouter()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """管理接口鉴权：请求头 X-Admin-Token 必须等于 ADMIN_TOKEN"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin API disabled")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@router.get("/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    """最近剖析过的请求（最新的在前）"""
+    return {"enabled": Profiler is not None, "profiles": profile_store.list()}
+
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def get_profile(profile_id: str, format: str = Query("speedscope", pattern="^(speedscope|html)$")):
+    """下载一份剖析结果：speedscope JSON（默认）或 pyinstrument 的 HTML 火焰图"""
+    profile = profile_store.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    if format == "html":
+        return HTMLResponse(render_profile(profile, "html"))
+    return Response(
+        render_profile(profile),
+        media_type="application/json",
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.speedscope.json"'},
+    )
+
+
+@router.get("/outbox", dependencies=[Depends(require_admin)])
+async def outbox_stats():
+    """发件箱积压：各状态条数和最老的待发送条目等了多久"""
+    return await outbox_dispatcher.stats()
+
+
+@router.get("/events", dependencies=[Depends(require_admin)])
+async def event_stats():
+    """本 worker 的市场事件推送：订阅者数、缓冲的事件数"""
+    return event_hub.stats()
+
+
+@router.get("/ipfs_cache", dependencies=[Depends(require_admin)])
+async def ipfs_cache_stats():
+    """本 worker 的 /ipfs 磁盘缓存：文件数、占用字节数、正在回源的请求数"""
+    return ipfs_cache.stats()
+
+
+@router.post("/rankings/recompute", dependencies=[Depends(require_admin)])
+async def recompute_rankings():
+    """立即重算酒吧排名（不等定时任务）"""
+    result = await ranking_job.run_once(force=True)
+    if result is None:
+        raise HTTPException(status_code=409, detail="Rankings are being recomputed by another worker")
+    return result
+
+
+@router.post("/reconcile", dependencies=[Depends(require_admin)])
+async def reconcile_metadata():
+    """立即和链上 tokenURI 对账一遍（不等定时任务）"""
+    if not metadata_reconciler.configured:
+        raise HTTPException(status_code=400, detail="Set CHAIN_RPC_URL and RECIPE_NFT_ADDRESS / ID_NFT_ADDRESS first")
+    result = await metadata_reconciler.run_once(force=True)
+    if result is None:
+        raise HTTPException(status_code=409, detail="Metadata is being reconciled by another worker")
+    return result
+
+
+@router.post("/price_history/rebuild", dependencies=[Depends(require_admin)])
+async def rebuild_price_rollups():
+    """从原始价格点重算小时 / 天 / 周 rollup；价格历史为空时先用已有成交补一遍"""
+    async with AsyncSessionLocal() as db:
+        return await rebuild_price_history(db)
+
+
+@router.get("/near_duplicates", dependencies=[Depends(require_admin)])
+async def list_near_duplicates(limit: int = Query(100, ge=1, le=1000)):
+    """全目录的近似重复配方簇（每簇一个原作和它的复制品），大的在前；会扫描整个索引"""
+    return {**near_duplicate_index.clusters(limit), **near_duplicate_index.stats()}
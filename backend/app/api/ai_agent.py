@@ -1,41 +1,33 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 import os
-from typing import List, Dict, Any
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from app.config import KIMI_API_KEY, KIMI_BASE_URL, KIMI_MODEL
+import orjson
+from typing import List, Dict, Any, Awaitable, Callable
+from app.config import KIMI_API_KEY, KIMI_MODEL
+from app.services.llm_cache import llm_cache
+from app.services.chat_sessions import ChatSession, session_store
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.retrieval import catalog_index
+from app.api import ai_agent_fallback
+from app.services.kimi import (
+    KimiNotConfiguredError,
+    KimiOverloadedError,
+    KimiStream,
+    KimiTimeoutError,
+    breaker,
+    create_chat_completion,
+    health_status,
+    limiter,
+    open_chat_stream,
+)
 
 router = APIRouter()
 
-# Initialize OpenAI client for Kimi API
-client = None
-
-def get_ai_client():
-    """Get the AI client, initializing it if needed and API key is available."""
-    global client
-    if client is None and KIMI_API_KEY and KIMI_API_KEY.strip():
-        try:
-            # Import OpenAI only when needed to avoid initialization issues
-            from openai import OpenAI
-            client = OpenAI(
-                api_key=KIMI_API_KEY.strip(),
-                base_url=KIMI_BASE_URL,
-            )
-            print("✅ AI client initialized successfully")
-        except ImportError as e:
-            print(f"⚠️  Warning: OpenAI library not available: {str(e)}")
-            client = None
-        except Exception as e:
-            print(f"⚠️  Warning: Failed to initialize AI client: {str(e)}")
-            client = None
-    return client
-
-# Check if we can initialize the client at startup
-if KIMI_API_KEY and KIMI_API_KEY.strip():
-    get_ai_client()
-else:
-    print("⚠️  Warning: KIMI_API_KEY not found. AI Agent endpoints will not work until configured.")
+# AI 客户端在启动后的后台预热里（或第一次调用时）初始化，这里只检查配置
+if not (KIMI_API_KEY and KIMI_API_KEY.strip()):
+    print("⚠️  Warning: KIMI_API_KEY not found. AI Agent endpoints will serve fallback responses until configured.")
 
 # Pydantic models for request/response
 class ChatMessage(BaseModel):
@@ -61,29 +53,171 @@ class AgentResponse(BaseModel):
     reasoning: str
     suggestions: List[str] = []
 
-# Thread pool for running blocking operations
-executor = ThreadPoolExecutor(max_workers=4)
+class SessionCreateResponse(BaseModel):
+    session_id: str
+
+class SessionChatRequest(BaseModel):
+    message: str
+    temperature: float = 0.6
 
-def _call_kimi_api(messages: List[Dict], temperature: float = 0.6) -> str:
-    """Synchronous function to call Kimi API"""
-    ai_client = get_ai_client()
-    if not ai_client:
-        raise HTTPException(status_code=503, detail="AI service not configured. Please set KIMI_API_KEY in environment variables.")
-    
+class SessionChatResponse(BaseModel):
+    session_id: str
+    response: str
+
+CHAT_SYSTEM_PROMPT = "你是 Kimi，由 Moonshot AI 提供的人工智能助手，你更擅长中文和英文的对话。你会为用户提供安全，有帮助，准确的回答。同时，你会拒绝一切涉及恐怖主义，种族歧视，黄色暴力等问题的回答。Moonshot AI 为专有名词，不可翻译成其他语言。"
+
+# Enhanced system prompt for agent-like behavior
+AGENT_SYSTEM_PROMPT = """你是一个高级AI助手，具有以下能力：
+1. 分析复杂任务并制定解决方案
+2. 提供详细的推理过程
+3. 给出实用的建议和后续步骤
+4. 支持中英文对话
+
+请对用户的任务进行分析，提供解决方案，并说明你的推理过程。"""
+
+def _kimi_http_error(e: Exception) -> HTTPException:
+    """Map Kimi client errors to HTTP errors"""
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, KimiNotConfiguredError):
+        return HTTPException(status_code=503, detail=str(e))
+    if isinstance(e, KimiOverloadedError):
+        return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    if isinstance(e, KimiTimeoutError):
+        return HTTPException(status_code=504, detail=str(e))
+    return HTTPException(status_code=500, detail=f"AI API Error: {str(e)}")
+
+async def call_kimi_api_async(messages: List[Dict], temperature: float = 0.6) -> str:
+    """Call Kimi API through the response cache, shared async client and concurrency limiter"""
     try:
-        completion = ai_client.chat.completions.create(
-            model=KIMI_MODEL,
-            messages=messages,
-            temperature=temperature,
+        return await llm_cache.get_or_compute(
+            messages, KIMI_MODEL, temperature,
+            lambda: create_chat_completion(messages, temperature),
         )
-        return completion.choices[0].message.content
+    except (KimiNotConfiguredError, CircuitOpenError):
+        # Callers answer these with fallback responses
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"AI API Error: {str(e)}")
+        raise _kimi_http_error(e)
 
-async def call_kimi_api_async(messages: List[Dict], temperature: float = 0.6) -> str:
-    """Async wrapper for Kimi API call"""
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(executor, _call_kimi_api, messages, temperature)
+def _build_chat_messages(request: ChatRequest) -> List[Dict]:
+    # Prepare messages for API
+    messages = [{"role": "system", "content": CHAT_SYSTEM_PROMPT}]
+
+    # Add conversation history
+    for msg in request.history:
+        messages.append({"role": msg.role, "content": msg.content})
+
+    # Add current user message
+    messages.append({"role": "user", "content": request.message})
+    return messages
+
+def _build_agent_messages(request: AgentRequest) -> List[Dict]:
+    content = f"任务: {request.task}\n上下文: {request.context}"
+    # 附上本店数据库里最相关的几条 recipe / 酒吧资料，让回答基于真实数据
+    snippets = catalog_index.search(f"{request.task} {request.context or ''}")
+    if snippets:
+        content += "\n参考资料（来自本店数据库）:\n" + "\n".join(f"- {s}" for s in snippets)
+    return [
+        {"role": "system", "content": AGENT_SYSTEM_PROMPT},
+        {"role": "user", "content": content}
+    ]
+
+def _parse_agent_response(response: str) -> AgentResponse:
+    """Parse response to extract reasoning and suggestions"""
+    # This is a simple implementation - you could make it more sophisticated
+    lines = response.split('\n')
+    reasoning = ""
+    suggestions = []
+
+    for line in lines:
+        if line.strip().startswith(('建议:', '建议：', 'Suggestion:', 'Suggestions:')):
+            suggestions.append(line.strip())
+        elif line.strip().startswith(('推理:', '推理：', 'Reasoning:', 'Analysis:')):
+            reasoning = line.strip()
+
+    if not reasoning:
+        reasoning = "基于提供的信息进行分析和处理"
+
+    return AgentResponse(
+        result=response,
+        reasoning=reasoning,
+        suggestions=suggestions if suggestions else ["继续探索相关主题", "寻求更多具体信息"]
+    )
+
+def _sse(event: str, data: Any) -> bytes:
+    return f"event: {event}\ndata: ".encode() + orjson.dumps(data) + b"\n\n"
+
+async def _sse_stream(stream: KimiStream, on_complete: Callable[[str], Any], close: Callable[[], Awaitable[None]]):
+    """Forward upstream tokens as Server-Sent Events, then a final `done` event.
+
+    If the client disconnects, Starlette cancels this generator and the
+    `finally` block closes the upstream request (and runs the caller's on_close).
+    """
+    parts = []
+    try:
+        async for delta in stream:
+            parts.append(delta)
+            yield _sse("token", {"content": delta})
+        yield _sse("done", on_complete("".join(parts)))
+    except Exception as e:
+        yield _sse("error", {"detail": f"AI API Error: {str(e)}"})
+    finally:
+        await close()
+
+async def _open_sse_response(
+    messages: List[Dict],
+    temperature: float,
+    on_complete: Callable[[str], Any],
+    fallback: Callable[[Exception], Awaitable[Any]],
+    on_close: Callable[[], None] = lambda: None,
+) -> StreamingResponse:
+    """`on_close` runs once the response is over (finished, failed or client gone),
+    or right away when no upstream stream gets opened."""
+    # Open the upstream stream before responding so errors keep their status codes
+    try:
+        stream = await open_chat_stream(messages, temperature)
+    except (KimiNotConfiguredError, CircuitOpenError) as e:
+        on_close()
+        return ai_agent_fallback.single_event_stream(await fallback(e))
+    except Exception as e:
+        on_close()
+        raise _kimi_http_error(e)
+    except BaseException:
+        on_close()
+        raise
+
+    # Called from the generator's `finally` and from the background task: whichever
+    # runs first wins (the background task is skipped when the client disconnects
+    # mid-send, the generator's `finally` never runs if it was not started)
+    closed = False
+
+    async def close():
+        nonlocal closed
+        if closed:
+            return
+        closed = True
+        try:
+            await stream.aclose()
+        finally:
+            on_close()
+
+    return StreamingResponse(
+        _sse_stream(stream, on_complete, close),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(close),
+    )
+
+async def _chat_fallback_event(request: ChatRequest, error: Exception) -> Dict:
+    if isinstance(error, CircuitOpenError):
+        return {"response": ai_agent_fallback.unavailable_chat(request).response}
+    return {"response": (await ai_agent_fallback.chat_fallback(request)).response}
+
+async def _agent_fallback_event(request: AgentRequest, error: Exception) -> Dict:
+    if isinstance(error, CircuitOpenError):
+        return ai_agent_fallback.unavailable_agent().model_dump()
+    return (await ai_agent_fallback.agent_fallback(request)).model_dump()
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat_with_agent(request: ChatRequest):
@@ -91,23 +225,8 @@ async def chat_with_agent(request: ChatRequest):
     Simple chat endpoint for conversing with the AI agent
     """
     try:
-        # Prepare messages for API
-        messages = [
-            {
-                "role": "system", 
-                "content": "你是 Kimi，由 Moonshot AI 提供的人工智能助手，你更擅长中文和英文的对话。你会为用户提供安全，有帮助，准确的回答。同时，你会拒绝一切涉及恐怖主义，种族歧视，黄色暴力等问题的回答。Moonshot AI 为专有名词，不可翻译成其他语言。"
-            }
-        ]
-        
-        # Add conversation history
-        for msg in request.history:
-            messages.append({"role": msg.role, "content": msg.content})
-        
-        # Add current user message
-        messages.append({"role": "user", "content": request.message})
-        
         # Call AI API
-        response = await call_kimi_api_async(messages, request.temperature)
+        response = await call_kimi_api_async(_build_chat_messages(request), request.temperature)
         
         # Build response with updated history
         updated_history = request.history + [
@@ -120,86 +239,156 @@ async def chat_with_agent(request: ChatRequest):
             full_history=updated_history
         )
         
+    except KimiNotConfiguredError:
+        return await ai_agent_fallback.chat_fallback(request)
+    except CircuitOpenError:
+        return ai_agent_fallback.unavailable_chat(request)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
+@router.post("/chat/stream")
+async def chat_with_agent_stream(request: ChatRequest):
+    """
+    Streaming chat: `token` events as Kimi generates, then `done` with the full response
+    """
+    return await _open_sse_response(
+        _build_chat_messages(request),
+        request.temperature,
+        lambda response: {"response": response},
+        lambda error: _chat_fallback_event(request, error),
+    )
+
+def _get_session(session_id: str) -> ChatSession:
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Chat session not found or expired")
+    return session
+
+def _build_session_messages(session: ChatSession, user_message: Dict) -> List[Dict]:
+    return [{"role": "system", "content": CHAT_SYSTEM_PROMPT}] + session.prompt_history(
+        user_message, session_store.token_budget
+    )
+
+@router.post("/sessions", response_model=SessionCreateResponse)
+async def create_chat_session():
+    """
+    Start a server-side chat session; later turns only send the new message
+    """
+    return SessionCreateResponse(session_id=session_store.create().id)
+
+@router.post("/sessions/{session_id}/chat", response_model=SessionChatResponse)
+async def chat_in_session(session_id: str, request: SessionChatRequest):
+    """
+    Chat within a server-side session. History sent to Kimi is trimmed to
+    KIMI_HISTORY_TOKEN_BUDGET, and only the new reply is returned.
+    """
+    session = _get_session(session_id)
+    user_message = {"role": "user", "content": request.message}
+
+    async with session.lock:
+        try:
+            response = await call_kimi_api_async(_build_session_messages(session, user_message), request.temperature)
+        except KimiNotConfiguredError:
+            fallback = await ai_agent_fallback.chat_fallback(ChatRequest(message=request.message))
+            return SessionChatResponse(session_id=session.id, response=fallback.response)
+        except CircuitOpenError:
+            return SessionChatResponse(session_id=session.id, response=ai_agent_fallback.UNAVAILABLE_MESSAGE)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
+
+        session.append_turn(user_message, {"role": "assistant", "content": response}, session_store.token_budget)
+
+    return SessionChatResponse(session_id=session.id, response=response)
+
+@router.post("/sessions/{session_id}/chat/stream")
+async def chat_in_session_stream(session_id: str, request: SessionChatRequest):
+    """
+    Streaming variant of session chat; the turn is saved when the `done` event is sent.
+    The session lock is held until the stream ends, so a second turn sent meanwhile
+    gets 409 instead of being built from history that lacks the reply in progress.
+    """
+    session = _get_session(session_id)
+    user_message = {"role": "user", "content": request.message}
+
+    if session.lock.locked():
+        raise HTTPException(status_code=409, detail="Another reply is still in progress in this session")
+    messages = _build_session_messages(session, user_message)
+    # Not locked, so this returns without yielding and nobody can slip in between
+    await session.lock.acquire()
+
+    def on_complete(response: str) -> Dict:
+        session.append_turn(user_message, {"role": "assistant", "content": response}, session_store.token_budget)
+        return {"session_id": session.id, "response": response}
+
+    return await _open_sse_response(
+        messages,
+        request.temperature,
+        on_complete,
+        lambda error: _chat_fallback_event(ChatRequest(message=request.message), error),
+        on_close=session.lock.release,
+    )
+
+@router.delete("/sessions/{session_id}")
+async def delete_chat_session(session_id: str):
+    """
+    End a server-side chat session
+    """
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Chat session not found or expired")
+    return {"success": True}
+
 @router.post("/agent", response_model=AgentResponse)
 async def run_agent_task(request: AgentRequest):
     """
     Advanced agent endpoint that can perform complex tasks with reasoning
     """
     try:
-        # Enhanced system prompt for agent-like behavior
-        system_prompt = """你是一个高级AI助手，具有以下能力：
-1. 分析复杂任务并制定解决方案
-2. 提供详细的推理过程
-3. 给出实用的建议和后续步骤
-4. 支持中英文对话
-
-请对用户的任务进行分析，提供解决方案，并说明你的推理过程。"""
-        
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"任务: {request.task}\n上下文: {request.context}"}
-        ]
-        
         # Call AI API
-        response = await call_kimi_api_async(messages, request.temperature)
-        
-        # Parse response to extract reasoning and suggestions
-        # This is a simple implementation - you could make it more sophisticated
-        lines = response.split('\n')
-        reasoning = ""
-        suggestions = []
-        
-        for line in lines:
-            if line.strip().startswith(('建议:', '建议：', 'Suggestion:', 'Suggestions:')):
-                suggestions.append(line.strip())
-            elif line.strip().startswith(('推理:', '推理：', 'Reasoning:', 'Analysis:')):
-                reasoning = line.strip()
-        
-        if not reasoning:
-            reasoning = "基于提供的信息进行分析和处理"
-        
-        return AgentResponse(
-            result=response,
-            reasoning=reasoning,
-            suggestions=suggestions if suggestions else ["继续探索相关主题", "寻求更多具体信息"]
-        )
+        response = await call_kimi_api_async(_build_agent_messages(request), request.temperature)
+        return _parse_agent_response(response)
         
+    except KimiNotConfiguredError:
+        return await ai_agent_fallback.agent_fallback(request)
+    except CircuitOpenError:
+        return ai_agent_fallback.unavailable_agent()
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Agent error: {str(e)}")
 
+@router.post("/agent/stream")
+async def run_agent_task_stream(request: AgentRequest):
+    """
+    Streaming agent: `token` events as Kimi generates, then `done` with result/reasoning/suggestions
+    """
+    return await _open_sse_response(
+        _build_agent_messages(request),
+        request.temperature,
+        lambda response: _parse_agent_response(response).model_dump(),
+        lambda error: _agent_fallback_event(request, error),
+    )
+
 @router.get("/health")
 async def health_check():
     """
     Health check endpoint for the AI agent service
+
+    Reads the status cached by the background prober, so it never calls Kimi itself.
     """
-    try:
-        # Test API connection with a simple message
-        ai_client = get_ai_client()
-        if not ai_client:
-            return {
-                "status": "unhealthy",
-                "error": "AI client not configured - KIMI_API_KEY not found",
-                "api_connection": "not_configured"
-            }
-        
-        test_messages = [
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": "Hello"}
-        ]
-        
-        response = await call_kimi_api_async(test_messages)
-        
-        return {
-            "status": "healthy",
-            "api_connection": "active",
-            "test_response_length": len(response)
-        }
-    except Exception as e:
-        return {
-            "status": "unhealthy",
-            "error": str(e),
-            "api_connection": "failed"
-        } 
\ No newline at end of file
+    return {**health_status, "circuit": breaker.stats()}
+
+@router.get("/stats")
+async def ai_stats():
+    """
+    Upstream queue depth / wait time / in-flight counts and response cache hit rate
+    """
+    return {
+        "upstream": limiter.stats(),
+        "cache": llm_cache.stats(),
+        "circuit": breaker.stats(),
+        "sessions": session_store.stats(),
+    }
@@ -1,6 +1,8 @@
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import Any, List
+import orjson
 
 # Fallback router for when AI service is not available
 router = APIRouter()
@@ -55,6 +57,42 @@ async def agent_fallback(request: AgentRequest):
         ]
     )
 
+UNAVAILABLE_MESSAGE = "The AI service is temporarily unavailable. Please try again in a moment."
+
+def unavailable_chat(request: ChatRequest) -> ChatResponse:
+    """Chat response served while the upstream AI circuit is open"""
+    return ChatResponse(
+        response=UNAVAILABLE_MESSAGE,
+        full_history=request.history + [
+            ChatMessage(role="user", content=request.message),
+            ChatMessage(role="assistant", content=UNAVAILABLE_MESSAGE)
+        ]
+    )
+
+def unavailable_agent() -> AgentResponse:
+    """Agent response served while the upstream AI circuit is open"""
+    return AgentResponse(
+        result=UNAVAILABLE_MESSAGE,
+        reasoning="Upstream AI service is failing, request was not sent",
+        suggestions=["Retry in a minute", "Check /api/ai/health for the current service status"]
+    )
+
+def single_event_stream(data: Any) -> StreamingResponse:
+    """Answer a streaming endpoint with a single `done` event"""
+    async def events():
+        yield b"event: done\ndata: " + orjson.dumps(data) + b"\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.post("/chat/stream")
+async def chat_stream_fallback(request: ChatRequest):
+    """Fallback streaming chat endpoint when AI service is not configured"""
+    return single_event_stream({"response": (await chat_fallback(request)).response})
+
+@router.post("/agent/stream")
+async def agent_stream_fallback(request: AgentRequest):
+    """Fallback streaming agent endpoint when AI service is not configured"""
+    return single_event_stream((await agent_fallback(request)).model_dump())
+
 @router.get("/health")
 async def health_fallback():
     """Fallback health check"""
@@ -1,16 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import or_
+from sqlalchemy import func, or_
 from typing import List, Optional
 import json
 import os
-import requests
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from app.services.ipfs import upload_picture_to_pinata, upload_bar_to_pinata, fetch_metadata_from_ipfs
 from app.models.bar import Bar
+from app.models.bar_ranking import BarRanking
+from app.models.recipe import Recipe
+from app.models.transaction import Transaction
 from app.db.session import AsyncSessionLocal
+from app.config import BAR_CACHE_CONTROL, NEARBY_DEFAULT_RADIUS_KM, NEARBY_MAX_RADIUS_KM, NEARBY_MAX_RESULTS
+from app.utils.http_cache import HttpCache
+from app.utils.serialization import negotiate, recipe_card, scored_recipe_cards, select_recipe_cards
+from app.services.retrieval import catalog_index
+from app.services.autocomplete import autocomplete_index
+from app.services.geo import geo_index
+from app.services.recommender import recommender
+from app.services.invalidation import invalidation_bus
+from app.services.outbox import BAR_PROFILE_SYNC, enqueue, latest_status
+from app.services.events import BAR_UPDATED, publish_event
+from app.services.reconcile import bar_token_id
 
 router = APIRouter()
 
@@ -21,16 +34,22 @@ class BarUpdateRequest(BaseModel):
     bar_photo_cid: str
     bar_location: str
     bar_intro: Optional[str] = None
+    # 不传表示保持原来的坐标
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 class BarSetRequest(BaseModel):
     bar_address: str
     meta_cid: str
+    token_id: Optional[int] = None  # ID NFT 的 tokenId；不传时对账任务按 bar_address 从链上查
 
 class BarResponse(BaseModel):
     bar_name: str
     bar_photo_cid: str
     bar_location: str
     bar_intro: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
     owned_recipes: List[str] = []
     used_recipes: List[str] = []
 
@@ -75,12 +94,218 @@ async def upload_bar_ipfs(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
 
+async def _top_recipes(db: AsyncSession, bar_addresses: List[str], per_bar: int) -> dict:
+    """每个酒吧自己创建的、成交次数最多的 per_bar 个 recipe，一条查询取完"""
+    sales = (
+        select(Transaction.recipe_address, func.count().label("sales"))
+        .group_by(Transaction.recipe_address)
+        .subquery()
+    )
+    sales_count = func.coalesce(sales.c.sales, 0)
+    ranked = (
+        select_recipe_cards(
+            sales_count.label("sales"),
+            func.row_number().over(
+                partition_by=Recipe.owner_address,
+                order_by=(sales_count.desc(), Recipe.id),
+            ).label("rank"),
+        )
+        .outerjoin(sales, sales.c.recipe_address == Recipe.recipe_address)
+        .where(Recipe.owner_address.in_(bar_addresses))
+        .subquery()
+    )
+    result = await db.execute(
+        select(ranked).where(ranked.c.rank <= per_bar).order_by(ranked.c.owner_address, ranked.c.rank)
+    )
+
+    top = {address: [] for address in bar_addresses}
+    for row in result.mappings():
+        card = recipe_card(row)
+        card["sales"] = row["sales"]
+        top[row["owner_address"]].append(card)
+    return top
+
+@router.get("/nearby")
+async def get_nearby_bars(
+    request: Request,
+    lat: float = Query(..., ge=-90, le=90, description="纬度"),
+    lon: float = Query(..., ge=-180, le=180, description="经度"),
+    radius_km: float = Query(NEARBY_DEFAULT_RADIUS_KM, gt=0, le=NEARBY_MAX_RADIUS_KM, description="搜索半径（公里）"),
+    limit: int = Query(20, ge=1, le=NEARBY_MAX_RESULTS, description="最多返回几个酒吧"),
+    top_recipes: int = Query(0, ge=0, le=10, description="每个酒吧附带几个最热门的 recipe，0 表示不附带"),
+    db: AsyncSession = Depends(get_db)
+):
+    """半径内最近的酒吧，由近到远。距离计算走进程内的网格索引，数据库只按地址取这几个酒吧的资料。"""
+    tables = ("bars", "recipes", "transactions") if top_recipes else ("bars",)
+    cache = HttpCache(request, *tables, cache_control=BAR_CACHE_CONTROL)
+    if cache.is_fresh():
+        return cache.not_modified()
+
+    try:
+        nearest = geo_index.nearest(lat, lon, radius_km, limit)
+        if not nearest:
+            return negotiate(request, [], headers=cache.headers)
+
+        addresses = [address for address, _ in nearest]
+        result = await db.execute(
+            select(
+                Bar.bar_address, Bar.bar_name, Bar.bar_photo, Bar.bar_location,
+                Bar.bar_intro, Bar.latitude, Bar.longitude,
+            ).where(Bar.bar_address.in_(addresses))
+        )
+        bars_by_address = {row["bar_address"]: row for row in result.mappings()}
+        recipes_by_bar = await _top_recipes(db, addresses, top_recipes) if top_recipes else None
+
+        bars = []
+        for address, distance in nearest:
+            row = bars_by_address.get(address)
+            if row is None:  # 刚被删除，索引还没更新
+                continue
+            bar = {
+                "bar_address": address,
+                "bar_name": row["bar_name"],
+                "bar_photo_cid": row["bar_photo"],
+                "bar_location": row["bar_location"],
+                "bar_intro": row["bar_intro"],
+                "latitude": row["latitude"],
+                "longitude": row["longitude"],
+                "distance_km": round(distance, 3),
+            }
+            if recipes_by_bar is not None:
+                bar["top_recipes"] = recipes_by_bar[address]
+            bars.append(bar)
+        return negotiate(request, bars, headers=cache.headers)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
+
+@router.get("/recommended/{bar_address}")
+async def get_recommended_recipes(
+    bar_address: str,
+    request: Request,
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_db)
+):
+    """为酒吧推荐还没授权过的 recipe（根据和它授权过相同 recipe 的酒吧），不包括它自己创建的"""
+    cache = HttpCache(request, "recipes", "transactions", cache_control=BAR_CACHE_CONTROL)
+    if cache.is_fresh():
+        return cache.not_modified()
+
+    try:
+        owned = (await db.execute(
+            select(Recipe.recipe_address).where(Recipe.owner_address == bar_address)
+        )).scalars().all()
+        cards = await scored_recipe_cards(db, recommender.recommend(bar_address, limit, exclude=owned))
+        return negotiate(request, cards, headers=cache.headers)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
+
+def _ranking_dict(row) -> dict:
+    return {
+        "bar_address": row["bar_address"],
+        "bar_name": row["bar_name"],
+        "rank": row["rank"],
+        "pagerank": row["pagerank"],
+        "community": row["community"],
+        "community_size": row["community_size"],
+        "licenses_sold": row["licenses_sold"],
+        "licenses_bought": row["licenses_bought"],
+    }
+
+def _select_rankings():
+    return select(
+        BarRanking.bar_address, Bar.bar_name, BarRanking.rank, BarRanking.pagerank, BarRanking.community,
+        BarRanking.community_size, BarRanking.licenses_sold, BarRanking.licenses_bought,
+    ).outerjoin(Bar, Bar.bar_address == BarRanking.bar_address)
+
+@router.get("/rankings")
+async def get_bar_rankings(
+    request: Request,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    community: Optional[int] = Query(None, ge=0, description="只看这个社区"),
+    db: AsyncSession = Depends(get_db)
+):
+    """交易网络上影响力最大的酒吧（PageRank），由后台任务定期重算"""
+    cache = HttpCache(request, "rankings", cache_control=BAR_CACHE_CONTROL)
+    if cache.is_fresh():
+        return cache.not_modified()
+
+    try:
+        query = _select_rankings().order_by(BarRanking.rank).offset(offset).limit(limit)
+        if community is not None:
+            query = query.where(BarRanking.community == community)
+        result = await db.execute(query)
+        return negotiate(request, [_ranking_dict(row) for row in result.mappings()], headers=cache.headers)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
+
+@router.get("/rankings/{bar_address}")
+async def get_bar_ranking(
+    bar_address: str,
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """某个酒吧的影响力排名和所在社区"""
+    cache = HttpCache(request, "rankings", cache_control=BAR_CACHE_CONTROL)
+    if cache.is_fresh():
+        return cache.not_modified()
+
+    try:
+        result = await db.execute(_select_rankings().where(BarRanking.bar_address == bar_address))
+        row = result.mappings().one_or_none()
+        if not row:
+            raise HTTPException(status_code=404, detail="该酒吧还没有交易记录")
+        return negotiate(request, _ranking_dict(row), headers=cache.headers)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
+
+@router.get("/communities")
+async def get_bar_communities(
+    request: Request,
+    limit: int = Query(20, ge=1, le=200, description="返回最大的几个社区"),
+    members: int = Query(5, ge=1, le=50, description="每个社区列出排名最高的几个酒吧"),
+    db: AsyncSession = Depends(get_db)
+):
+    """经常互相交易的酒吧群体，按社区大小排序"""
+    cache = HttpCache(request, "rankings", cache_control=BAR_CACHE_CONTROL)
+    if cache.is_fresh():
+        return cache.not_modified()
+
+    try:
+        ranked = _select_rankings().add_columns(
+            func.row_number().over(partition_by=BarRanking.community, order_by=BarRanking.rank).label("position")
+        ).where(BarRanking.community < limit).subquery()
+        result = await db.execute(
+            select(ranked).where(ranked.c.position <= members).order_by(ranked.c.community, ranked.c.position)
+        )
+
+        communities = []
+        for row in result.mappings():
+            if not communities or communities[-1]["community"] != row["community"]:
+                communities.append({"community": row["community"], "size": row["community_size"], "top_bars": []})
+            communities[-1]["top_bars"].append(_ranking_dict(row))
+        return negotiate(request, communities, headers=cache.headers)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
+
 @router.get("/get/{bar_address}")
 async def get_bar(
     bar_address: str,
+    request: Request,
     db: AsyncSession = Depends(get_db)
 ):
     """根据 Bar 地址获取酒吧信息。"""
+    cache = HttpCache(request, "bars", cache_control=BAR_CACHE_CONTROL)
+    if cache.is_fresh():
+        return cache.not_modified()
+
     try:
         # 查询数据库中的Bar记录
         result = await db.execute(
@@ -95,24 +320,66 @@ async def get_bar(
         owned_recipes = json.loads(bar.owned_recipes) if bar.owned_recipes else []
         used_recipes = json.loads(bar.used_recipes) if bar.used_recipes else []
 
-        return BarResponse(
+        bar_response = BarResponse(
             bar_name=bar.bar_name,
             bar_photo_cid=bar.bar_photo,
             bar_location=bar.bar_location,
             bar_intro=bar.bar_intro,
+            latitude=bar.latitude,
+            longitude=bar.longitude,
             owned_recipes=owned_recipes,
             used_recipes=used_recipes
         )
+        return negotiate(request, bar_response.model_dump(), headers=cache.headers)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
 
+@router.get("/sync_status/{bar_address}")
+async def get_bar_sync_status(
+    bar_address: str,
+    db: AsyncSession = Depends(get_db)
+):
+    """资料更新的发件箱同步状态。metadata_cid 是最近一次成功 pin 到 IPFS 的新元数据，
+    需要 ID NFT 的持有者用钱包设置为 tokenURI；和 current_metadata_cid 相同说明已经上链（对账任务会回写）"""
+    try:
+        result = await db.execute(select(Bar.metadata_cid).where(Bar.bar_address == bar_address))
+        current = result.one_or_none()
+        if current is None:
+            raise HTTPException(status_code=404, detail="酒吧不存在")
+
+        status = await latest_status(db, BAR_PROFILE_SYNC, bar_address)
+        if status is None:
+            return {
+                "bar_address": bar_address,
+                "status": None,
+                "attempts": 0,
+                "last_error": None,
+                "metadata_cid": None,
+                "completed_at": None,
+                "current_metadata_cid": current.metadata_cid,
+            }
+        return {
+            "bar_address": bar_address,
+            "status": status["status"],
+            "attempts": status["attempts"],
+            "last_error": status["last_error"],
+            "metadata_cid": (status["result"] or {}).get("metadata_cid"),
+            "completed_at": status["completed_at"],
+            "current_metadata_cid": current.metadata_cid,
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
+
 @router.post("/update")
 async def update_bar(
     item: BarUpdateRequest,
     db: AsyncSession = Depends(get_db)
 ):
-    """更新酒吧信息。如果没有就报错, 还需要做一下链上的同步"""
+    """更新酒吧信息。如果没有就报错, 链上的同步通过发件箱异步进行"""
     try:
         # 查询现有记录
         result = await db.execute(
@@ -128,10 +395,27 @@ async def update_bar(
         bar.bar_photo = item.bar_photo_cid
         bar.bar_location = item.bar_location
         bar.bar_intro = item.bar_intro
+        if item.latitude is not None and item.longitude is not None:
+            bar.latitude = item.latitude
+            bar.longitude = item.longitude
+        await invalidation_bus.publish(db, ["bars"], bar_addresses=[bar.bar_address])
+        await publish_event(db, BAR_UPDATED, {
+            "bar_address": bar.bar_address,
+            "bar_name": bar.bar_name,
+            "bar_location": bar.bar_location,
+        }, bar_addresses=[bar.bar_address])
+        # 链上 / IPFS 同步写进发件箱，和资料更新一起提交，由后台 dispatcher 发送
+        await enqueue(db, BAR_PROFILE_SYNC, bar.bar_address, {
+            "bar_photo_cid": item.bar_photo_cid,
+            "bar_name": item.bar_name,
+            "bar_location": item.bar_location,
+            "bar_intro": item.bar_intro,
+        })
         
         await db.commit()
-        
-        # TODO: 这里需要添加链上同步逻辑
+        catalog_index.index_bar(bar.bar_address, bar.bar_name, bar.bar_location, bar.bar_intro)
+        geo_index.upsert(bar.bar_address, bar.latitude, bar.longitude)
+        autocomplete_index.add_bar(bar.bar_address, bar.bar_name)
         
         return {"success": True}
         
@@ -180,6 +464,12 @@ async def set_bar(
         bar_location = bar_metadata.get("barLocation", "")
         bar_intro = bar_metadata.get("barIntro", "")
         bar_photo = bar_metadata.get("barPhoto", "").replace("ipfs://", "")
+        # 坐标是可选字段，旧的元数据里没有
+        try:
+            latitude = float(bar_metadata["barLatitude"]) if bar_metadata.get("barLatitude") is not None else None
+            longitude = float(bar_metadata["barLongitude"]) if bar_metadata.get("barLongitude") is not None else None
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=422, detail="元数据中的barLatitude/barLongitude格式错误")
         
         # 验证必需字段
         if not bar_name:
@@ -194,12 +484,20 @@ async def set_bar(
             bar_photo=bar_photo,
             bar_location=bar_location,
             bar_intro=bar_intro,
+            latitude=latitude,
+            longitude=longitude,
+            token_id=item.token_id if item.token_id is not None else bar_token_id(item.bar_address),
+            metadata_cid=item.meta_cid,
             owned_recipes="[]",
             used_recipes="[]"
         )
         db.add(bar)
+        await invalidation_bus.publish(db, ["bars"], bar_addresses=[bar.bar_address])
         
         await db.commit()
+        catalog_index.index_bar(bar.bar_address, bar.bar_name, bar.bar_location, bar.bar_intro)
+        geo_index.upsert(bar.bar_address, bar.latitude, bar.longitude)
+        autocomplete_index.add_bar(bar.bar_address, bar.bar_name)
         
         return {"success": True}
         
@@ -0,0 +1,47 @@
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
+
+from app.services.events import BAR_UPDATED, RECIPE_LISTED, RECIPE_SOLD, Subscriber, event_hub
+
+router = APIRouter()
+
+EVENT_TYPES = {RECIPE_LISTED, RECIPE_SOLD, BAR_UPDATED}
+
+
+def _split(value: Optional[str]) -> set:
+    return {part.strip().lower() for part in value.split(",") if part.strip()} if value else set()
+
+
+@router.get("/stream")
+async def stream_events(
+    bar_address: Optional[str] = Query(None, description="只看这些酒吧相关的事件，逗号分隔"),
+    recipe_address: Optional[str] = Query(None, description="只看这些配方相关的事件，逗号分隔"),
+    types: Optional[str] = Query(None, description="recipe_listed / recipe_sold / bar_updated，逗号分隔"),
+    last_event_id: Optional[int] = Query(None, description="从这个事件之后开始续传（EventSource 重连时会自动带 Last-Event-ID 头）"),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    """市场事件推送（Server-Sent Events）：新配方上架、成交、酒吧资料更新
+
+    断线重连时浏览器的 EventSource 会自动带上 Last-Event-ID，服务端补发错过的事件；
+    收到 event: overflow 表示客户端读得太慢被断开，按最后的事件 id 重连即可。
+    收到 event: reset 表示错过的事件太多或者已经被清理、没法补发，客户端应该重新拉取一遍
+    列表数据，之后的事件照常推送。
+    """
+    type_filter = _split(types)
+    unknown = type_filter - EVENT_TYPES
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown event types: {', '.join(sorted(unknown))}")
+
+    if last_event_id_header is not None:
+        try:
+            last_event_id = int(last_event_id_header)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+
+    subscriber = Subscriber(_split(bar_address), _split(recipe_address), type_filter)
+    return StreamingResponse(
+        event_hub.stream(subscriber, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,74 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from datetime import datetime, timezone
+from typing import Optional
+import hmac
+
+from app.config import EXPORT_TOKEN
+from app.db.session import AsyncSessionLocal
+from app.services.export import CSV, DATASETS, NDJSON, ExportFilters, decode_cursor, stream_export, try_acquire_slot
+from app.services.price_history import naive_utc
+
+router = APIRouter()
+
+MEDIA_TYPES = {CSV: "text/csv; charset=utf-8", NDJSON: "application/x-ndjson"}
+
+
+def require_export_token(x_export_token: Optional[str] = Header(None)):
+    """导出接口鉴权：请求头 X-Export-Token 必须等于 EXPORT_TOKEN"""
+    if not EXPORT_TOKEN:
+        raise HTTPException(status_code=404, detail="Export API disabled")
+    if not x_export_token or not hmac.compare_digest(x_export_token, EXPORT_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid export token")
+
+
+@router.get("/{dataset}", dependencies=[Depends(require_export_token)])
+async def export_dataset(
+    dataset: str,
+    format: str = Query(CSV, pattern="^(csv|ndjson)$"),
+    since: Optional[datetime] = Query(None, description="只导出这个时间之后（含）的交易"),
+    until: Optional[datetime] = Query(None, description="只导出这个时间之前（不含）的交易"),
+    address: Optional[str] = Query(None, description="transactions: buyer 或 seller；recipes: owner；bars: bar_address"),
+    recipe_address: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None, description="续传：NDJSON 里最后收到的 _cursor"),
+    after_id: Optional[int] = Query(None, ge=0, description="续传：最后收到的一行的 id（CSV 用）"),
+    gzip: bool = Query(False, description="返回 .gz 文件"),
+):
+    """流式导出 transactions / recipes / bars（CSV 或 NDJSON），按 id 升序，可断点续传"""
+    spec = DATASETS.get(dataset)
+    if spec is None:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset, expected one of: {', '.join(DATASETS)}")
+
+    # 列里存的是不带时区的 UTC；带时区的参数要在发出 200 之前换算好，不能留到流里再出错
+    since = naive_utc(since) if since is not None else None
+    until = naive_utc(until) if until is not None else None
+    if since is not None and until is not None and since >= until:
+        raise HTTPException(status_code=400, detail="since must be earlier than until")
+
+    filters = ExportFilters(since=since, until=until, address=address, recipe_address=recipe_address)
+    unsupported = [name for name in ("since", "until", "address", "recipe_address")
+                   if getattr(filters, name) is not None and name not in spec.supports]
+    if unsupported:
+        raise HTTPException(status_code=400, detail=f"{dataset} does not support filters: {', '.join(unsupported)}")
+
+    if cursor is not None and after_id is not None:
+        raise HTTPException(status_code=400, detail="Use either cursor or after_id, not both")
+    if cursor is not None:
+        try:
+            after_id = decode_cursor(cursor, dataset, filters)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    # 名额满了直接拒绝，不让请求排队占着连接；名额在这里就占上，流结束时归还
+    slot = await try_acquire_slot()
+    if slot is None:
+        raise HTTPException(status_code=503, detail="Too many exports in progress, please retry later",
+                            headers={"Retry-After": "30"})
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    filename = f"{dataset}-{stamp}.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        stream_export(AsyncSessionLocal, dataset, format, filters, slot, after_id or 0, gzip=gzip),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"},
+    )
@@ -0,0 +1,54 @@
+import math
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+
+from app.services.admission import client_ip
+from app.services.ipfs_cache import IpfsFetchError, ipfs_cache, valid_cid
+
+router = APIRouter()
+
+# CID 就是内容的哈希，同一个 URL 的内容永远不变
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# 上游内容不可信：不让浏览器猜类型，也不执行里面的脚本
+SAFE_CONTENT_HEADERS = {
+    "X-Content-Type-Options": "nosniff",
+    "Content-Security-Policy": "default-src 'none'; style-src 'unsafe-inline'; sandbox",
+}
+
+
+def _client_has_it(request: Request, etag: str) -> bool:
+    """If-None-Match 里有这个 CID 的 ETag，说明客户端已经拿到过这份内容（内容不会变）。
+    If-Modified-Since 和 "*" 说明不了客户端有的是哪个 CID，照常走缓存，不存在的 CID 要返回 404"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+@router.api_route("/{cid}", methods=["GET", "HEAD"])
+async def get_ipfs_object(cid: str, request: Request):
+    """Serve IPFS content (bar / cocktail photos) from the local disk cache, fetching upstream on a miss."""
+    if not valid_cid(cid):
+        raise HTTPException(status_code=400, detail="Invalid CID")
+
+    etag = f'"{cid}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if _client_has_it(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        entry, stat_result = await ipfs_cache.get(cid, client="ip:" + client_ip(request.scope))
+    except IpfsFetchError as e:
+        # 失败不让浏览器缓存，上游恢复后刷新就能看到
+        error_headers = {"Cache-Control": "no-store"}
+        if e.retry_after is not None:
+            error_headers["Retry-After"] = str(max(1, math.ceil(e.retry_after)))
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=error_headers)
+
+    return FileResponse(
+        entry.path,
+        media_type=entry.media_type,
+        stat_result=stat_result,
+        headers={**headers, **SAFE_CONTENT_HEADERS},
+    )
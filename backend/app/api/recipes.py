@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Form
+from fastapi import APIRouter, Depends, HTTPException, Query, Form, Request
 from fastapi import UploadFile, File
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import or_
 from typing import List, Optional
+from datetime import datetime, timedelta, timezone
 import json
 import os
 from pydantic import BaseModel
@@ -11,6 +12,17 @@ from pydantic import BaseModel
 from app.services.ipfs import upload_picture_to_pinata, upload_recipe_to_pinata, fetch_metadata_from_ipfs
 from app.models.recipe import Recipe
 from app.db.session import AsyncSessionLocal
+from app.config import CATALOG_CACHE_CONTROL
+from app.utils.http_cache import HttpCache
+from app.utils.serialization import load_json_list, negotiate, recipe_card, scored_recipe_cards, select_recipe_cards
+from app.services.retrieval import catalog_index
+from app.services.recommender import recommender
+from app.services.autocomplete import BAR, RECIPE, autocomplete_index
+from app.services.near_duplicates import near_duplicate_index
+from app.services.invalidation import invalidation_bus
+from app.services.events import RECIPE_LISTED, publish_event
+from app.services.price_history import GRANULARITIES, naive_utc, pick_granularity, price_series, record_price
+from app.models.price_history import LISTED, PRICE_SET
 
 router = APIRouter()
 
@@ -32,6 +44,10 @@ class StoreRecipeRequest(BaseModel):
     user_address: List[str] = []
     price: Optional[float] = None
 
+class UpdatePriceRequest(BaseModel):
+    recipe_address: str
+    price: float
+
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
@@ -74,13 +90,15 @@ async def store_recipe(
     recipe_address: str,
     metadata_cid: str,
     owner_address: str,
-    price: float
+    price: float,
+    token_id: Optional[int] = Query(None, ge=0, description="RecipeNFT tokenId, used to reconcile with the on-chain tokenURI")
 ):
     """Store a recipe's metadata in the database."""
     # get metadata from ipfs
     item1 = fetch_metadata_from_ipfs(metadata_cid)
     item = item1["metadata"]
-
+    # 和已有配方比对（内存里的 LSH 索引，不查库），只提示不拦截
+    near_duplicates = near_duplicate_index.find(item["cocktail_recipe"], exclude_address=recipe_address)
 
     async with AsyncSessionLocal() as db:
         try:
@@ -95,110 +113,200 @@ async def store_recipe(
                 owner_address=owner_address,
                 user_address=json.dumps([]),
                 price=price,
-                status=None
+                status=None,
+                token_id=token_id,
+                metadata_cid=metadata_cid
             )            
             db.add(recipe)
+            await db.flush()
+            # 通知其它 worker（随事务一起提交）
+            await invalidation_bus.publish(db, ["recipes"], recipe_ids=[recipe.id])
+            await publish_event(db, RECIPE_LISTED, {
+                "recipe_address": recipe_address,
+                "cocktail_name": recipe.cocktail_name,
+                "owner_address": owner_address,
+                "price": price,
+            }, bar_addresses=[owner_address], recipe_address=recipe_address)
+            await record_price(db, recipe_address, LISTED, price)
 
             await db.commit()
             await db.refresh(recipe)
-            return True
+            catalog_index.index_recipe(
+                recipe.id, recipe.cocktail_name, recipe.cocktail_intro, recipe.recipe_address, recipe.price
+            )
+            autocomplete_index.add_recipe(recipe.recipe_address, recipe.cocktail_name, recipe.owner_address)
+            near_duplicate_index.add(
+                recipe.id, recipe.recipe_address, recipe.cocktail_name, recipe.owner_address, recipe.cocktail_recipe
+            )
+            return {"success": True, "near_duplicates": near_duplicates}
 
         except Exception as e:
             await db.rollback()
             raise HTTPException(status_code=500, detail=f"Failed to store recipe: {str(e)}")
 
+@router.post("/update_price")
+async def update_price(
+    item: UpdatePriceRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """Change a recipe's listing price and record it in the price history."""
+    if item.price < 0:
+        raise HTTPException(status_code=400, detail="Price must not be negative")
+    try:
+        result = await db.execute(select(Recipe).where(Recipe.recipe_address == item.recipe_address))
+        recipe = result.scalar_one_or_none()
+        if not recipe:
+            raise HTTPException(status_code=404, detail="Recipe not found")
+        if recipe.price == item.price:
+            return {"success": True}
+
+        recipe.price = item.price
+        await invalidation_bus.publish(db, ["recipes"], recipe_ids=[recipe.id])
+        await record_price(db, item.recipe_address, PRICE_SET, item.price)
+        await db.commit()
+        catalog_index.index_recipe(
+            recipe.id, recipe.cocktail_name, recipe.cocktail_intro, recipe.recipe_address, recipe.price
+        )
+        return {"success": True}
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to update price: {str(e)}")
+
+@router.get("/price_history/{recipe_address}")
+async def get_price_history(
+    recipe_address: str,
+    request: Request,
+    granularity: str = Query("auto", description="auto, hour, day or week"),
+    since: Optional[datetime] = Query(None, description="ISO 8601 (UTC if no offset), defaults to 30 days before `until`"),
+    until: Optional[datetime] = Query(None, description="ISO 8601, defaults to now")
+):
+    """Downsampled price / sales series for charts (min, max, avg, last, volume per bucket)."""
+    if granularity != "auto" and granularity not in GRANULARITIES:
+        raise HTTPException(status_code=422, detail="granularity must be one of: auto, hour, day, week")
+    # 不带时区的时间按 UTC 处理
+    until = naive_utc(until or datetime.now(timezone.utc))
+    since = naive_utc(since) if since else until - timedelta(days=30)
+    if since > until:
+        raise HTTPException(status_code=422, detail="since must be before until")
+    if granularity == "auto":
+        granularity = pick_granularity(since, until)
+
+    cache = HttpCache(request, "recipes", "transactions", cache_control=CATALOG_CACHE_CONTROL)
+    if cache.is_fresh():
+        return cache.not_modified()
+
+    async with AsyncSessionLocal() as db:
+        try:
+            buckets = await price_series(db, recipe_address, granularity, since, until)
+            return negotiate(request, {
+                "recipe_address": recipe_address,
+                "granularity": granularity,
+                "buckets": buckets,
+            }, headers=cache.headers)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to fetch price history: {str(e)}")
+
 @router.get("/get_ten_recipes")
-async def get_ten_recipes():
+async def get_ten_recipes(request: Request):
     """Get 10 recipes for display."""
+    cache = HttpCache(request, "recipes", cache_control=CATALOG_CACHE_CONTROL)
+    if cache.is_fresh():
+        return cache.not_modified()
+
     async with AsyncSessionLocal() as db:
         try:
-            result = await db.execute(select(Recipe).limit(10))
-            recipes = result.scalars().all()
-            
-            recipe_list = []
-            for recipe in recipes:
-                recipe_dict = {
-                    "recipe_address": recipe.recipe_address,
-                    "cocktail_name": recipe.cocktail_name,
-                    "cocktail_intro": recipe.cocktail_intro,
-                    "cocktail_photo": recipe.cocktail_photo,
-                    "cocktail_recipe": None,
-                    "owner_address": recipe.owner_address,
-                    "user_address": recipe.user_address,
-                    "price": recipe.price,
-                }
-                if recipe.user_address:
-                    recipe_dict["user_address"] = json.loads(recipe.user_address)
-                recipe_list.append(recipe_dict)
-            return recipe_list
+            result = await db.execute(select_recipe_cards().limit(10))
+            return negotiate(request, [recipe_card(row) for row in result.mappings()], headers=cache.headers)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to fetch recipes: {str(e)}")
 
 @router.get("/get_all_recipes")
-async def get_all_recipes():
+async def get_all_recipes(request: Request):
     """Get all recipes."""
+    cache = HttpCache(request, "recipes", cache_control=CATALOG_CACHE_CONTROL)
+    if cache.is_fresh():
+        return cache.not_modified()
+
     async with AsyncSessionLocal() as db:
         try:
-            result = await db.execute(select(Recipe))
-            recipes = result.scalars().all()
-            
-            recipe_list = []
-            for recipe in recipes:
-                recipe_dict = {
-                    "recipe_address": recipe.recipe_address,
-                    "cocktail_name": recipe.cocktail_name,
-                    "cocktail_intro": recipe.cocktail_intro,
-                    "cocktail_photo": recipe.cocktail_photo,
-                    "cocktail_recipe": None,
-                    "owner_address": recipe.owner_address,
-                    "user_address": recipe.user_address,
-                    "price": recipe.price,
-                }
-                if recipe.user_address:
-                    recipe_dict["user_address"] = json.loads(recipe.user_address)
-                recipe_list.append(recipe_dict)
-            
-            return recipe_list
+            result = await db.execute(select_recipe_cards())
+            return negotiate(request, [recipe_card(row) for row in result.mappings()], headers=cache.headers)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to fetch recipes: {str(e)}")
 
 @router.get("/search_recipes")
 async def search_recipes(
+    request: Request,
     query: str = Query(..., description="Search query string")
 ):
     """Search recipes by a string."""
+    cache = HttpCache(request, "recipes", cache_control=CATALOG_CACHE_CONTROL)
+    if cache.is_fresh():
+        return cache.not_modified()
+
     async with AsyncSessionLocal() as db:
         try:
             # Search in cocktail_name, cocktail_intro, and cocktail_recipe
             result = await db.execute(
-                select(Recipe).where(
+                select_recipe_cards(Recipe.id, Recipe.status).where(
                     or_(
                         Recipe.cocktail_name.ilike(f"%{query}%"),
                         Recipe.cocktail_intro.ilike(f"%{query}%"),
                     )
                 )
             )
-            recipes = result.scalars().all()
-            
+
             recipe_list = []
-            for recipe in recipes:
-                recipe_dict = {
-                    "id": recipe.id,
-                    "cocktail_name": recipe.cocktail_name,
-                    "cocktail_intro": recipe.cocktail_intro,
-                    "cocktail_photo": recipe.cocktail_photo,
-                    "owner_address": recipe.owner_address,
-                    "price": recipe.price,
-                    "status": recipe.status
-                }
-                if recipe.user_address:
-                    recipe_dict["user_address"] = json.loads(recipe.user_address)
+            for row in result.mappings():
+                recipe_dict = recipe_card(row)
+                recipe_dict["id"] = row["id"]
+                recipe_dict["status"] = row["status"]
+                # 和改动前一样：没有授权记录时不带 user_address 字段
+                if not row["user_address"]:
+                    del recipe_dict["user_address"]
                 recipe_list.append(recipe_dict)
-            
-            return recipe_list
+
+            return negotiate(request, recipe_list, headers=cache.headers)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
 
+@router.get("/autocomplete")
+async def autocomplete(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=64, description="What the user has typed so far"),
+    limit: int = Query(8, ge=1, le=20),
+    types: str = Query("recipe,bar", description="Comma-separated: recipe, bar")
+):
+    """Type-ahead suggestions for cocktail and bar names, most traded first (served from memory)."""
+    kinds = {kind.strip() for kind in types.split(",") if kind.strip()}
+    if not kinds or not kinds <= {RECIPE, BAR}:
+        raise HTTPException(status_code=422, detail="types must be a comma-separated subset of: recipe, bar")
+
+    cache = HttpCache(request, "recipes", "bars", "transactions", cache_control=CATALOG_CACHE_CONTROL)
+    if cache.is_fresh():
+        return cache.not_modified()
+    return negotiate(request, autocomplete_index.suggest(q, limit, kinds), headers=cache.headers)
+
+@router.get("/also_licensed/{recipe_address}")
+async def get_also_licensed(
+    recipe_address: str,
+    request: Request,
+    limit: int = Query(10, ge=1, le=50)
+):
+    """Bars that licensed this recipe also licensed... (co-licensing similarity, best first)."""
+    cache = HttpCache(request, "recipes", "transactions", cache_control=CATALOG_CACHE_CONTROL)
+    if cache.is_fresh():
+        return cache.not_modified()
+
+    async with AsyncSessionLocal() as db:
+        try:
+            cards = await scored_recipe_cards(db, recommender.similar(recipe_address, limit))
+            return negotiate(request, cards, headers=cache.headers)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to fetch recommendations: {str(e)}")
+
 @router.get("/get_one_recipe/{nft_address}/{user_address}") # search from what? ERC4907 address from chain? that's one additional step
 async def get_one_recipe(
     nft_address: str,
@@ -208,26 +316,19 @@ async def get_one_recipe(
     async with AsyncSessionLocal() as db:
         try:
             result = await db.execute(
-                select(Recipe).where(Recipe.recipe_address == nft_address)
+                select_recipe_cards(Recipe.cocktail_recipe).where(Recipe.recipe_address == nft_address)
             )
-            recipe = result.scalar_one_or_none()
-            
-            if not recipe:
+            row = result.mappings().one_or_none()
+
+            if not row:
                 raise HTTPException(status_code=404, detail="Recipe not found")
-            
-            recipe_dict = {
-                "recipe_address": recipe.recipe_address,
-                "cocktail_name": recipe.cocktail_name,
-                "cocktail_intro": recipe.cocktail_intro,
-                "cocktail_photo": recipe.cocktail_photo,
-                "cocktail_recipe": None,
-                "owner_address": recipe.owner_address,
-                "user_address": recipe.user_address,
-                "price": recipe.price,
-            }
-            if recipe.user_address and (user_address in json.loads(recipe.user_address) or user_address == recipe.owner_address):
-                recipe_dict["cocktail_recipe"] = recipe.cocktail_recipe
-            
+
+            recipe_dict = recipe_card(row)
+            # 这个接口一直返回库里存的 JSON 字符串（不是解析后的列表），保持不变
+            recipe_dict["user_address"] = row["user_address"]
+            if row["user_address"] and (user_address in load_json_list(row["user_address"]) or user_address == row["owner_address"]):
+                recipe_dict["cocktail_recipe"] = row["cocktail_recipe"]
+
             return recipe_dict
         except HTTPException:
             raise
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Depends
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Depends, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import or_
 from typing import Optional
 import json
 import os
@@ -12,6 +13,15 @@ from app.models.transaction import Transaction
 from app.models.bar import Bar
 from app.models.recipe import Recipe
 from app.db.session import AsyncSessionLocal
+from app.config import HISTORY_CACHE_CONTROL
+from app.utils.http_cache import HttpCache
+from app.services.invalidation import invalidation_bus
+from app.services.events import RECIPE_SOLD, publish_event
+from app.services.recommender import recommender
+from app.services.autocomplete import autocomplete_index
+from app.services.price_history import record_price
+from app.models.price_history import SALE
+from app.utils.serialization import negotiate
 
 router = APIRouter()
 
@@ -74,8 +84,23 @@ async def complete_transaction(
             timestamp=datetime.fromisoformat(request.timestamp)
         )
         db.add(transaction)
+        await invalidation_bus.publish(
+            db, ["recipes", "bars", "transactions"], licenses=[(request.buyer, request.recipe_nft)]
+        )
+        await publish_event(db, RECIPE_SOLD, {
+            "recipe_address": request.recipe_nft,
+            "cocktail_name": recipe.cocktail_name,
+            "buyer": request.buyer,
+            "seller": seller,
+            "price": recipe.price,
+        }, bar_addresses=[request.buyer, seller], recipe_address=request.recipe_nft)
+        await record_price(
+            db, request.recipe_nft, SALE, recipe.price, timestamp=transaction.timestamp, buyer=request.buyer
+        )
         
         await db.commit()
+        recommender.add(request.buyer, request.recipe_nft)
+        autocomplete_index.record_sale(request.recipe_nft)
         return {"success": True}
         
     except Exception as e:
@@ -85,46 +110,49 @@ async def complete_transaction(
 @router.get("/transaction_history/{address}")
 async def get_transaction_history(
     address: str,
+    request: Request,
     db: AsyncSession = Depends(get_db)
 ):
     """获取某地址的交易历史"""
+    cache = HttpCache(request, "transactions", cache_control=HISTORY_CACHE_CONTROL)
+    if cache.is_fresh():
+        return cache.not_modified()
+
     try:
-        # 查询作为buyer的交易
+        # 一次查询同时取出作为buyer和seller的交易，只取需要的列并在数据库里排序
         result = await db.execute(
-            select(Transaction).where(Transaction.buyer == address)
+            select(
+                Transaction.id,
+                Transaction.buyer,
+                Transaction.seller,
+                Transaction.recipe_address,
+                Transaction.timestamp,
+            )
+            .where(or_(Transaction.buyer == address, Transaction.seller == address))
+            .order_by(Transaction.timestamp.desc())
         )
-        buyer_transactions = result.scalars().all()
-        
-        # 查询作为seller的交易
-        result = await db.execute(
-            select(Transaction).where(Transaction.seller == address)
-        )
-        seller_transactions = result.scalars().all()
-        
-        # 合并并格式化
+
         all_transactions = []
-        for tx in buyer_transactions:
-            all_transactions.append({
-                "id": tx.id,
-                "type": "buy",
-                "counterparty": tx.seller,
-                "recipe_address": tx.recipe_address,
-                "timestamp": tx.timestamp.isoformat()
-            })
-        
-        for tx in seller_transactions:
-            all_transactions.append({
-                "id": tx.id,
-                "type": "sell",
-                "counterparty": tx.buyer,
-                "recipe_address": tx.recipe_address,
-                "timestamp": tx.timestamp.isoformat()
-            })
-        
-        # 按时间排序
-        all_transactions.sort(key=lambda x: x["timestamp"], reverse=True)
-        
-        return all_transactions
-        
+        for tx_id, buyer, seller, recipe_address, timestamp in result:
+            timestamp = timestamp.isoformat()
+            if buyer == address:
+                all_transactions.append({
+                    "id": tx_id,
+                    "type": "buy",
+                    "counterparty": seller,
+                    "recipe_address": recipe_address,
+                    "timestamp": timestamp
+                })
+            if seller == address:
+                all_transactions.append({
+                    "id": tx_id,
+                    "type": "sell",
+                    "counterparty": buyer,
+                    "recipe_address": recipe_address,
+                    "timestamp": timestamp
+                })
+
+        return negotiate(request, all_transactions, headers=cache.headers)
+
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"获取交易历史失败: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"获取交易历史失败: {str(e)}")
@@ -1,4 +1,6 @@
 import os
+import tempfile
+import uuid
 from dotenv import load_dotenv
 
 # 加载 .env 文件
@@ -14,6 +16,8 @@ POSTGRES_PORT = os.getenv("POSTGRES_PORT")
 DATABASE_URL = (
     f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
 )
+# 启动时等待缓存失效的 LISTEN 连接建立的最长秒数，超时则启动失败（/health/ready 显示 failed）
+LISTEN_CONNECT_TIMEOUT = float(os.getenv("LISTEN_CONNECT_TIMEOUT", "30"))
 
 # IPFS 配置 (Pinata)
 PINATA_JWT = os.getenv("PINATA_JWT")
@@ -24,6 +28,123 @@ PINATA_API_SECRET = os.getenv("PINATA_API_SECRET")
 KIMI_API_KEY = os.getenv("KIMI_API_KEY")
 KIMI_BASE_URL = os.getenv("KIMI_BASE_URL", "https://api.moonshot.cn/v1")
 KIMI_MODEL = os.getenv("KIMI_MODEL", "kimi-k2-0711-preview")
+KIMI_MAX_CONCURRENCY = int(os.getenv("KIMI_MAX_CONCURRENCY", "16"))   # 同时进行的上游请求数
+KIMI_MAX_QUEUE = int(os.getenv("KIMI_MAX_QUEUE", "64"))               # 排队请求数上限，超过直接拒绝
+KIMI_QUEUE_TIMEOUT = float(os.getenv("KIMI_QUEUE_TIMEOUT", "10"))     # 排队最长等待秒数
+KIMI_REQUEST_TIMEOUT = float(os.getenv("KIMI_REQUEST_TIMEOUT", "60"))  # 单次上游请求超时秒数
+KIMI_CACHE_MAX_ENTRIES = int(os.getenv("KIMI_CACHE_MAX_ENTRIES", "1024"))          # 0 表示关闭缓存
+KIMI_CACHE_TTL = float(os.getenv("KIMI_CACHE_TTL", "3600"))                         # 缓存有效秒数
+KIMI_CACHE_MAX_TEMPERATURE = float(os.getenv("KIMI_CACHE_MAX_TEMPERATURE", "0.3"))  # 只缓存不高于该值的请求
+KIMI_CACHE_PATH = os.getenv("KIMI_CACHE_PATH", "")                                  # sqlite 文件路径，留空则只缓存在内存
+KIMI_BREAKER_FAILURE_RATE = float(os.getenv("KIMI_BREAKER_FAILURE_RATE", "0.5"))  # 最近调用中失败/慢调用比例达到该值即熔断
+KIMI_BREAKER_SLOW_CALL_SECONDS = float(os.getenv("KIMI_BREAKER_SLOW_CALL_SECONDS", "30"))
+KIMI_BREAKER_OPEN_SECONDS = float(os.getenv("KIMI_BREAKER_OPEN_SECONDS", "30"))    # 熔断后多久尝试恢复
+KIMI_HEALTH_INTERVAL = float(os.getenv("KIMI_HEALTH_INTERVAL", "30"))              # 后台健康探测间隔秒数
+KIMI_SESSION_MAX = int(os.getenv("KIMI_SESSION_MAX", "10000"))                    # 服务端保存的聊天会话数上限
+KIMI_SESSION_TTL = float(os.getenv("KIMI_SESSION_TTL", "3600"))                    # 会话闲置多久后过期（秒）
+KIMI_HISTORY_TOKEN_BUDGET = int(os.getenv("KIMI_HISTORY_TOKEN_BUDGET", "4000"))    # 每轮发给 Kimi 的历史 token 上限
+
+# 检索配置（给 /agent 注入本店数据）
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))  # 0 表示不注入
+
+# 推荐配置（共同授权）
+RECOMMENDER_NEIGHBORS = int(os.getenv("RECOMMENDER_NEIGHBORS", "50"))                  # 每个 recipe 预先保留的相似 recipe 数
+RECOMMENDER_FOLD_THRESHOLD = int(os.getenv("RECOMMENDER_FOLD_THRESHOLD", "10000"))     # 增量攒到多少条时合并进稀疏矩阵
+
+# 近似重复 recipe 检测配置（MinHash + LSH）
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.7"))   # 估计的 Jaccard 相似度达到多少算近似重复
+NEAR_DUPLICATE_MAX_RESULTS = int(os.getenv("NEAR_DUPLICATE_MAX_RESULTS", "10"))  # store_recipe 最多返回几个疑似重复
+
+# 附近酒吧查询配置
+GEO_CELL_DEGREES = float(os.getenv("GEO_CELL_DEGREES", "0.1"))           # 网格大小（度），0.1 度约 11 公里
+NEARBY_DEFAULT_RADIUS_KM = float(os.getenv("NEARBY_DEFAULT_RADIUS_KM", "5"))
+NEARBY_MAX_RADIUS_KM = float(os.getenv("NEARBY_MAX_RADIUS_KM", "500"))
+NEARBY_MAX_RESULTS = int(os.getenv("NEARBY_MAX_RESULTS", "100"))
+
+# HTTP 缓存与压缩配置
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))  # 字节，小于该值不压缩
+CATALOG_CACHE_CONTROL = os.getenv("CATALOG_CACHE_CONTROL", "public, max-age=30")
+BAR_CACHE_CONTROL = os.getenv("BAR_CACHE_CONTROL", "public, max-age=60")
+HISTORY_CACHE_CONTROL = os.getenv("HISTORY_CACHE_CONTROL", "private, no-cache")
+
+# 查询预算配置（每个请求）
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "log")                          # off / log / raise
+QUERY_BUDGET_MAX_QUERIES = int(os.getenv("QUERY_BUDGET_MAX_QUERIES", "10"))        # 单个请求的语句条数上限
+QUERY_BUDGET_MAX_DB_TIME = float(os.getenv("QUERY_BUDGET_MAX_DB_TIME", "0.5"))     # 单个请求的数据库总耗时上限（秒）
+QUERY_BUDGET_REPEAT_THRESHOLD = int(os.getenv("QUERY_BUDGET_REPEAT_THRESHOLD", "3"))  # 同形状语句重复几次视为 N+1
+
+# 性能剖析配置
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")                         # 请求头 X-Profile-Token 等于该值时剖析该请求，留空则关闭
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))     # 随机剖析的请求比例，0~1
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))       # 采样间隔秒数
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "50"))      # 内存里保留最近多少份剖析结果
+
+# 管理接口配置
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # 请求头 X-Admin-Token，留空则关闭 /api/admin
+
+# 限流与负载保护
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_READ = os.getenv("RATE_LIMIT_READ", "20/40")     # 每个调用方：每秒补充的令牌数/桶容量，GET 请求
+RATE_LIMIT_WRITE = os.getenv("RATE_LIMIT_WRITE", "5/10")    # 其它写请求
+RATE_LIMIT_AI = os.getenv("RATE_LIMIT_AI", "0.5/5")         # /api/ai 下的请求
+RATE_LIMIT_IPFS_MISS = os.getenv("RATE_LIMIT_IPFS_MISS", "2/30")  # /ipfs 里要回源的请求（命中缓存不扣）
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "100000"))  # 内存里保留的调用方数量上限
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"  # 部署在反向代理后面时打开
+FORWARDED_FOR_HOPS = int(os.getenv("FORWARDED_FOR_HOPS", "1"))  # 可信代理的层数：取 X-Forwarded-For 从右数第几个
+SHED_LOOP_LAG = float(os.getenv("SHED_LOOP_LAG", "0.2"))    # 事件循环延迟超过该值（秒）开始丢弃低优先级请求
+SHED_POOL_WAIT = float(os.getenv("SHED_POOL_WAIT", "0.5"))  # 取数据库连接的等待超过该值（秒）开始丢弃
+
+# 发件箱（链上 / IPFS 同步）配置
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))    # 没有待发送条目时的轮询间隔（秒）
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))          # 每次领取的条目数
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "4"))         # 同时发送的条目数
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "120"))  # 领取后多久没完成视为 worker 挂了，可被重新领取
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))       # 超过后标记为 failed
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "5"))     # 重试间隔 = base * 2^(attempts-1)，带随机抖动
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "900"))
+
+# 批量导出配置
+EXPORT_TOKEN = os.getenv("EXPORT_TOKEN", "")                                # 请求头 X-Export-Token，留空则关闭 /api/export
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "2000"))             # 服务端游标每次取多少行
+EXPORT_CHECKPOINT_ROWS = int(os.getenv("EXPORT_CHECKPOINT_ROWS", "10000"))  # NDJSON 每多少行插入一个续传游标
+EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT", "2"))        # 同时进行的导出数（每个占一个数据库连接）
+
+# IPFS 图片网关（/ipfs/{cid}）配置
+IPFS_GATEWAY_URL = os.getenv("IPFS_GATEWAY_URL", "https://gateway.pinata.cloud/ipfs")         # 缓存未命中时回源的网关
+IPFS_CACHE_DIR = os.getenv("IPFS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "bhb-ipfs-cache"))  # 同一台机器上的 worker 共用
+IPFS_CACHE_MAX_BYTES = int(os.getenv("IPFS_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))          # 磁盘缓存上限，超过按最久未访问淘汰
+IPFS_MAX_OBJECT_BYTES = int(os.getenv("IPFS_MAX_OBJECT_BYTES", str(20 * 1024 ** 2)))       # 单个文件上限，超过不缓存直接拒绝
+IPFS_FETCH_TIMEOUT = float(os.getenv("IPFS_FETCH_TIMEOUT", "20"))
+IPFS_FETCH_CONCURRENCY = int(os.getenv("IPFS_FETCH_CONCURRENCY", "8"))                     # 同时回源的请求数
+IPFS_NEGATIVE_TTL = float(os.getenv("IPFS_NEGATIVE_TTL", "60"))                           # 回源失败后多久内不再重试同一个 CID
+
+# 链上元数据对账配置（tokenURI 和库里的 metadata_cid 对比），设置了 RPC 地址和至少一个合约地址才会运行
+CHAIN_RPC_URL = os.getenv("CHAIN_RPC_URL", "")              # EVM JSON-RPC 地址
+RECIPE_NFT_ADDRESS = os.getenv("RECIPE_NFT_ADDRESS", "")    # RecipeNFT 合约
+ID_NFT_ADDRESS = os.getenv("ID_NFT_ADDRESS", "")            # IDNFT 合约（酒吧）
+RECONCILE_INTERVAL = float(os.getenv("RECONCILE_INTERVAL", "21600"))   # 多久对账一次（秒），多 worker 时只有一个 worker 执行
+RECONCILE_PAGE_SIZE = int(os.getenv("RECONCILE_PAGE_SIZE", "1000"))    # 每次从库里读多少行，也是一次批量更新的最大行数
+RECONCILE_RPC_BATCH = int(os.getenv("RECONCILE_RPC_BATCH", "100"))     # 一个 JSON-RPC 批量请求里的 eth_call 数
+RECONCILE_CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", "8"))   # 同时进行的 RPC 请求 / IPFS 拉取数
+
+# 价格历史配置
+PRICE_HISTORY_MAX_BUCKETS = int(os.getenv("PRICE_HISTORY_MAX_BUCKETS", "1000"))  # 图表接口一次最多返回的区间数（取最近的）
+
+# 交易网络排名配置
+RANKING_INTERVAL = float(os.getenv("RANKING_INTERVAL", "3600"))   # 多久重算一次（秒），多 worker 时只有一个 worker 计算
+RANKING_DAMPING = float(os.getenv("RANKING_DAMPING", "0.85"))     # PageRank 阻尼系数
+
+# 市场事件推送（SSE）配置
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "1000"))            # 每个 worker 内存里保留的最近事件数，用于断线续传
+EVENT_SUBSCRIBER_BUFFER = int(os.getenv("EVENT_SUBSCRIBER_BUFFER", "100"))  # 每个订阅者最多积压的事件数，超过视为慢消费者断开
+EVENT_KEEPALIVE_SECONDS = float(os.getenv("EVENT_KEEPALIVE_SECONDS", "15"))
+EVENT_REPLAY_LIMIT = int(os.getenv("EVENT_REPLAY_LIMIT", "1000"))          # 续传时最多补发的事件数
+EVENT_RETENTION_HOURS = float(os.getenv("EVENT_RETENTION_HOURS", "24"))    # 数据库里保留多久的事件
+
+# 多 worker 部署
+# 同一次启动的所有 worker 共享同一个 BOOT_ID（start.sh 里生成），一次性的初始化
+# （重置数据库、注入假数据）只由其中一个 worker 执行；不设置时每个进程各自生成
+BOOT_ID = os.getenv("BOOT_ID") or uuid.uuid4().hex
 
 # 其他配置
 DEBUG = os.getenv("DEBUG", "True").lower() == "true"
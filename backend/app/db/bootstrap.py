@@ -0,0 +1,48 @@
+# backend/app/db/bootstrap.py
+"""多 worker 启动时的一次性初始化
+
+所有 worker 用同一个 Postgres advisory lock 排队，拿到锁后检查 app_bootstrap 表：
+本次启动（BOOT_ID）的这个步骤已经有人做完就跳过，否则执行并记录下来。
+app_bootstrap 不属于任何模型的 metadata，reset_db 不会删掉它。
+"""
+from typing import Awaitable, Callable
+
+from sqlalchemy import text
+
+from app.config import BOOT_ID
+from app.db.session import engine
+
+# pg_advisory_lock 的键，随便取一个不会和别处冲突的常量
+BOOTSTRAP_LOCK_KEY = 0x0B4C_B007
+
+
+async def run_once(step: str, func: Callable[[], Awaitable[None]]) -> bool:
+    """本次启动中只执行一次 func；返回这次调用是否真正执行了"""
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": BOOTSTRAP_LOCK_KEY})
+        try:
+            await conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS app_bootstrap ("
+                " boot_id TEXT NOT NULL, step TEXT NOT NULL,"
+                " finished_at TIMESTAMPTZ NOT NULL DEFAULT now(),"
+                " PRIMARY KEY (boot_id, step))"
+            ))
+            done = (await conn.execute(
+                text("SELECT 1 FROM app_bootstrap WHERE boot_id = :boot_id AND step = :step"),
+                {"boot_id": BOOT_ID, "step": step},
+            )).first()
+            # 提交掉上面的事务，执行 func 期间不占着事务（advisory lock 是会话级的，不受影响）
+            await conn.commit()
+            if done:
+                return False
+
+            await func()
+            await conn.execute(
+                text("INSERT INTO app_bootstrap (boot_id, step) VALUES (:boot_id, :step)"),
+                {"boot_id": BOOT_ID, "step": step},
+            )
+            await conn.commit()
+            return True
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": BOOTSTRAP_LOCK_KEY})
+            await conn.commit()
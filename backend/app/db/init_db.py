@@ -1,18 +1,58 @@
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine
 from app.config import DATABASE_URL
 from app.models.bar import Bar, Base as BarBase
 from app.models.recipe import Recipe, Base as RecipeBase
 from app.models.transaction import Transaction, Base as TransactionBase
+from app.models.outbox import OutboxEntry, Base as OutboxBase
+from app.models.market_event import MarketEvent, Base as MarketEventBase
+from app.models.bar_ranking import BarRanking, Base as BarRankingBase
+from app.models.metadata_reconcile import MetadataReconcileRun, Base as MetadataReconcileBase
+from app.models.price_history import RecipePricePoint, RecipePriceRollup, Base as PriceHistoryBase
 import asyncio
 
-async def init_db():
-    """初始化数据库，创建表结构"""
-    engine = create_async_engine(DATABASE_URL, echo=True)
+# 后来给已有的表加的列和索引：create_all 只建不存在的表，不会改已存在的表，
+# 没有重置过的库要靠这些语句补上（每条都可以重复执行）
+SCHEMA_UPGRADES = (
+    # 附近酒吧（坐标）
+    "ALTER TABLE bars ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION",
+    "ALTER TABLE bars ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION",
+    "CREATE INDEX IF NOT EXISTS ix_bars_lat_lon ON bars (latitude, longitude)",
+    # 链上元数据对账
+    "ALTER TABLE bars ADD COLUMN IF NOT EXISTS token_id BIGINT",
+    "ALTER TABLE bars ADD COLUMN IF NOT EXISTS metadata_cid VARCHAR",
+    "ALTER TABLE recipes ADD COLUMN IF NOT EXISTS token_id BIGINT",
+    "ALTER TABLE recipes ADD COLUMN IF NOT EXISTS metadata_cid VARCHAR",
+    "CREATE INDEX IF NOT EXISTS ix_recipes_token_id ON recipes (token_id)",
+    # 跨 worker 共享的表版本号（app/utils/http_cache.py）；不属于任何模型，reset_db 不会删
+    "CREATE TABLE IF NOT EXISTS data_versions ("
+    " table_name TEXT PRIMARY KEY,"
+    " version BIGINT NOT NULL DEFAULT 1,"
+    " modified_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),"
+    " epoch TEXT NOT NULL DEFAULT md5(random()::text || clock_timestamp()::text))",
+    "INSERT INTO data_versions (table_name)"
+    " SELECT unnest(ARRAY['recipes', 'bars', 'transactions', 'rankings']) ON CONFLICT DO NOTHING",
+)
+
+async def upgrade_schema(conn):
+    """给已有的表补上缺的列（在 create_all 之后执行）"""
+    for statement in SCHEMA_UPGRADES:
+        await conn.execute(text(statement))
+
+async def init_db(echo: bool = True):
+    """初始化数据库，创建表结构，并给已有的表补上后来加的列"""
+    engine = create_async_engine(DATABASE_URL, echo=echo)
     async with engine.begin() as conn:
         # 创建所有表
         await conn.run_sync(BarBase.metadata.create_all)
         await conn.run_sync(RecipeBase.metadata.create_all)
         await conn.run_sync(TransactionBase.metadata.create_all)
+        await conn.run_sync(OutboxBase.metadata.create_all)
+        await conn.run_sync(MarketEventBase.metadata.create_all)
+        await conn.run_sync(BarRankingBase.metadata.create_all)
+        await conn.run_sync(MetadataReconcileBase.metadata.create_all)
+        await conn.run_sync(PriceHistoryBase.metadata.create_all)
+        await upgrade_schema(conn)
     await engine.dispose()
 
 async def reset_db():
@@ -23,10 +63,20 @@ async def reset_db():
         await conn.run_sync(BarBase.metadata.drop_all)
         await conn.run_sync(RecipeBase.metadata.drop_all)
         await conn.run_sync(TransactionBase.metadata.drop_all)
+        await conn.run_sync(OutboxBase.metadata.drop_all)
+        await conn.run_sync(MarketEventBase.metadata.drop_all)
+        await conn.run_sync(BarRankingBase.metadata.drop_all)
+        await conn.run_sync(MetadataReconcileBase.metadata.drop_all)
+        await conn.run_sync(PriceHistoryBase.metadata.drop_all)
         # 重新创建所有表
         await conn.run_sync(BarBase.metadata.create_all)
         await conn.run_sync(RecipeBase.metadata.create_all)
         await conn.run_sync(TransactionBase.metadata.create_all)
+        await conn.run_sync(OutboxBase.metadata.create_all)
+        await conn.run_sync(MarketEventBase.metadata.create_all)
+        await conn.run_sync(BarRankingBase.metadata.create_all)
+        await conn.run_sync(MetadataReconcileBase.metadata.create_all)
+        await conn.run_sync(PriceHistoryBase.metadata.create_all)
     await engine.dispose()
 
 if __name__ == "__main__":
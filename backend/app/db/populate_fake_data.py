@@ -5,12 +5,21 @@ from app.config import DATABASE_URL
 from app.models.bar import Bar, Base as BarBase
 from app.models.recipe import Recipe, Base as RecipeBase
 from app.models.transaction import Transaction, Base as TransactionBase
-from faker import Faker
+from app.services.price_history import rebuild_price_history
 import random
 import json
 from datetime import datetime, timedelta
 
-fake = Faker()
+_fake = None
+
+
+def get_fake():
+    """Faker 初始化比较慢，用到时才创建"""
+    global _fake
+    if _fake is None:
+        from faker import Faker
+        _fake = Faker()
+    return _fake
 
 engine = create_async_engine(DATABASE_URL, echo=True)
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
@@ -26,6 +35,8 @@ async def create_fake_bars(session, n=5):
             bar_photo=bar_data['bar_photo'],
             bar_name=bar_data['bar_name'],
             bar_location=bar_data['bar_location'],
+            latitude=bar_data.get('latitude'),
+            longitude=bar_data.get('longitude'),
             bar_intro=bar_data['bar_intro'],
             bar_address=bar_data['bar_address'],
             owned_recipes=json.dumps(bar_data['owned_recipes']),
@@ -89,6 +100,7 @@ async def main():
         recipes = await create_fake_recipes(session, 10, bar_addresses=bar_addresses)  # 10 recipes
         await create_fake_transactions(session, 15, bars=bars, recipes=recipes)  # 15 transactions
         await session.commit()
+        await rebuild_price_history(session)  # 用这些成交补出价格历史
     await engine.dispose()
 
 if __name__ == "__main__":
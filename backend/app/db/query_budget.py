@@ -0,0 +1,172 @@
+# backend/app/db/query_budget.py
+"""每个请求的 SQL 查询预算
+
+通过 contextvar 统计当前请求执行了多少条语句、数据库总耗时，以及同一种语句
+（参数不同、形状相同）重复了几次——同一形状在一个请求里反复出现通常就是 N+1。
+
+QUERY_BUDGET_MODE:
+- off:   不统计
+- log:   超出预算时打印警告（默认）
+- raise: 超出条数或出现 N+1 时直接抛出 QueryBudgetExceeded，适合开发和 CI
+
+测试里用 assert_max_queries 断言一次调用的查询条数::
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        with assert_max_queries(1):
+            await client.get("/api/trans/transaction_history/0xabc")
+"""
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from sqlalchemy import event
+
+from app.config import (
+    QUERY_BUDGET_MAX_DB_TIME,
+    QUERY_BUDGET_MAX_QUERIES,
+    QUERY_BUDGET_MODE,
+    QUERY_BUDGET_REPEAT_THRESHOLD,
+)
+
+_ITEM = r"(?:\$\d+|\?|%\(\w+\)s|\d+)"
+_PLACEHOLDER_LIST = re.compile(rf"\(\s*{_ITEM}(?:\s*,\s*{_ITEM})*\s*\)")
+_NUMBER = re.compile(r"\b\d+\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """把 IN 列表、数字字面量和空白规整掉，只保留语句的形状"""
+    shape = _PLACEHOLDER_LIST.sub("(?)", statement)
+    shape = _NUMBER.sub("?", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+class QueryBudgetExceeded(Exception):
+    """raise 模式下超出查询预算"""
+
+
+class QueryStats:
+    def __init__(self, parent: Optional["QueryStats"] = None):
+        self.parent = parent
+        self.count = 0
+        self.db_time = 0.0
+        self.shapes: Counter = Counter()
+
+    def record(self, shape: str, seconds: float) -> None:
+        stats = self
+        while stats is not None:
+            stats.count += 1
+            stats.db_time += seconds
+            stats.shapes[shape] += 1
+            stats = stats.parent
+
+    def repeated(self, threshold: int = QUERY_BUDGET_REPEAT_THRESHOLD) -> List[tuple]:
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+    def summary(self) -> str:
+        lines = [f"{self.count} queries, {self.db_time * 1000:.1f} ms in DB"]
+        lines.extend(f"  {n}x {shape[:200]}" for shape, n in self.shapes.most_common(5))
+        return "\n".join(lines)
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+
+@contextmanager
+def track_queries():
+    """在这个 with 块里统计查询（嵌套时外层也会计入）"""
+    stats = QueryStats(parent=_current.get())
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def assert_max_queries(max_queries: int):
+    """测试用：块内执行的语句超过 max_queries 条时 AssertionError"""
+    with track_queries() as stats:
+        yield stats
+    if stats.count > max_queries:
+        raise AssertionError(f"Expected at most {max_queries} queries, got {stats.summary()}")
+
+
+def instrument_engine(sync_engine) -> None:
+    """挂上统计用的引擎事件（异步引擎传 engine.sync_engine）"""
+    if QUERY_BUDGET_MODE == "off":
+        return
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = _current.get()
+        if stats is None:
+            return
+        if QUERY_BUDGET_MODE == "raise":
+            shape = statement_shape(statement)
+            if stats.count + 1 > QUERY_BUDGET_MAX_QUERIES:
+                raise QueryBudgetExceeded(
+                    f"Query budget of {QUERY_BUDGET_MAX_QUERIES} exceeded\n{stats.summary()}"
+                )
+            if stats.shapes[shape] + 1 >= QUERY_BUDGET_REPEAT_THRESHOLD:
+                raise QueryBudgetExceeded(
+                    f"Same statement executed {stats.shapes[shape] + 1} times in one request (N+1?): {shape[:200]}"
+                )
+        conn.info.setdefault("budget_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = _current.get()
+        started = conn.info.get("budget_started")
+        if stats is None or not started:
+            return
+        stats.record(statement_shape(statement), time.perf_counter() - started.pop())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _handle_error(context):
+        started = context.connection.info.get("budget_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+class QueryBudgetMiddleware:
+    """纯 ASGI 中间件：按请求统计查询，返回 Server-Timing 头，超预算时打印警告"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if QUERY_BUDGET_MODE == "off" or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start" and stats.count:
+                    timing = f'db;dur={stats.db_time * 1000:.1f};desc="{stats.count} queries"'
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode())]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                self._report(scope, stats)
+
+    @staticmethod
+    def _report(scope, stats: QueryStats) -> None:
+        problems = []
+        if stats.count > QUERY_BUDGET_MAX_QUERIES:
+            problems.append(f"{stats.count} queries > budget {QUERY_BUDGET_MAX_QUERIES}")
+        if stats.db_time > QUERY_BUDGET_MAX_DB_TIME:
+            problems.append(f"{stats.db_time * 1000:.0f} ms in DB > budget {QUERY_BUDGET_MAX_DB_TIME * 1000:.0f} ms")
+        for shape, n in stats.repeated():
+            problems.append(f"possible N+1, {n}x: {shape[:200]}")
+        if problems:
+            print(f"⚠️  Query budget: {scope['method']} {scope['path']}: " + "; ".join(problems))
@@ -2,6 +2,10 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from app.config import DATABASE_URL
+from app.services.metrics import InstrumentedAsyncPool, instrument_engine
+from app.db import query_budget
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+engine = create_async_engine(DATABASE_URL, echo=True, poolclass=InstrumentedAsyncPool)
+instrument_engine(engine.sync_engine)
+query_budget.instrument_engine(engine.sync_engine)
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
@@ -1,9 +1,21 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+# 最先导入：只依赖标准库，用来给后面每一步计时
+from app.services.startup import startup_report
+
+with startup_report.step("import fastapi"):
+    from fastapi import FastAPI
+    from fastapi.responses import ORJSONResponse, PlainTextResponse
+    from fastapi.middleware.cors import CORSMiddleware
 import asyncio
 import os
+import sys
+
+app = FastAPI(title="Bars Help Bars Backend API", default_response_class=ORJSONResponse)
 
-app = FastAPI(title="Bars Help Bars Backend API")
+# 限流和过载保护，放在 CORS 里面，这样 429 / 503 响应也带 CORS 头
+with startup_report.step("import admission control"):
+    from app.services.admission import AdmissionMiddleware
+
+app.add_middleware(AdmissionMiddleware)
 
 # CORS configuration
 app.add_middleware(
@@ -26,16 +38,49 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+with startup_report.step("import middleware"):
+    from app.db.query_budget import QueryBudgetMiddleware
+    from app.services.profiling import ProfilingMiddleware
+    from app.services.metrics import MetricsMiddleware, render_metrics, start_loop_lag_monitor
+
+# 每个请求的查询条数 / 数据库耗时 / N+1 检查
+app.add_middleware(QueryBudgetMiddleware)
+
+# 按需剖析（X-Profile-Token 或按比例抽样）
+app.add_middleware(ProfilingMiddleware)
+
+# 请求延迟指标，放在最外层，CORS 等中间件的耗时也计算在内
+app.add_middleware(MetricsMiddleware)
+
 # 路由导入
-from app.api import bars, recipes, trans_and_mint
+with startup_report.step("import app.api.bars"):
+    from app.api import bars
+with startup_report.step("import app.api.recipes"):
+    from app.api import recipes
+with startup_report.step("import app.api.trans_and_mint"):
+    from app.api import trans_and_mint
+with startup_report.step("import app.api.admin"):
+    from app.api import admin
+with startup_report.step("import app.api.events"):
+    from app.api import events
+with startup_report.step("import app.api.export"):
+    from app.api import export
+with startup_report.step("import app.api.ipfs"):
+    from app.api import ipfs
 
 app.include_router(bars.router, prefix="/api/bars", tags=["Bars"])
 app.include_router(recipes.router, prefix="/api/recipes", tags=["Recipes"])
 app.include_router(trans_and_mint.router, prefix="/api/trans", tags=["Transactions & Mint"])
+app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
+app.include_router(events.router, prefix="/api/events", tags=["Events"])
+app.include_router(export.router, prefix="/api/export", tags=["Export"])
+app.include_router(ipfs.router, prefix="/ipfs", tags=["IPFS"])
 
-# Conditionally import AI agent based on availability
+# Conditionally import AI agent based on availability.
+# 运行时 Kimi 不可用（未配置或熔断中）时，ai_agent 自己会返回 fallback 响应
 try:
-    from app.api import ai_agent
+    with startup_report.step("import app.api.ai_agent"):
+        from app.api import ai_agent
     app.include_router(ai_agent.router, prefix="/api/ai", tags=["AI Agent"])
     print("✅ AI Agent service loaded successfully")
 except Exception as e:
@@ -47,15 +92,138 @@ except Exception as e:
     except Exception as fallback_error:
         print(f"❌ Failed to load AI Agent fallback: {str(fallback_error)}")
 
+async def warm_up():
+    """后台预热：数据库初始化、检索索引、AI 客户端，全部完成后才算就绪"""
+    try:
+        # 建出新加的表，给已有的表补上新加的列（不重置的库也靠这一步升级）
+        with startup_report.step("upgrade database schema"):
+            from app.db.bootstrap import run_once
+            from app.db.init_db import init_db
+            # 多 worker 时只有一个 worker 执行，其它 worker 等它完成
+            await run_once("upgrade_schema", lambda: init_db(echo=False))
+
+        if os.getenv("INIT_DB_ON_STARTUP", "true").lower() == "true":
+            with startup_report.step("reset and seed database"):
+                from app.db.init_db import reset_db
+                from app.db.populate_fake_data import main
+                from app.db.session import AsyncSessionLocal
+                from app.utils.http_cache import data_versions
+
+                async def reset_and_seed():
+                    await reset_db()  # 删除所有表并重新创建
+                    await main()  # 注入假数据
+                    # 数据整体换了：所有表的版本号加一，重置前发出去的 ETag 不再命中
+                    async with AsyncSessionLocal() as db:
+                        await data_versions.bump_all(db)
+                        await db.commit()
+
+                await run_once("reset_and_seed", reset_and_seed)
+
+        # 先订阅其它 worker 的缓存失效消息，再构建索引，中间的写入不会漏掉
+        # 市场事件和缓存失效共用同一条 LISTEN 连接，要在 start() 之前注册
+        with startup_report.step("subscribe to cache invalidations"):
+            from app.services.events import event_hub
+            from app.services.invalidation import invalidation_bus
+            event_hub.start()
+            await invalidation_bus.start()
+
+        # 订阅之后再读表版本号：读之后的写入都会通过 NOTIFY 收到
+        with startup_report.step("load data versions"):
+            from app.db.session import AsyncSessionLocal
+            from app.utils.http_cache import data_versions
+            async with AsyncSessionLocal() as db:
+                await data_versions.load(db)
+
+        # 构建 /agent 用的检索索引
+        with startup_report.step("build catalog index"):
+            from app.db.session import AsyncSessionLocal
+            from app.services.retrieval import catalog_index
+            async with AsyncSessionLocal() as db:
+                await catalog_index.rebuild(db)
+
+        # 附近酒吧查询用的坐标网格索引
+        with startup_report.step("build geo index"):
+            from app.services.geo import geo_index
+            async with AsyncSessionLocal() as db:
+                await geo_index.rebuild(db)
+
+        # 共同授权推荐
+        with startup_report.step("build recommender"):
+            from app.services.recommender import recommender
+            async with AsyncSessionLocal() as db:
+                await recommender.rebuild(db)
+
+        # 搜索框的输入联想
+        with startup_report.step("build autocomplete index"):
+            from app.services.autocomplete import autocomplete_index
+            async with AsyncSessionLocal() as db:
+                await autocomplete_index.rebuild(db)
+
+        # 近似重复配方检测（MinHash LSH）
+        with startup_report.step("build near-duplicate index"):
+            from app.services.near_duplicates import near_duplicate_index
+            async with AsyncSessionLocal() as db:
+                await near_duplicate_index.rebuild(db)
+
+        # 登记 /ipfs 磁盘缓存里已有的文件（上次运行或别的 worker 下载的）
+        with startup_report.step("scan IPFS cache"):
+            from app.services.ipfs_cache import ipfs_cache
+            await ipfs_cache.load()
+
+        # 发件箱后台发送（多 worker 时用 SKIP LOCKED 分摊）
+        from app.services.outbox import outbox_dispatcher
+        outbox_dispatcher.start()
+
+        # 定期重算交易网络排名（多 worker 时只有拿到 advisory lock 的那个计算）
+        from app.services.ranking import ranking_job
+        ranking_job.start()
+
+        # 定期和链上 tokenURI 对账，只重新拉取 CID 变了的元数据（没有配置 RPC 时不启动）
+        from app.services.reconcile import metadata_reconciler
+        metadata_reconciler.start()
+
+        if "app.api.ai_agent" in sys.modules:
+            from app.services.kimi import get_ai_client, start_health_prober
+            # openai 的导入比较慢，放到线程里，不阻塞事件循环
+            with startup_report.step("init AI client"):
+                await asyncio.to_thread(get_ai_client)
+            # 后台探测 Kimi 可用性，健康检查直接读取缓存的结果，熔断器也据此自动恢复
+            start_health_prober()
+
+        startup_report.mark_ready()
+    except Exception as e:
+        startup_report.mark_failed(str(e))
+        print(f"❌ Warm-up failed: {str(e)}")
+    finally:
+        startup_report.print_report()
+
+_warm_up_task = None
+
 @app.on_event("startup")
 async def startup_event():
-    if os.getenv("INIT_DB_ON_STARTUP", "true").lower() == "true":
-        from app.db.init_db import reset_db
-        from app.db.populate_fake_data import main
-        await reset_db()  # 删除所有表并重新创建
-        await main()  # 注入假数据
+    global _warm_up_task
+    start_loop_lag_monitor()
+    _warm_up_task = asyncio.create_task(warm_up())
 
 @app.get("/")
 @app.head("/")
 def root():
     return {"BNB Running"}
+
+@app.get("/health/live", include_in_schema=False)
+def health_live():
+    """存活检查：进程能响应就返回 200"""
+    return {"status": "alive"}
+
+@app.get("/health/ready", include_in_schema=False)
+def health_ready():
+    """就绪检查：后台预热完成前返回 503"""
+    report = startup_report.summary()
+    if not startup_report.ready:
+        return ORJSONResponse({"status": "starting" if not startup_report.error else "failed", **report}, status_code=503)
+    return {"status": "ready", **report}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus 抓取接口"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
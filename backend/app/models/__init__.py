@@ -1,5 +1,10 @@
 from app.models.bar import Bar, Base as BarBase
 from app.models.recipe import Recipe, Base as RecipeBase
 from app.models.transaction import Transaction, Base as TransactionBase
+from app.models.outbox import OutboxEntry, Base as OutboxBase
+from app.models.market_event import MarketEvent, Base as MarketEventBase
+from app.models.bar_ranking import BarRanking, Base as BarRankingBase
+from app.models.metadata_reconcile import MetadataReconcileRun, Base as MetadataReconcileBase
+from app.models.price_history import RecipePricePoint, RecipePriceRollup, Base as PriceHistoryBase
 
 Base = BarBase  # 只需一个Base即可
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import BigInteger, Column, Float, Index, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -13,4 +13,12 @@ class Bar(Base):
     bar_intro = Column(String, nullable=True)
     owned_recipes = Column(String[999], nullable=True)
     used_recipes = Column(String[999], nullable=True)
+    # WGS84 坐标，没有时不出现在附近酒吧查询里（查询走进程内的网格索引，见 app/services/geo.py）
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    # 元数据来源：ID NFT 的 tokenId（没有时对账任务按 bar_address 从链上查）和写入时用的 metadata CID
+    token_id = Column(BigInteger, nullable=True)
+    metadata_cid = Column(String, nullable=True)
+
+    __table_args__ = (Index("ix_bars_lat_lon", "latitude", "longitude"),)
     
\ No newline at end of file
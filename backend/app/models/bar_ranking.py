@@ -0,0 +1,16 @@
+from sqlalchemy import Column, DateTime, Float, Integer, String, func
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base()
+
+class BarRanking(Base):
+    """交易网络上的酒吧影响力（PageRank）和社区划分，由后台任务整体重算"""
+    __tablename__ = 'bar_rankings'
+    bar_address = Column(String, primary_key=True)
+    pagerank = Column(Float, nullable=False)
+    rank = Column(Integer, nullable=False, index=True)            # 按 pagerank 的名次，从 1 开始
+    community = Column(Integer, nullable=False, index=True)       # 社区编号，0 是最大的社区
+    community_size = Column(Integer, nullable=False)
+    licenses_sold = Column(Integer, nullable=False, default=0)    # 作为 seller 的成交数
+    licenses_bought = Column(Integer, nullable=False, default=0)  # 作为 buyer 的成交数
+    computed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
@@ -0,0 +1,12 @@
+from sqlalchemy import BigInteger, Column, DateTime, String, Text, func
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base()
+
+class MarketEvent(Base):
+    """市场事件（上架、成交、酒吧资料更新），id 就是推送给客户端的序号"""
+    __tablename__ = 'market_events'
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    type = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)  # JSON，包含过滤用的 bar_addresses / recipe_address
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, DateTime, Integer, func
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base()
+
+class MetadataReconcileRun(Base):
+    """元数据对账任务每跑完一轮记一行（链上 tokenURI 和库里的 metadata_cid 对比）"""
+    __tablename__ = 'metadata_reconcile_runs'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    checked = Column(Integer, nullable=False, default=0)     # 查过链上 tokenURI 的行数
+    changed = Column(Integer, nullable=False, default=0)     # CID 变了、重新拉取并更新的行数
+    failed = Column(Integer, nullable=False, default=0)      # RPC 或 IPFS 失败、下一轮再试的行数
+    untracked = Column(Integer, nullable=False, default=0)   # 没有 token_id、无法对账的行数
+    seconds = Column(Integer, nullable=False, default=0)
+    finished_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, DateTime, Integer, String, Text, func
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base()
+
+# status 取值
+PENDING = "pending"        # 等待发送（包括失败后等待重试）
+IN_FLIGHT = "in_flight"    # 已被某个 worker 领取，lease_until 之前不会被别人领取
+DONE = "done"
+SUPERSEDED = "superseded"  # 同一个 key 有更新的条目，这条不再发送
+FAILED = "failed"          # 超过最大重试次数
+
+class OutboxEntry(Base):
+    """事务性发件箱：和业务数据在同一个事务里写入，后台 dispatcher 异步发送"""
+    __tablename__ = 'outbox'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    topic = Column(String, nullable=False)                      # 例如 bar_profile_sync
+    aggregate_key = Column(String, nullable=False, index=True)  # 去重用，例如 bar_address
+    payload = Column(Text, nullable=False)                      # JSON
+    status = Column(String, nullable=False, default=PENDING, index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    lease_until = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)                        # 发送成功后的结果（JSON），例如新的 metadata CID
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
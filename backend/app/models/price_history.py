@@ -0,0 +1,41 @@
+from sqlalchemy import BigInteger, Column, DateTime, Float, Index, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base()
+
+# kind 取值
+LISTED = "listed"        # 上架时的标价
+PRICE_SET = "price_set"  # 创建者改价（链上 RecipeNFT.PriceSet）
+SALE = "sale"            # 成交，price 是成交时的标价
+
+# granularity 取值
+HOUR = "hour"
+DAY = "day"
+WEEK = "week"            # 从周一 00:00 开始
+
+class RecipePricePoint(Base):
+    """recipe 价格的原始时间序列，只追加不修改"""
+    __tablename__ = 'recipe_price_points'
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    recipe_address = Column(String, nullable=False)
+    kind = Column(String, nullable=False)
+    price = Column(Float, nullable=False)
+    buyer = Column(String, nullable=True)     # 成交时的买方
+    timestamp = Column(DateTime, nullable=False)
+
+    __table_args__ = (Index("ix_recipe_price_points_recipe_time", "recipe_address", "timestamp"),)
+
+class RecipePriceRollup(Base):
+    """按小时 / 天 / 周预先聚合的价格，图表接口只读这张表；写入价格点时在同一个事务里更新"""
+    __tablename__ = 'recipe_price_rollups'
+    recipe_address = Column(String, primary_key=True)
+    granularity = Column(String, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    price_min = Column(Float, nullable=False)
+    price_max = Column(Float, nullable=False)
+    price_sum = Column(Float, nullable=False)            # 平均价 = price_sum / points
+    points = Column(Integer, nullable=False)             # 价格观测数（标价、改价、成交都算）
+    price_last = Column(Float, nullable=False)           # 区间内最后一个价格，画折线用
+    last_at = Column(DateTime, nullable=False)
+    sales = Column(Integer, nullable=False, default=0)   # 成交量
+    sales_value = Column(Float, nullable=False, default=0.0)
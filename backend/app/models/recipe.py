@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float
+from sqlalchemy import BigInteger, Column, Integer, String, Float
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -16,3 +16,6 @@ class Recipe(Base):
     user_address = Column(String[999], nullable=True)  # JSON-encoded list of strings
     price = Column(Float, nullable=True)
     status = Column(String, nullable=True)  # 上架/未上架/已售等 
+    # 元数据来源：RecipeNFT 的 tokenId 和写入时用的 metadata CID，对账任务据此发现链上 updateTokenURI
+    token_id = Column(BigInteger, nullable=True, index=True)
+    metadata_cid = Column(String, nullable=True)
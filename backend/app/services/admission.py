@@ -0,0 +1,205 @@
+"""准入控制：按调用方限流 + 过载时丢弃低优先级请求
+
+限流：每个客户端 IP 按请求类别各有一个令牌桶；带了 X-Wallet-Address 的请求还要再过
+一个按钱包地址的桶（钱包地址没有鉴权，只能在 IP 之外多加一层限制，不能代替 IP，否则
+换一个请求头就是一组新的桶）。请求类别：
+- read:  GET / HEAD
+- write: 其它方法
+- ai:    /api/ai 下的 POST（chat、agent、sessions）
+令牌不够时返回 429 和 Retry-After。/ipfs 不在中间件里限流（一页几十张图），但缓存未命中
+要回源时由 IpfsCache 按客户端 IP 扣 ipfs_miss 类别的桶，随便编 CID 占不满回源名额。
+
+客户端 IP 默认是 TCP 对端地址；TRUST_FORWARDED_FOR 打开时取 X-Forwarded-For 从右数第
+FORWARDED_FOR_HOPS 个（可信代理追加的那一个，左边的部分客户端可以随便写）。
+令牌桶在每个 worker 的内存里，多 worker 部署时一个调用方实际能用到的额度是配置值乘以
+worker 数（请求被分到哪个 worker 由内核决定）。
+
+负载保护：事件循环延迟或取数据库连接的等待时间（metrics 里的最近峰值）超过阈值时，
+先丢弃 ai 请求，压力到阈值的两倍时再丢弃 read 请求，返回 503 和 Retry-After；
+写请求（交易、上架）不丢弃。健康检查、/metrics、管理接口、/ipfs 图片和 CORS 预检不受影响。
+"""
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+
+from app.config import (
+    FORWARDED_FOR_HOPS,
+    RATE_LIMIT_AI,
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_IPFS_MISS,
+    RATE_LIMIT_MAX_CLIENTS,
+    RATE_LIMIT_READ,
+    RATE_LIMIT_WRITE,
+    SHED_LOOP_LAG,
+    SHED_POOL_WAIT,
+    TRUST_FORWARDED_FOR,
+)
+from app.services.metrics import Counter, loop_lag_recent, pool_wait_recent, registry
+
+READ = "read"
+WRITE = "write"
+AI = "ai"
+IPFS_MISS = "ipfs_miss"  # 不按请求分类，由 IpfsCache 在回源前扣
+
+# 过载时的丢弃顺序：压力达到 SHED_LEVELS[类别] 倍阈值时丢弃该类别
+SHED_LEVELS = {AI: 1.0, READ: 2.0}
+
+EXEMPT_PATHS = {"/", "/health/live", "/health/ready", "/metrics", "/docs", "/redoc", "/openapi.json"}
+# /ipfs 是页面上的图片，一页几十张；命中缓存只是发文件，回源按 IPFS_MISS 单独限流
+EXEMPT_PREFIXES = ("/api/admin", "/ipfs/")
+
+admission_rejected = registry.register(Counter(
+    "admission_rejected_total", "Requests rejected by rate limiting or load shedding", ("reason", "class"),
+))
+
+
+def _parse_rate(spec: str) -> Tuple[float, float]:
+    """"20/40" -> (每秒 20 个令牌, 桶容量 40)"""
+    rate, _, burst = spec.partition("/")
+    return float(rate), float(burst or rate)
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated_at = now
+
+    def take(self, rate: float, capacity: float, now: float) -> float:
+        """取一个令牌；成功返回 0，否则返回还要等多少秒"""
+        self.tokens = min(capacity, self.tokens + (now - self.updated_at) * rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+
+class RateLimiter:
+    def __init__(self, limits: Dict[str, Tuple[float, float]], max_clients: int):
+        self.limits = limits
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+
+    def check(self, client: str, request_class: str) -> float:
+        """返回 0 表示放行，否则是建议的等待秒数"""
+        rate, capacity = self.limits[request_class]
+        now = time.monotonic()
+        key = (client, request_class)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(capacity, now)
+            # 超出上限时丢掉最久没来过的调用方（它们的桶早就满了，丢掉等于重置）
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.take(rate, capacity, now)
+
+    def stats(self) -> Dict:
+        return {"clients": len(self._buckets), "max_clients": self.max_clients}
+
+
+rate_limiter = RateLimiter(
+    {
+        READ: _parse_rate(RATE_LIMIT_READ),
+        WRITE: _parse_rate(RATE_LIMIT_WRITE),
+        AI: _parse_rate(RATE_LIMIT_AI),
+        IPFS_MISS: _parse_rate(RATE_LIMIT_IPFS_MISS),
+    },
+    RATE_LIMIT_MAX_CLIENTS,
+)
+
+
+def load_pressure() -> float:
+    """当前压力，1.0 表示达到阈值"""
+    return max(loop_lag_recent.value() / SHED_LOOP_LAG, pool_wait_recent.value() / SHED_POOL_WAIT)
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    """请求类别；None 表示不做准入控制"""
+    if method == "OPTIONS" or path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES):
+        return None
+    if method in ("GET", "HEAD"):
+        return READ
+    if path.startswith("/api/ai") and method == "POST":
+        return AI
+    return WRITE
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def client_ip(scope) -> str:
+    if TRUST_FORWARDED_FOR:
+        forwarded = _header(scope, b"x-forwarded-for")
+        if forwarded:
+            hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+            if hops:
+                return hops[max(len(hops) - FORWARDED_FOR_HOPS, 0)]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def client_keys(scope) -> List[str]:
+    """要扣令牌的桶：总是有客户端 IP，带了钱包地址时再加一个"""
+    keys = ["ip:" + client_ip(scope)]
+    wallet = _header(scope, b"x-wallet-address")
+    if wallet and wallet.strip():
+        keys.append("wallet:" + wallet.strip().lower())
+    return keys
+
+
+async def _reject(send, status: int, detail: str, retry_after: float) -> None:
+    body = orjson.dumps({"detail": detail})
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """纯 ASGI 中间件，先做负载保护再做限流（过载时不消耗调用方的令牌）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not RATE_LIMIT_ENABLED or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_class = classify(scope["method"], scope["path"])
+        if request_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        shed_level = SHED_LEVELS.get(request_class)
+        if shed_level is not None and load_pressure() >= shed_level:
+            admission_rejected.inc("overload", request_class)
+            await _reject(send, 503, "Server is under heavy load, please retry shortly", 2)
+            return
+
+        # 先扣 IP 的桶：换钱包地址刷请求会先被 IP 的额度挡住
+        for key in client_keys(scope):
+            wait = rate_limiter.check(key, request_class)
+            if wait > 0:
+                admission_rejected.inc("rate_limit", request_class)
+                await _reject(send, 429, f"Too many {request_class} requests, please slow down", wait)
+                return
+
+        await self.app(scope, receive, send)
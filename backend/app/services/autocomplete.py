@@ -0,0 +1,351 @@
+"""搜索框的输入联想（cocktail_name 和 bar_name）
+
+名字规范化（小写、去掉重音符号）后，名字本身和名字里每个词开头的后缀都作为
+一个词条，放进按字典序排好的数组；前缀查询就是两次 bisect 得到一个区间。
+区间里按热度（成交次数）取前几个，热度相同时完整名字开头匹配的排前面。
+
+- 区间很大（一两个字母的前缀）时不逐条扫描：启动时自底向上为这些前缀算好
+  前 TOP_K 个，写入时只更新包含新条目的那几个列表
+- 前缀匹配结果不够时做一次编辑距离为 1 的纠错：在第一个匹配不上的位置删除、
+  换位、替换或插入一个字符（替换和插入只用索引里实际出现的字符），纠错结果排在
+  精确匹配后面
+- 写接口提交后调用 add_recipe / add_bar / record_sale 增量更新，启动时全量构建
+"""
+import heapq
+import math
+import unicodedata
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from app.models.bar import Bar
+from app.models.recipe import Recipe
+from app.models.transaction import Transaction
+
+RECIPE = "recipe"
+BAR = "bar"
+
+SCAN_LIMIT = 256          # 区间超过这么多词条的前缀预先算好前 TOP_K 个
+TOP_K = 20                # 每次最多返回的条数
+WHOLE_NAME_BONUS = 0.25   # 从名字开头匹配的加分
+TYPO_MIN_LENGTH = 3       # 太短的前缀不纠错，候选太多也没意义
+TYPO_PENALTY = 0.5
+_MAX_TERM_LENGTH = 64
+_MAX_CHAR = "\U0010ffff"
+
+
+def normalize(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.lower().split())
+
+
+def _terms(name: str) -> List[Tuple[str, bool]]:
+    """(词条, 是否是完整名字)：完整名字和从每个词开始的后缀"""
+    normalized = normalize(name)
+    if not normalized:
+        return []
+    terms = [(normalized[:_MAX_TERM_LENGTH], True)]
+    for i, ch in enumerate(normalized):
+        if ch == " " and i + 1 < len(normalized):
+            terms.append((normalized[i + 1:i + 1 + _MAX_TERM_LENGTH], False))
+    return terms
+
+
+def _rank_key(pair: Tuple[float, "Suggestion"]):
+    return pair[0], pair[1].text
+
+
+def _top_by_kind(pairs: Iterable[Tuple[float, "Suggestion"]]) -> Dict[str, List[Tuple[float, "Suggestion"]]]:
+    grouped: Dict[str, List[Tuple[float, Suggestion]]] = {}
+    for pair in pairs:
+        grouped.setdefault(pair[1].kind, []).append(pair)
+    return {kind: heapq.nlargest(TOP_K, ranked, key=_rank_key) for kind, ranked in grouped.items()}
+
+
+class Suggestion:
+    __slots__ = ("kind", "key", "text", "weight", "owner")
+
+    def __init__(self, kind: str, key: str, text: str, weight: int, owner: Optional[str] = None):
+        self.kind = kind
+        self.key = key          # recipe_address / bar_address
+        self.text = text
+        self.weight = weight    # 成交次数
+        self.owner = owner      # recipe 的创建者，卖出时顺带给酒吧加热度
+
+    def to_dict(self, typo: bool = False) -> Dict:
+        return {"kind": self.kind, "text": self.text, "address": self.key, "popularity": self.weight, "typo": typo}
+
+
+class AutocompleteIndex:
+    def __init__(self):
+        # 两个平行数组按 (词条, 序号) 排序：_terms 只放词条，方便 bisect
+        self._terms: List[str] = []
+        self._rows: List[Tuple[str, int, bool, Suggestion]] = []
+        self._entries: Dict[Tuple[str, str], Suggestion] = {}
+        # 词条数超过 SCAN_LIMIT 的前缀 -> {kind: [(分数, Suggestion), ...]}，只保留前 TOP_K 个
+        self._top: Dict[str, Dict[str, List[Tuple[float, Suggestion]]]] = {}
+        self._serial = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ---- 写入 ----
+    def _insert(self, entry: Suggestion) -> None:
+        self._serial += 1
+        for term, whole in _terms(entry.text):
+            position = bisect_left(self._rows, (term, self._serial))
+            self._rows.insert(position, (term, self._serial, whole, entry))
+            self._terms.insert(position, term)
+        self._entries[(entry.kind, entry.key)] = entry
+        self._promote(entry)
+
+    def _delete(self, entry: Suggestion) -> None:
+        for term, _ in _terms(entry.text):
+            position = bisect_left(self._terms, term)
+            while position < len(self._terms) and self._terms[position] == term:
+                if self._rows[position][3] is entry:
+                    del self._rows[position]
+                    del self._terms[position]
+                    break
+                position += 1
+        self._entries.pop((entry.kind, entry.key), None)
+        # 删掉的条目可能在预先算好的列表里，这些前缀下次查询时重新计算
+        for prefix in self._prefix_scores(entry):
+            top = self._top.get(prefix)
+            if top is not None and any(e is entry for _, e in top.get(entry.kind, ())):
+                del self._top[prefix]
+
+    def _prefix_scores(self, entry: Suggestion) -> Dict[str, float]:
+        """这个条目的所有词条的所有前缀，以及在该前缀下的分数"""
+        scores: Dict[str, float] = {}
+        weight = math.log1p(entry.weight)
+        for term, whole in _terms(entry.text):
+            score = weight + (WHOLE_NAME_BONUS if whole else 0.0)
+            for length in range(1, len(term) + 1):
+                prefix = term[:length]
+                if scores.get(prefix, -1.0) < score:
+                    scores[prefix] = score
+        return scores
+
+    def _promote(self, entry: Suggestion) -> None:
+        """新增条目或热度上升后，更新包含它的预先算好的列表（分数只会上升，截断是安全的）"""
+        for prefix, score in self._prefix_scores(entry).items():
+            top = self._top.get(prefix)
+            if top is None:
+                continue
+            ranked = [pair for pair in top.get(entry.kind, ()) if pair[1] is not entry]
+            ranked.append((score, entry))
+            ranked.sort(key=_rank_key, reverse=True)
+            top[entry.kind] = ranked[:TOP_K]
+
+    def _upsert(self, kind: str, key: str, text: str, owner: Optional[str] = None) -> None:
+        existing = self._entries.get((kind, key))
+        weight = existing.weight if existing else 0
+        if existing is not None:
+            if existing.text == text and existing.owner == owner:
+                return
+            self._delete(existing)
+        if text:
+            self._insert(Suggestion(kind, key, text, weight, owner))
+
+    def add_recipe(self, recipe_address: str, cocktail_name: str, owner_address: Optional[str]) -> None:
+        self._upsert(RECIPE, recipe_address, cocktail_name, owner_address)
+
+    def add_bar(self, bar_address: str, bar_name: str) -> None:
+        self._upsert(BAR, bar_address, bar_name)
+
+    def record_sale(self, recipe_address: str) -> None:
+        """成交一次：recipe 和它的创建者酒吧的热度各加 1"""
+        recipe = self._entries.get((RECIPE, recipe_address))
+        if recipe is None:
+            return
+        recipe.weight += 1
+        self._promote(recipe)
+        bar = self._entries.get((BAR, recipe.owner)) if recipe.owner else None
+        if bar is not None:
+            bar.weight += 1
+            self._promote(bar)
+
+    # ---- 查询 ----
+    def _range(self, prefix: str, lo: int = 0, hi: Optional[int] = None) -> Tuple[int, int]:
+        hi = len(self._terms) if hi is None else hi
+        start = bisect_left(self._terms, prefix, lo, hi)
+        end = bisect_left(self._terms, prefix + _MAX_CHAR, start, hi)
+        return start, end
+
+    def _scan(self, start: int, end: int) -> Dict[str, List[Tuple[float, Suggestion]]]:
+        """逐条扫描一个区间，每个 Suggestion 只保留最高分，按 kind 分别取前 TOP_K 个"""
+        best: Dict[int, Tuple[float, Suggestion]] = {}
+        for i in range(start, end):
+            _, _, whole, entry = self._rows[i]
+            score = math.log1p(entry.weight) + (WHOLE_NAME_BONUS if whole else 0.0)
+            previous = best.get(id(entry))
+            if previous is None or score > previous[0]:
+                best[id(entry)] = (score, entry)
+        return _top_by_kind(best.values())
+
+    def _build_top(self, prefix: str, start: int, end: int) -> Dict[str, List[Tuple[float, Suggestion]]]:
+        """自底向上算出区间内所有大前缀的列表：子前缀的列表合并，不重复扫描"""
+        if end - start <= SCAN_LIMIT:
+            return self._scan(start, end)
+        length = len(prefix)
+        position = start
+        while position < end and len(self._terms[position]) == length:
+            position += 1
+        parts = [self._scan(start, position)] if position > start else []
+        while position < end:
+            child = prefix + self._terms[position][length]
+            _, child_end = self._range(child, position, end)
+            parts.append(self._build_top(child, position, child_end))
+            position = child_end
+
+        best: Dict[int, Tuple[float, Suggestion]] = {}
+        for part in parts:
+            for ranked in part.values():
+                for score, entry in ranked:
+                    if id(entry) not in best or score > best[id(entry)][0]:
+                        best[id(entry)] = (score, entry)
+        top = _top_by_kind(best.values())
+        if prefix:
+            self._top[prefix] = top
+        return top
+
+    def _matches(self, prefix: str, limit: int, kinds: frozenset) -> List[Tuple[float, Suggestion]]:
+        """前缀命中的 (分数, Suggestion)，分数从高到低"""
+        start, end = self._range(prefix)
+        if start == end:
+            return []
+        if end - start > SCAN_LIMIT:
+            top = self._top.get(prefix)
+            if top is None:  # 刚变成大前缀，或者有条目被删掉了
+                top = self._top[prefix] = self._scan(start, end)
+        else:
+            top = self._scan(start, end)
+        candidates = [pair for kind in kinds for pair in top.get(kind, ())]
+        return heapq.nlargest(limit, candidates, key=_rank_key)
+
+    def _next_chars(self, head: str) -> List[str]:
+        """索引里紧跟在 head 后面出现过的字符"""
+        start, end = self._range(head)
+        length = len(head)
+        while start < end and len(self._terms[start]) == length:
+            start += 1
+        chars = []
+        while start < end:
+            ch = self._terms[start][length]
+            chars.append(ch)
+            _, start = self._range(head + ch, start, end)
+        return chars
+
+    def _typo_variants(self, prefix: str) -> List[str]:
+        """编辑距离为 1 的候选：只在第一个匹配不上的位置附近改（前面的部分已经命中了）"""
+        lo, hi = 0, len(prefix)
+        while lo < hi:  # 找最长的有命中的前缀长度
+            mid = (lo + hi + 1) // 2
+            start, end = self._range(prefix[:mid])
+            if start < end:
+                lo = mid
+            else:
+                hi = mid - 1
+        if lo == len(prefix):
+            return []
+
+        head, ch, tail = prefix[:lo], prefix[lo], prefix[lo + 1:]
+        variants = [head + tail]                                        # 删除
+        if tail:
+            variants.append(head + tail[0] + ch + tail[1:])             # 和后一个字符换位
+        if head:
+            variants.append(head[:-1] + ch + head[-1] + tail)           # 和前一个字符换位
+        for next_ch in self._next_chars(head):
+            if next_ch != ch:
+                variants.append(head + next_ch + tail)                  # 替换
+            variants.append(head + next_ch + ch + tail)                 # 插入
+        return list(dict.fromkeys(v for v in variants if v and v != prefix))
+
+    def suggest(self, query: str, limit: int = 8, kinds: Iterable[str] = (RECIPE, BAR)) -> List[Dict]:
+        prefix = normalize(query)[:_MAX_TERM_LENGTH]
+        limit = min(limit, TOP_K)
+        if not prefix or limit <= 0:
+            return []
+        kinds = frozenset(kinds)
+        exact = self._matches(prefix, limit, kinds)
+        results = [entry.to_dict() for _, entry in exact]
+        if len(results) >= limit or len(prefix) < TYPO_MIN_LENGTH:
+            return results
+
+        found = {id(entry) for _, entry in exact}
+        typos: Dict[int, Tuple[float, Suggestion]] = {}
+        for variant in self._typo_variants(prefix):
+            for score, entry in self._matches(variant, limit, kinds):
+                if id(entry) in found:
+                    continue
+                score -= TYPO_PENALTY
+                if id(entry) not in typos or score > typos[id(entry)][0]:
+                    typos[id(entry)] = (score, entry)
+        ranked = heapq.nlargest(limit - len(results), typos.values(), key=_rank_key)
+        return results + [entry.to_dict(typo=True) for _, entry in ranked]
+
+    def stats(self) -> Dict:
+        return {"entries": len(self._entries), "terms": len(self._terms), "precomputed_prefixes": len(self._top)}
+
+    # ---- 同步 ----
+    async def refresh(self, db, recipe_ids: Iterable[int] = (), bar_addresses: Iterable[str] = ()) -> None:
+        """重新读取指定的 recipes / bars（其它 worker 写入后调用）"""
+        recipe_ids = set(recipe_ids)
+        if recipe_ids:
+            result = await db.execute(
+                select(Recipe.recipe_address, Recipe.cocktail_name, Recipe.owner_address)
+                .where(Recipe.id.in_(recipe_ids))
+            )
+            for recipe_address, name, owner in result:
+                self.add_recipe(recipe_address, name, owner)
+
+        bar_addresses = set(bar_addresses)
+        if bar_addresses:
+            result = await db.execute(
+                select(Bar.bar_address, Bar.bar_name).where(Bar.bar_address.in_(bar_addresses))
+            )
+            for bar_address, name in result:
+                self.add_bar(bar_address, name)
+
+    async def rebuild(self, db) -> None:
+        """启动时全量构建：先收集再一次排序，比逐条插入快"""
+        sales = (
+            select(Transaction.recipe_address, func.count().label("sales"))
+            .group_by(Transaction.recipe_address).subquery()
+        )
+        sold = (
+            select(Transaction.seller, func.count().label("sold"))
+            .group_by(Transaction.seller).subquery()
+        )
+        recipes = await db.execute(
+            select(Recipe.recipe_address, Recipe.cocktail_name, Recipe.owner_address, func.coalesce(sales.c.sales, 0))
+            .outerjoin(sales, sales.c.recipe_address == Recipe.recipe_address)
+        )
+        bars = await db.execute(
+            select(Bar.bar_address, Bar.bar_name, func.coalesce(sold.c.sold, 0))
+            .outerjoin(sold, sold.c.seller == Bar.bar_address)
+        )
+
+        fresh = AutocompleteIndex()
+        entries = [Suggestion(RECIPE, address, name, weight, owner) for address, name, owner, weight in recipes]
+        entries += [Suggestion(BAR, address, name, weight) for address, name, weight in bars]
+        rows = []
+        for entry in entries:
+            if not entry.text:
+                continue
+            fresh._entries[(entry.kind, entry.key)] = entry
+            for term, whole in _terms(entry.text):
+                fresh._serial += 1
+                rows.append((term, fresh._serial, whole, entry))
+        rows.sort(key=lambda row: (row[0], row[1]))
+        fresh._rows = rows
+        fresh._terms = [row[0] for row in rows]
+        fresh._serial += 1
+        fresh._build_top("", 0, len(rows))
+        self.__dict__.update(fresh.__dict__)
+
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,114 @@
+"""服务端聊天会话
+
+客户端只需要带 session_id 和新消息，历史保存在服务端有界的 LRU 存储里，
+闲置超过 TTL 的会话会过期。发给 Kimi 的历史按 token 预算从最新往前截取，
+所以每一轮的请求大小不会随对话变长而增长。
+"""
+import asyncio
+import re
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.config import KIMI_HISTORY_TOKEN_BUDGET, KIMI_SESSION_MAX, KIMI_SESSION_TTL
+
+# 中日韩字符大约一个字一个 token，其它文本大约 4 个字符一个 token
+_CJK = re.compile("[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+_MESSAGE_OVERHEAD = 4  # 每条消息的角色、分隔符等固定开销
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计 token 数，不依赖具体 tokenizer"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message: Dict) -> int:
+    return estimate_tokens(message["content"]) + _MESSAGE_OVERHEAD
+
+
+def trim_to_budget(messages: List[Dict], budget: int) -> List[Dict]:
+    """保留能放进预算的最新若干条消息（至少保留最后一条）"""
+    kept = []
+    used = 0
+    for message in reversed(messages):
+        cost = message_tokens(message)
+        if kept and used + cost > budget:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    return kept
+
+
+class ChatSession:
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.history: List[Dict] = []
+        self.turns = 0
+        self.created_at = time.time()
+        self.touched_at = time.monotonic()
+        # 同一会话的多轮请求按顺序执行，避免并发写乱历史
+        self.lock = asyncio.Lock()
+
+    def prompt_history(self, new_message: Dict, budget: int) -> List[Dict]:
+        """本轮要发给上游的历史（含新消息），按预算截取"""
+        return trim_to_budget(self.history + [new_message], budget)
+
+    def append_turn(self, user_message: Dict, assistant_message: Dict, budget: int) -> None:
+        # 超出预算的旧消息以后也不会再发送，直接丢掉，会话占用的内存保持有界
+        self.history = trim_to_budget(self.history + [user_message, assistant_message], budget)
+        self.turns += 1
+
+
+class ChatSessionStore:
+    def __init__(self, max_sessions: int, ttl: float, token_budget: int):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.token_budget = token_budget
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self.expired = 0
+        self.evicted = 0
+
+    def _purge_expired(self) -> None:
+        deadline = time.monotonic() - self.ttl
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.touched_at >= deadline:
+                break
+            self._sessions.popitem(last=False)
+            self.expired += 1
+
+    def create(self) -> ChatSession:
+        self._purge_expired()
+        session = ChatSession(uuid.uuid4().hex)
+        self._sessions[session.id] = session
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        self._purge_expired()
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.touched_at = time.monotonic()
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def stats(self) -> Dict:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl,
+            "token_budget": self.token_budget,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+session_store = ChatSessionStore(KIMI_SESSION_MAX, KIMI_SESSION_TTL, KIMI_HISTORY_TOKEN_BUDGET)
@@ -0,0 +1,111 @@
+"""熔断器
+
+在最近 window 次调用中，失败或慢调用（超过 slow_call_seconds）的比例
+达到 failure_rate 时熔断（OPEN），之后 open_seconds 内的调用直接拒绝。
+冷却结束后进入 HALF_OPEN，只放行一次试探调用：成功则恢复（CLOSED），
+失败则重新熔断。
+"""
+import time
+from collections import deque
+from typing import Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """熔断中，调用被直接拒绝"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit is open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 20.0,
+        open_seconds: float = 30.0,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)  # True 表示失败或慢调用
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.trips = 0
+        self.rejected = 0
+
+    def _retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def before_call(self) -> None:
+        """调用上游之前检查，熔断中抛出 CircuitOpenError"""
+        if self.state == OPEN:
+            if self._retry_after() > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self._retry_after())
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self._trial_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.open_seconds)
+            self._trial_in_flight = True
+
+    def record(self, ok: bool, latency: Optional[float] = None) -> None:
+        """记录一次调用结果"""
+        bad = not ok or (latency is not None and latency > self.slow_call_seconds)
+        if self.state == HALF_OPEN:
+            self._trial_in_flight = False
+            if bad:
+                self._trip()
+            else:
+                self.state = CLOSED
+                self._outcomes.clear()
+            return
+        if self.state == OPEN:
+            return
+
+        self._outcomes.append(bad)
+        if len(self._outcomes) >= self.min_calls:
+            if sum(self._outcomes) / len(self._outcomes) >= self.failure_rate:
+                self._trip()
+
+    def record_probe(self, ok: bool, latency: Optional[float] = None) -> None:
+        """后台探测的结果：熔断中探测成功则提前进入半开，让下一次真实请求试探"""
+        if self.state == OPEN:
+            if ok:
+                self.state = HALF_OPEN
+                self._trial_in_flight = False
+            return
+        if self.state == CLOSED:
+            self.record(ok, latency)
+
+    def release_trial(self) -> None:
+        """试探调用没有产生结果（例如被取消）时归还试探名额"""
+        self._trial_in_flight = False
+
+    def _trip(self) -> None:
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+        self._outcomes.clear()
+        self.trips += 1
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": sum(self._outcomes),
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "retry_after_seconds": round(self._retry_after(), 1) if self.state == OPEN else 0,
+        }
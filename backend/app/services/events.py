@@ -0,0 +1,293 @@
+"""市场事件推送
+
+写接口在自己的事务里调用 publish_event()：插入一行 market_events（自增 id 就是
+事件序号），并 pg_notify 到 market_events 频道，事务提交后才会发出。每个 worker
+的 EventHub 通过 invalidation_bus 的 LISTEN 连接收到事件，放进最近事件的环形缓冲，
+再分发给本 worker 上匹配过滤条件的订阅者。
+
+- 每个事件只编码一次，所有订阅者共享同一份 bytes
+- 每个订阅者一个有界队列；队列满（客户端读得太慢）时清空队列并发一个 overflow
+  事件后断开，客户端带 Last-Event-ID 重连即可续传
+- 续传时先从内存缓冲补发，缓冲里没有的再分页查 market_events 表（类型过滤在 SQL 里，
+  地址过滤在 payload JSON 里只能边读边筛）；错过的匹配事件超过 EVENT_REPLAY_LIMIT
+  个、或者有一部分已经被清理时不补发，改发一个 reset 事件，客户端重新拉取一遍状态
+- 空闲的订阅者只是一个挂起的 queue.get()，几乎不占资源
+
+序号在插入时分配、按提交顺序送达，并发写入时可能有极短的乱序窗口。
+"""
+import asyncio
+from collections import deque
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Set
+
+import orjson
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import (
+    EVENT_BUFFER_SIZE,
+    EVENT_KEEPALIVE_SECONDS,
+    EVENT_REPLAY_LIMIT,
+    EVENT_RETENTION_HOURS,
+    EVENT_SUBSCRIBER_BUFFER,
+)
+from app.models.market_event import MarketEvent
+from app.services.metrics import Counter, Gauge, registry
+
+CHANNEL = "market_events"
+RECIPE_LISTED = "recipe_listed"
+RECIPE_SOLD = "recipe_sold"
+BAR_UPDATED = "bar_updated"
+PRUNE_INTERVAL = 600
+REPLAY_SCAN_PAGES = 20  # 续传时最多读几页（每页 EVENT_REPLAY_LIMIT 行），过滤条件很窄时也不会扫完整张表
+
+events_subscribers = registry.register(Gauge(
+    "events_subscribers", "Open market event stream subscribers",
+))
+events_dropped_subscribers = registry.register(Counter(
+    "events_slow_consumer_disconnects_total", "Subscribers disconnected because their buffer filled up",
+))
+
+
+async def publish_event(
+    db: AsyncSession,
+    event_type: str,
+    data: Dict,
+    bar_addresses: Iterable[str] = (),
+    recipe_address: Optional[str] = None,
+) -> None:
+    """在写事务里调用（commit 之前）：记录事件并通知所有 worker"""
+    payload = {
+        "data": data,
+        "bar_addresses": [a.lower() for a in bar_addresses if a],
+        "recipe_address": recipe_address.lower() if recipe_address else None,
+    }
+    event = MarketEvent(type=event_type, payload=orjson.dumps(payload).decode())
+    db.add(event)
+    await db.flush()
+    notification = orjson.dumps({"id": event.id, "type": event_type, **payload}).decode()
+    await db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": notification})
+
+
+class Event:
+    __slots__ = ("id", "type", "bar_addresses", "recipe_address", "encoded")
+
+    def __init__(self, event_id: int, event_type: str, data: Dict, bar_addresses: List[str],
+                 recipe_address: Optional[str]):
+        self.id = event_id
+        self.type = event_type
+        self.bar_addresses = bar_addresses
+        self.recipe_address = recipe_address
+        body = orjson.dumps({"id": event_id, "type": event_type, **data}).decode()
+        self.encoded = f"id: {event_id}\nevent: {event_type}\ndata: {body}\n\n".encode()
+
+
+class Subscriber:
+    def __init__(self, bar_addresses: Set[str], recipe_addresses: Set[str], types: Set[str]):
+        self.bar_addresses = bar_addresses
+        self.recipe_addresses = recipe_addresses
+        self.types = types
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=EVENT_SUBSCRIBER_BUFFER)
+        self.overflowed = False
+
+    def matches(self, event: Event) -> bool:
+        if self.types and event.type not in self.types:
+            return False
+        if not self.bar_addresses and not self.recipe_addresses:
+            return True
+        if event.recipe_address and event.recipe_address in self.recipe_addresses:
+            return True
+        return any(address in self.bar_addresses for address in event.bar_addresses)
+
+    def offer(self, event: Event) -> bool:
+        """放入队列；满了返回 False"""
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+
+OVERFLOW = object()  # 放进队列的断开信号
+
+
+class EventHub:
+    def __init__(self, buffer_size: int):
+        self._recent: deque = deque(maxlen=buffer_size)
+        self._recent_ids: Set[int] = set()
+        self._subscribers: Set[Subscriber] = set()
+        self._prune_task: Optional[asyncio.Task] = None
+        self._pending = set()
+        self.delivered = 0
+
+    # ---- 接收 ----
+    def on_notification(self, payload: str) -> None:
+        message = orjson.loads(payload)
+        self._dispatch(Event(
+            message["id"], message["type"], message["data"],
+            message.get("bar_addresses") or [], message.get("recipe_address"),
+        ))
+
+    def _dispatch(self, event: Event) -> None:
+        # 重连补发和实时通知可能送来同一个事件
+        if event.id in self._recent_ids:
+            return
+        if len(self._recent) == self._recent.maxlen:
+            self._recent_ids.discard(self._recent[0].id)
+        self._recent.append(event)
+        self._recent_ids.add(event.id)
+        for subscriber in list(self._subscribers):
+            if subscriber.overflowed or not subscriber.matches(event):
+                continue
+            if subscriber.offer(event):
+                self.delivered += 1
+            else:
+                self._drop(subscriber)
+
+    def _drop(self, subscriber: Subscriber) -> None:
+        """慢消费者：丢掉积压，只留一个断开信号"""
+        subscriber.overflowed = True
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(OVERFLOW)
+        events_dropped_subscribers.inc()
+
+    def on_reconnect(self) -> None:
+        """LISTEN 连接重连后，从数据库补上断开期间的事件"""
+        task = asyncio.create_task(self._catch_up())
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _catch_up(self) -> None:
+        # 只补内存里最后一个事件之后的；还没收到过事件时没有可比较的起点
+        last_id = self._recent[-1].id if self._recent else None
+        if last_id is None:
+            return
+        from app.db.session import AsyncSessionLocal
+        try:
+            async with AsyncSessionLocal() as db:
+                events = await self._load_after(db, last_id)
+            for event in events:
+                self._dispatch(event)
+        except Exception as e:
+            print(f"⚠️  Warning: failed to catch up market events: {str(e)}")
+
+    # ---- 订阅 ----
+    def subscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.add(subscriber)
+        events_subscribers.set(len(self._subscribers))
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+        events_subscribers.set(len(self._subscribers))
+
+    async def replay(self, subscriber: Subscriber, last_id: int) -> Optional[List[Event]]:
+        """last_id 之后订阅者错过的事件；补不全（超过 EVENT_REPLAY_LIMIT 个，或者有一部分
+        已经被清理）时返回 None"""
+        if self._recent and self._recent[0].id <= last_id + 1:
+            events = [e for e in self._recent if e.id > last_id and subscriber.matches(e)]
+            return events if len(events) <= EVENT_REPLAY_LIMIT else None
+
+        from app.db.session import AsyncSessionLocal
+        async with AsyncSessionLocal() as db:
+            # 序号因回滚跳号时也会被当成清理过，只是让客户端多刷新一次
+            oldest = await db.scalar(select(func.min(MarketEvent.id)))
+            if oldest is not None and oldest > last_id + 1:
+                return None
+            events = []
+            for _ in range(REPLAY_SCAN_PAGES):
+                page = await self._load_after(db, last_id, subscriber.types)
+                events.extend(e for e in page if subscriber.matches(e))
+                if len(events) > EVENT_REPLAY_LIMIT:
+                    return None
+                if len(page) < EVENT_REPLAY_LIMIT:
+                    return events
+                last_id = page[-1].id
+        return None
+
+    async def _head_id(self) -> Optional[int]:
+        from app.db.session import AsyncSessionLocal
+        async with AsyncSessionLocal() as db:
+            return await db.scalar(select(func.max(MarketEvent.id)))
+
+    async def _load_after(self, db: AsyncSession, last_id: int, types: Iterable[str] = ()) -> List[Event]:
+        """last_id 之后的一页事件（最多 EVENT_REPLAY_LIMIT 个）"""
+        query = select(MarketEvent.id, MarketEvent.type, MarketEvent.payload).where(MarketEvent.id > last_id)
+        types = list(types)
+        if types:
+            query = query.where(MarketEvent.type.in_(types))
+        rows = (await db.execute(query.order_by(MarketEvent.id).limit(EVENT_REPLAY_LIMIT))).all()
+        events = []
+        for event_id, event_type, raw in rows:
+            payload = orjson.loads(raw)
+            events.append(Event(event_id, event_type, payload["data"],
+                                payload.get("bar_addresses") or [], payload.get("recipe_address")))
+        return events
+
+    async def _prune_forever(self) -> None:
+        """定期删掉超过 EVENT_RETENTION_HOURS 的事件（多 worker 各自执行也没关系）"""
+        from app.db.session import AsyncSessionLocal
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(delete(MarketEvent).where(
+                        MarketEvent.created_at < func.now() - timedelta(hours=EVENT_RETENTION_HOURS)
+                    ))
+                    await db.commit()
+            except Exception as e:
+                print(f"⚠️  Warning: failed to prune market events: {str(e)}")
+            await asyncio.sleep(PRUNE_INTERVAL)
+
+    def start(self) -> None:
+        """在 invalidation_bus.start() 之前调用：挂到同一条 LISTEN 连接上，并启动定期清理"""
+        from app.services.invalidation import invalidation_bus
+        if self._prune_task is not None and not self._prune_task.done():
+            return
+        invalidation_bus.add_channel(CHANNEL, self.on_notification, on_reconnect=self.on_reconnect)
+        self._prune_task = asyncio.create_task(self._prune_forever())
+
+    async def stream(self, subscriber: Subscriber, last_id: Optional[int]):
+        """SSE 响应体：先补发错过的事件，再推实时事件，空闲时发注释行保活"""
+        # 先订阅再补发，补发期间到达的事件不会漏（可能重复，客户端按 id 去重）
+        self.subscribe(subscriber)
+        try:
+            yield b"retry: 3000\n\n"
+            sent_up_to = last_id if last_id is not None else -1
+            if last_id is not None:
+                events = await self.replay(subscriber, last_id)
+                if events is None:
+                    # 补不全：让客户端重新拉取状态，从当前最新的事件之后接着推
+                    head = await self._head_id()
+                    sent_up_to = max(head or 0, last_id)
+                    body = orjson.dumps({"last_event_id": sent_up_to}).decode()
+                    yield f"id: {sent_up_to}\nevent: reset\ndata: {body}\n\n".encode()
+                    events = []
+                for event in events:
+                    yield event.encoded
+                    sent_up_to = event.id
+
+            while True:
+                try:
+                    item = await asyncio.wait_for(subscriber.queue.get(), timeout=EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if item is OVERFLOW:
+                    yield b"event: overflow\ndata: {}\n\n"
+                    return
+                if item.id <= sent_up_to:
+                    continue
+                yield item.encoded
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> Dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "buffered_events": len(self._recent),
+            "last_event_id": self._recent[-1].id if self._recent else None,
+            "delivered": self.delivered,
+        }
+
+
+event_hub = EventHub(EVENT_BUFFER_SIZE)
@@ -0,0 +1,226 @@
+"""批量导出（CSV / NDJSON）
+
+用服务端游标（yield_per）按主键顺序分批读取，边读边编码边发送，内存占用和
+表的大小无关。导出按 id 升序，所以断点续传只需要记住最后一行的 id：
+
+- NDJSON 每 EXPORT_CHECKPOINT_ROWS 行插入一行 {"_cursor": "..."}，结束时再发一行
+  带 "_complete": true 的，客户端用最后收到的 _cursor 作为 cursor 参数续传
+- CSV 没有地方放额外的行，用最后一行的 id 作为 after_id 参数续传
+
+游标令牌里带着过滤条件的摘要，换了过滤条件的令牌会被拒绝。
+"""
+import asyncio
+import base64
+import csv
+import hashlib
+import io
+import weakref
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+import orjson
+from sqlalchemy import or_, select
+
+from app.config import EXPORT_CHECKPOINT_ROWS, EXPORT_FETCH_SIZE, EXPORT_MAX_CONCURRENT
+from app.models.bar import Bar
+from app.models.recipe import Recipe
+from app.models.transaction import Transaction
+from app.services.metrics import Counter, registry
+
+CSV = "csv"
+NDJSON = "ndjson"
+
+export_rows = registry.register(Counter(
+    "export_rows_total", "Rows streamed by the bulk export endpoints", ("dataset", "format"),
+))
+
+# 同时进行的导出数：每个导出在整个下载期间占着一个数据库连接
+export_slots = asyncio.Semaphore(EXPORT_MAX_CONCURRENT)
+
+
+class ExportSlot:
+    """占着的一个导出名额；release 可以重复调用，只有第一次生效"""
+
+    def __init__(self):
+        self._held = True
+
+    def release(self) -> None:
+        if self._held:
+            self._held = False
+            export_slots.release()
+
+
+async def try_acquire_slot() -> Optional[ExportSlot]:
+    """不排队：名额满了返回 None。没满时 acquire 不会挂起，检查和占用之间没有切换，
+    不会有两个请求同时拿到最后一个名额"""
+    if export_slots.locked():
+        return None
+    await export_slots.acquire()
+    return ExportSlot()
+
+
+@dataclass(frozen=True)
+class ExportFilters:
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    address: Optional[str] = None
+    recipe_address: Optional[str] = None
+
+    def digest(self) -> str:
+        raw = "|".join("" if v is None else str(v) for v in (self.since, self.until, self.address, self.recipe_address))
+        return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+
+@dataclass(frozen=True)
+class Dataset:
+    model: Any
+    columns: Tuple[Any, ...]
+    # 把过滤条件加到查询上；数据集不支持的过滤条件由 api 层先拒绝
+    apply_filters: Callable[[Any, ExportFilters], Any]
+    supports: frozenset
+
+
+def _transaction_filters(query, filters: ExportFilters):
+    if filters.since is not None:
+        query = query.where(Transaction.timestamp >= filters.since)
+    if filters.until is not None:
+        query = query.where(Transaction.timestamp < filters.until)
+    if filters.address:
+        query = query.where(or_(Transaction.buyer == filters.address, Transaction.seller == filters.address))
+    if filters.recipe_address:
+        query = query.where(Transaction.recipe_address == filters.recipe_address)
+    return query
+
+
+def _recipe_filters(query, filters: ExportFilters):
+    if filters.address:
+        query = query.where(Recipe.owner_address == filters.address)
+    if filters.recipe_address:
+        query = query.where(Recipe.recipe_address == filters.recipe_address)
+    return query
+
+
+def _bar_filters(query, filters: ExportFilters):
+    if filters.address:
+        query = query.where(Bar.bar_address == filters.address)
+    return query
+
+
+DATASETS: Dict[str, Dataset] = {
+    "transactions": Dataset(
+        Transaction,
+        (Transaction.id, Transaction.buyer, Transaction.seller, Transaction.recipe_address, Transaction.timestamp),
+        _transaction_filters,
+        frozenset({"since", "until", "address", "recipe_address"}),
+    ),
+    # cocktail_recipe / recipe_photo 是私有字段，不导出
+    "recipes": Dataset(
+        Recipe,
+        (Recipe.id, Recipe.recipe_address, Recipe.cocktail_name, Recipe.cocktail_intro, Recipe.cocktail_photo,
+         Recipe.owner_address, Recipe.user_address, Recipe.price, Recipe.status),
+        _recipe_filters,
+        frozenset({"address", "recipe_address"}),
+    ),
+    "bars": Dataset(
+        Bar,
+        (Bar.id, Bar.bar_address, Bar.bar_name, Bar.bar_photo, Bar.bar_location, Bar.bar_intro,
+         Bar.latitude, Bar.longitude, Bar.owned_recipes, Bar.used_recipes),
+        _bar_filters,
+        frozenset({"address"}),
+    ),
+}
+
+
+def encode_cursor(dataset: str, filters: ExportFilters, after_id: int) -> str:
+    raw = orjson.dumps({"d": dataset, "f": filters.digest(), "a": after_id})
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str, dataset: str, filters: ExportFilters) -> int:
+    """返回令牌里记录的最后一行 id；令牌无效或和当前的数据集 / 过滤条件不匹配时抛 ValueError"""
+    try:
+        data = orjson.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        after_id = int(data["a"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if data.get("d") != dataset or data.get("f") != filters.digest():
+        raise ValueError("Cursor does not match this dataset and filters")
+    return after_id
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    async def compressed():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31：gzip 格式
+        try:
+            async for chunk in chunks:
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+            yield compressor.flush()
+        finally:
+            # 客户端中途断开时把里面的生成器也关掉，它才会归还名额
+            await chunks.aclose()
+    return compressed()
+
+
+def stream_export(
+    session_factory,
+    dataset_name: str,
+    fmt: str,
+    filters: ExportFilters,
+    slot: ExportSlot,
+    after_id: int = 0,
+    gzip: bool = False,
+) -> AsyncIterator[bytes]:
+    """返回按 id 顺序流式导出 after_id 之后各行的异步迭代器；slot 是调用方已经占到的
+    名额，导出结束、出错或迭代器被回收（响应还没开始发送客户端就断开了）时归还"""
+    dataset = DATASETS[dataset_name]
+    names = [column.key for column in dataset.columns]
+    query = dataset.apply_filters(select(*dataset.columns), filters)
+    query = query.where(dataset.model.id > after_id).order_by(dataset.model.id)
+
+    async def rows() -> AsyncIterator[bytes]:
+        last_id = after_id
+        since_checkpoint = 0
+        try:
+            if fmt == CSV:
+                yield (",".join(names) + "\r\n").encode()
+            async with session_factory() as db:
+                result = await db.stream(query.execution_options(yield_per=EXPORT_FETCH_SIZE))
+                async for partition in result.partitions():
+                    if fmt == CSV:
+                        buffer = io.StringIO()
+                        writer = csv.writer(buffer)
+                        writer.writerows([_csv_value(v) for v in row] for row in partition)
+                        chunk = buffer.getvalue().encode()
+                    else:
+                        lines = []
+                        for row in partition:
+                            lines.append(orjson.dumps(dict(zip(names, row))))
+                            since_checkpoint += 1
+                            if since_checkpoint >= EXPORT_CHECKPOINT_ROWS:
+                                lines.append(orjson.dumps({"_cursor": encode_cursor(dataset_name, filters, row[0])}))
+                                since_checkpoint = 0
+                        chunk = b"\n".join(lines) + b"\n"
+                    last_id = partition[-1][0]
+                    export_rows.inc(dataset_name, fmt, amount=len(partition))
+                    yield chunk
+            if fmt == NDJSON:
+                yield orjson.dumps({"_cursor": encode_cursor(dataset_name, filters, last_id), "_complete": True}) + b"\n"
+        finally:
+            slot.release()
+
+    stream = _gzip_stream(rows()) if gzip else rows()
+    # 没开始迭代的生成器关闭时不会执行 finally，回收时兜底归还名额
+    weakref.finalize(stream, slot.release)
+    return stream
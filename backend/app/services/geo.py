@@ -0,0 +1,180 @@
+"""进程内的酒吧坐标网格索引（附近酒吧查询）
+
+坐标按 GEO_CELL_DEGREES 度切成网格，每个格子存放落在里面的酒吧槽位号
+（array.array，追加 O(1)）。查询时只取覆盖查询半径的那几个格子，用 NumPy
+对候选点做向量化的 haversine 距离计算，再用 argpartition 取最近的 k 个；
+半径太大、要扫的格子太多时直接对全部坐标做一次向量化计算（30 万个点约 20 毫秒）。
+
+和 BM25Index 一样，更新坐标时旧槽位打墓碑标记，墓碑过多时整体压缩。
+几十万个酒吧时一次查询只涉及几个格子，耗时在毫秒级以内。
+"""
+import math
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.config import GEO_CELL_DEGREES
+from app.models.bar import Bar
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_KM / 180
+MAX_SCAN_CELLS = 4096  # 超过这么多格子时逐格查字典比全量扫描还慢
+
+
+def valid_coordinates(latitude: Optional[float], longitude: Optional[float]) -> bool:
+    return (
+        latitude is not None and longitude is not None
+        and -90 <= latitude <= 90 and -180 <= longitude <= 180
+    )
+
+
+class GeoIndex:
+    def __init__(self, cell_degrees: float = GEO_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._lat = array("d")
+        self._lon = array("d")
+        self._alive = bytearray()
+        self._keys: List[Optional[str]] = []
+        self._slots: Dict[str, int] = {}
+        self._cells: Dict[Tuple[int, int], array] = {}
+        self._live = 0
+
+    def __len__(self) -> int:
+        return self._live
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return int(math.floor(latitude / self.cell_degrees)), int(math.floor(longitude / self.cell_degrees))
+
+    def upsert(self, key: str, latitude: Optional[float], longitude: Optional[float]) -> None:
+        """新增或更新一个酒吧的坐标；坐标无效时从索引里去掉"""
+        self.remove(key)
+        if not valid_coordinates(latitude, longitude):
+            return
+        slot = len(self._keys)
+        self._lat.append(latitude)
+        self._lon.append(longitude)
+        self._alive.append(1)
+        self._keys.append(key)
+        self._slots[key] = slot
+        self._cells.setdefault(self._cell(latitude, longitude), array("i")).append(slot)
+        self._live += 1
+
+    def remove(self, key: str) -> None:
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return
+        self._alive[slot] = 0
+        self._keys[slot] = None
+        self._live -= 1
+        dead = len(self._keys) - self._live
+        if dead > 1000 and dead > self._live:
+            self._compact()
+
+    def _compact(self) -> None:
+        entries = [
+            (key, self._lat[slot], self._lon[slot])
+            for slot, key in enumerate(self._keys) if key is not None
+        ]
+        self.__init__(self.cell_degrees)
+        for key, latitude, longitude in entries:
+            self.upsert(key, latitude, longitude)
+
+    def _candidate_slots(self, latitude: float, longitude: float, radius_km: float):
+        """覆盖查询圆的格子里的槽位；要扫的格子太多时返回 None（改为全量扫描）"""
+        import numpy as np
+
+        lat_span = radius_km / KM_PER_DEGREE_LAT
+        lat_lo, lat_hi = max(-90.0, latitude - lat_span), min(90.0, latitude + lat_span)
+        # 圆内纬度绝对值最大处的经度跨度最大
+        widest = max(abs(lat_lo), abs(lat_hi))
+        cos_lat = math.cos(math.radians(widest))
+        if cos_lat < 1e-6 or radius_km / (KM_PER_DEGREE_LAT * cos_lat) >= 180:
+            return None
+        lon_span = radius_km / (KM_PER_DEGREE_LAT * cos_lat)
+
+        row_lo, row_hi = self._cell(lat_lo, 0)[0], self._cell(lat_hi, 0)[0]
+        col_lo, col_hi = self._cell(0, longitude - lon_span)[1], self._cell(0, longitude + lon_span)[1]
+        columns_per_world = int(math.ceil(360 / self.cell_degrees))
+        if col_hi - col_lo + 1 >= columns_per_world:
+            return None
+        cells_to_scan = (row_hi - row_lo + 1) * (col_hi - col_lo + 1)
+        if cells_to_scan > min(MAX_SCAN_CELLS, max(len(self._cells), 64)):
+            return None
+
+        parts = []
+        for row in range(row_lo, row_hi + 1):
+            for col in range(col_lo, col_hi + 1):
+                # 跨越 180 度经线时把列号折回 [-180, 180) 的范围
+                wrapped = (col + columns_per_world // 2) % columns_per_world - columns_per_world // 2
+                cell = self._cells.get((row, wrapped))
+                if cell:
+                    parts.append(np.frombuffer(cell, dtype=np.int32))
+        if not parts:
+            return np.empty(0, dtype=np.int32)
+        return np.concatenate(parts)
+
+    def nearest(self, latitude: float, longitude: float, radius_km: float, k: int) -> List[Tuple[str, float]]:
+        """半径 radius_km 公里内最近的 k 个酒吧，返回 [(bar_address, 距离公里), ...]，由近到远"""
+        if k <= 0 or not self._live:
+            return []
+        import numpy as np
+
+        all_lat = np.frombuffer(self._lat, dtype=np.float64)
+        all_lon = np.frombuffer(self._lon, dtype=np.float64)
+        alive = np.frombuffer(self._alive, dtype=np.uint8)
+
+        slots = self._candidate_slots(latitude, longitude, radius_km)
+        if slots is None:
+            slots = np.flatnonzero(alive)
+        else:
+            slots = slots[alive[slots] == 1]
+        if not slots.size:
+            return []
+
+        # haversine，全部向量化
+        lat1 = math.radians(latitude)
+        lat2 = np.radians(all_lat[slots])
+        dlat = lat2 - lat1
+        dlon = np.radians(all_lon[slots] - longitude)
+        h = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+        within = np.flatnonzero(distances <= radius_km)
+        if within.size > k:
+            within = within[np.argpartition(distances[within], k - 1)[:k]]
+        within = within[np.argsort(distances[within], kind="stable")]
+        return [(self._keys[slots[i]], float(distances[i])) for i in within]
+
+    async def refresh(self, db, bar_addresses: Iterable[str]) -> None:
+        """重新读取指定酒吧的坐标（其它 worker 写入后调用）"""
+        bar_addresses = set(bar_addresses)
+        if not bar_addresses:
+            return
+        rows = (await db.execute(
+            select(Bar.bar_address, Bar.latitude, Bar.longitude).where(Bar.bar_address.in_(bar_addresses))
+        )).all()
+        found = set()
+        for address, latitude, longitude in rows:
+            self.upsert(address, latitude, longitude)
+            found.add(address)
+        for address in bar_addresses - found:
+            self.remove(address)
+
+    async def rebuild(self, db) -> None:
+        """启动时从数据库全量构建，分批读取"""
+        index = GeoIndex(self.cell_degrees)
+        result = await db.stream(
+            select(Bar.bar_address, Bar.latitude, Bar.longitude)
+            .where(Bar.latitude.is_not(None), Bar.longitude.is_not(None))
+            .execution_options(yield_per=5000)
+        )
+        async for address, latitude, longitude in result:
+            index.upsert(address, latitude, longitude)
+        self.__dict__.update(index.__dict__)
+
+    def stats(self) -> Dict:
+        return {"bars": self._live, "cells": len(self._cells), "slots": len(self._keys)}
+
+
+geo_index = GeoIndex()
@@ -0,0 +1,184 @@
+"""跨进程缓存失效（Postgres LISTEN/NOTIFY）
+
+多 worker 部署时每个进程都有自己的内存缓存：表数据版本号（data_versions 表的副本，算 ETag 用）、
+/agent 的检索索引、附近酒吧的坐标索引、推荐索引、输入联想索引和近似重复索引。写接口在提交前调用 invalidation_bus.publish()，
+NOTIFY 和写入在同一个事务里，提交成功才会发出；每个 worker 用一条单独的 asyncpg 连接
+LISTEN，收到别的 worker 发来的消息后更新自己的缓存。
+
+监听连接断开时会自动重连，并把所有缓存整体失效一次（断开期间可能漏掉了消息）。
+"""
+import asyncio
+import uuid
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import orjson
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import DATABASE_URL, LISTEN_CONNECT_TIMEOUT
+from app.services.autocomplete import autocomplete_index
+from app.services.geo import geo_index
+from app.services.near_duplicates import near_duplicate_index
+from app.services.recommender import recommender
+from app.services.retrieval import catalog_index
+from app.utils.http_cache import data_versions
+
+CHANNEL = "cache_invalidation"
+RECONNECT_SECONDS = 5.0
+
+
+class InvalidationBus:
+    def __init__(self):
+        # 用来忽略自己发出的消息（本进程在提交后已经直接更新了缓存）
+        self.origin = uuid.uuid4().hex
+        self._task: Optional[asyncio.Task] = None
+        self._pending = set()
+        # 同一条 LISTEN 连接上的其它频道（例如市场事件），频道名 -> 回调(payload)
+        self._channels: Dict[str, Callable[[str], None]] = {}
+        self._reconnect_callbacks = []
+        self.published = 0
+        self.received = 0
+        self.reconnects = 0
+        self.last_error: Optional[str] = None
+
+    async def publish(
+        self,
+        db: AsyncSession,
+        tables: Iterable[str],
+        recipe_ids: Iterable[int] = (),
+        bar_addresses: Iterable[str] = (),
+        licenses: Iterable[Tuple[str, str]] = (),
+    ) -> None:
+        """在写事务里调用（commit 之前），事务提交时其它 worker 才会收到；同时把这些表在
+        data_versions 里的版本号加一，提交后本进程直接生效（不用再手动更新 ETag）。
+        licenses 是新的 (酒吧地址, recipe 地址) 授权，用来增量更新推荐"""
+        tables = list(tables)
+        versions = await data_versions.stage(db, tables)
+        payload = orjson.dumps({
+            "origin": self.origin,
+            "tables": tables,
+            "versions": versions,
+            "recipe_ids": list(recipe_ids),
+            "bar_addresses": list(bar_addresses),
+            "licenses": [list(pair) for pair in licenses],
+        }).decode()
+        await db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": payload})
+        self.published += 1
+
+    async def _apply(self, message: dict) -> None:
+        data_versions.apply(message.get("versions", {}))
+        for bar_address, recipe_address in message.get("licenses", ()):
+            recommender.add(bar_address, recipe_address)
+            autocomplete_index.record_sale(recipe_address)
+        if message.get("recipe_ids") or message.get("bar_addresses"):
+            from app.db.session import AsyncSessionLocal
+            try:
+                async with AsyncSessionLocal() as db:
+                    await catalog_index.refresh(db, message.get("recipe_ids", ()), message.get("bar_addresses", ()))
+                    await geo_index.refresh(db, message.get("bar_addresses", ()))
+                    await autocomplete_index.refresh(db, message.get("recipe_ids", ()), message.get("bar_addresses", ()))
+                    await near_duplicate_index.refresh(db, message.get("recipe_ids", ()))
+            except Exception as e:
+                print(f"⚠️  Warning: failed to refresh catalog index: {str(e)}")
+
+    async def _invalidate_everything(self) -> None:
+        from app.db.session import AsyncSessionLocal
+        async with AsyncSessionLocal() as db:
+            await data_versions.load(db)
+            await catalog_index.rebuild(db)
+            await geo_index.rebuild(db)
+            await recommender.rebuild(db)
+            await autocomplete_index.rebuild(db)
+            await near_duplicate_index.rebuild(db)
+
+    def add_channel(
+        self,
+        channel: str,
+        callback: Callable[[str], None],
+        on_reconnect: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """在 start() 之前调用：顺带监听另一个频道，收到的 payload 原样交给 callback；
+        on_reconnect 在监听连接断开重连后调用（断开期间的消息可能丢了）"""
+        self._channels[channel] = callback
+        if on_reconnect is not None:
+            self._reconnect_callbacks.append(on_reconnect)
+
+    def _on_channel_notify(self, connection, pid, channel, payload) -> None:
+        try:
+            self._channels[channel](payload)
+        except Exception as e:
+            print(f"⚠️  Warning: failed to handle {channel} notification: {str(e)}")
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        try:
+            message = orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            return
+        if message.get("origin") == self.origin:
+            return
+        self.received += 1
+        task = asyncio.create_task(self._apply(message))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _listen_forever(self, connected: asyncio.Event) -> None:
+        import asyncpg
+
+        dsn = DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://", 1)
+        first = True
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(dsn)
+                await conn.add_listener(CHANNEL, self._on_notify)
+                for channel in self._channels:
+                    await conn.add_listener(channel, self._on_channel_notify)
+                if not first:
+                    self.reconnects += 1
+                    await self._invalidate_everything()
+                    for callback in self._reconnect_callbacks:
+                        callback()
+                first = False
+                connected.set()
+                while not conn.is_closed():
+                    await asyncio.sleep(RECONNECT_SECONDS)
+                print("⚠️  Warning: invalidation listener connection closed, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e) or type(e).__name__
+                print(f"⚠️  Warning: invalidation listener failed: {str(e)}")
+                await asyncio.sleep(RECONNECT_SECONDS)
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+
+    async def start(self, timeout: float = LISTEN_CONNECT_TIMEOUT) -> None:
+        """开始监听（重复调用无副作用）；第一次连接成功后返回，之后的写入都不会漏掉。
+
+        timeout 秒内连不上（例如经过事务池模式的 pgbouncer，LISTEN 用不了）就停止重试并抛出
+        RuntimeError，让启动失败，而不是一直卡在 warm-up。
+        """
+        if self._task is not None and not self._task.done():
+            return
+        connected = asyncio.Event()
+        self._task = asyncio.create_task(self._listen_forever(connected))
+        try:
+            await asyncio.wait_for(connected.wait(), timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            raise RuntimeError(
+                f"Could not LISTEN on {CHANNEL} within {timeout:g}s: {self.last_error or 'connection not established'}"
+            )
+
+    def stats(self) -> dict:
+        return {
+            "listening": self._task is not None and not self._task.done(),
+            "published": self.published,
+            "received": self.received,
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+        }
+
+
+invalidation_bus = InvalidationBus()
@@ -1,14 +1,26 @@
-import requests
 import json
 import tempfile
 import os
 from typing import Dict, Any
 from app.config import PINATA_API_KEY, PINATA_API_SECRET
+from app.services.metrics import track_call
 
 UPLOAD_URL = "https://api.pinata.cloud/pinning/pinFileToIPFS"
 JSON_UPLOAD_URL = "https://api.pinata.cloud/pinning/pinJSONToIPFS"
 
+_session = None
 
+
+def _get_session():
+    """Pinata 和 IPFS 网关共用的 HTTP 会话（复用连接），第一次调用时才创建"""
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+    return _session
+
+
+@track_call("pinata", "pin_file")
 def upload_to_pinata_with_key(file_path: str) -> Dict:
     """使用API Key + Secret方式上传文件到Pinata IPFS"""
     if not PINATA_API_KEY or not PINATA_API_SECRET:
@@ -20,10 +32,11 @@ def upload_to_pinata_with_key(file_path: str) -> Dict:
     }
     with open(file_path, "rb") as f:
         files = {"file": f}
-        response = requests.post(UPLOAD_URL, files=files, headers=headers)
+        response = _get_session().post(UPLOAD_URL, files=files, headers=headers)
     return response.json()
 
 
+@track_call("pinata", "pin_file")
 def upload_picture_to_pinata(file_path: str) -> str:
     """上传图片到Pinata IPFS，返回CID"""
     if not PINATA_API_KEY or not PINATA_API_SECRET:
@@ -36,7 +49,7 @@ def upload_picture_to_pinata(file_path: str) -> str:
     
     with open(file_path, "rb") as f:
         files = {"file": f}
-        response = requests.post(UPLOAD_URL, files=files, headers=headers)
+        response = _get_session().post(UPLOAD_URL, files=files, headers=headers)
     
     result = response.json()
     if response.status_code == 200 and "IpfsHash" in result:
@@ -45,6 +58,7 @@ def upload_picture_to_pinata(file_path: str) -> str:
         raise Exception(f"上传图片失败: {result}")
 
 
+@track_call("pinata", "pin_json")
 def upload_recipe_to_pinata(
     cocktail_name: str,
     cocktail_intro: str,
@@ -74,7 +88,7 @@ def upload_recipe_to_pinata(
         "pinata_secret_api_key": PINATA_API_SECRET
     }
     
-    response = requests.post(JSON_UPLOAD_URL, json=recipe_metadata, headers=headers)
+    response = _get_session().post(JSON_UPLOAD_URL, json=recipe_metadata, headers=headers)
     result = response.json()
     
     if response.status_code == 200 and "IpfsHash" in result:
@@ -83,6 +97,7 @@ def upload_recipe_to_pinata(
         raise Exception(f"上传Recipe元数据失败: {result}")
 
 
+@track_call("pinata", "pin_json")
 def upload_bar_to_pinata(
     bar_photo_cid: str,
     bar_name: str,
@@ -110,7 +125,7 @@ def upload_bar_to_pinata(
         "pinata_secret_api_key": PINATA_API_SECRET
     }
     
-    response = requests.post(JSON_UPLOAD_URL, json=bar_metadata, headers=headers)
+    response = _get_session().post(JSON_UPLOAD_URL, json=bar_metadata, headers=headers)
     result = response.json()
     
     if response.status_code == 200 and "IpfsHash" in result:
@@ -119,11 +134,12 @@ def upload_bar_to_pinata(
         raise Exception(f"上传Bar元数据失败: {result}")
 
 
+@track_call("ipfs_gateway", "fetch_metadata")
 def fetch_metadata_from_ipfs(cid: str) -> dict:
     """从IPFS获取元数据"""
     try:
         # 使用IPFS网关获取数据
-        response = requests.get(f"https://gateway.pinata.cloud/ipfs/{cid}")
+        response = _get_session().get(f"https://gateway.pinata.cloud/ipfs/{cid}")
         if response.status_code == 200:
             return response.json()
         else:
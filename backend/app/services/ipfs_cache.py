@@ -0,0 +1,326 @@
+"""IPFS 内容的本地磁盘缓存（/ipfs/{cid} 图片网关）
+
+CID 是内容的哈希，同一个 CID 的内容永远不变，缓存不需要失效，只需要按容量淘汰：
+
+- 命中：返回磁盘上的文件，由 FileResponse 发送（支持 Range；ASGI 服务器支持
+  http.response.pathsend 扩展时由服务器零拷贝发送）
+- 未命中：回源下载到同目录下的临时文件，写完后 os.replace 原子地放到位，读的一方
+  永远看不到写了一半的文件；同一个 CID 同时只有一个下载（single-flight），其它请求
+  等它的结果，客户端断开也不会取消下载
+- 回源失败的 CID 在 IPFS_NEGATIVE_TTL 秒内直接返回同样的错误，不反复打上游
+- 回源前按发起下载的客户端扣 admission 里 ipfs_miss 类别的令牌，不够时返回 429：
+  随便编 CID 的客户端只会用完自己的额度，占不满 IPFS_FETCH_CONCURRENCY 个回源名额。
+  合并进别人下载的请求不扣；发起的客户端被限流时，等待的请求不会跟着拿到 429，
+  而是按自己的额度重新发起
+- 总大小超过 IPFS_CACHE_MAX_BYTES 时按最久未访问淘汰
+
+同一台机器上的 worker 共用缓存目录：别的 worker 已经下载好的文件直接认领；每个
+worker 只淘汰自己记录里的文件，被别的 worker 淘汰掉的文件下次访问时重新下载。
+Content-Type 按文件头判断，不信任上游返回的类型。
+"""
+import asyncio
+import os
+import re
+import tempfile
+import time
+from collections import OrderedDict
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from app.config import (
+    IPFS_CACHE_DIR,
+    IPFS_CACHE_MAX_BYTES,
+    IPFS_FETCH_CONCURRENCY,
+    IPFS_FETCH_TIMEOUT,
+    IPFS_GATEWAY_URL,
+    IPFS_MAX_OBJECT_BYTES,
+    IPFS_NEGATIVE_TTL,
+    RATE_LIMIT_ENABLED,
+)
+from app.services.admission import IPFS_MISS, admission_rejected, rate_limiter
+from app.services.metrics import Counter, Gauge, registry, track_call
+
+# CIDv0（base58btc 的 Qm...）和 base32 的 CIDv1（b...）
+CID_PATTERN = re.compile(r"^(Qm[1-9A-HJ-NP-Za-km-z]{44}|b[a-z2-7]{58,100})$")
+CHUNK_SIZE = 64 * 1024
+SNIFF_BYTES = 32
+STALE_PART_SECONDS = 3600  # 启动时清理这么久以前留下的临时文件（下载中途进程退出）
+
+ipfs_cache_requests = registry.register(Counter(
+    "ipfs_cache_requests_total", "IPFS gateway lookups by outcome", ("result",),
+))
+ipfs_cache_bytes = registry.register(Gauge(
+    "ipfs_cache_bytes", "Bytes of IPFS content tracked by this worker's disk cache",
+))
+
+
+class IpfsFetchError(Exception):
+    """回源失败；status_code 是返回给客户端的状态码，限流时 retry_after 是建议的等待秒数"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[float] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class CachedObject:
+    path: str
+    size: int
+    media_type: str
+
+
+def valid_cid(cid: str) -> bool:
+    return bool(CID_PATTERN.match(cid))
+
+
+def sniff_media_type(head: bytes) -> str:
+    """按文件头判断图片类型；其它内容一律按二进制下载，避免在本站域名下渲染 HTML / SVG"""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis"):
+        return "image/avif"
+    return "application/octet-stream"
+
+
+class IpfsCache:
+    def __init__(self, directory: str = IPFS_CACHE_DIR, max_bytes: int = IPFS_CACHE_MAX_BYTES,
+                 gateway_url: str = IPFS_GATEWAY_URL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.gateway_url = gateway_url.rstrip("/")
+        # cid -> CachedObject，按访问顺序排列，最久未访问的在最前面
+        self._entries: "OrderedDict[str, CachedObject]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._failures: Dict[str, Tuple[float, IpfsFetchError]] = {}
+        self._fetch_slots = asyncio.Semaphore(IPFS_FETCH_CONCURRENCY)
+        self.evictions = 0
+
+    def _path(self, cid: str) -> str:
+        # 按 CID 末两位分子目录，单个目录里的文件数不会太多
+        return os.path.join(self.directory, cid[-2:], cid)
+
+    # ---- 查询 ----
+    async def get(self, cid: str, client: Optional[str] = None) -> Tuple[CachedObject, os.stat_result]:
+        """返回缓存的文件（必要时先回源下载）和它的 stat 结果；失败时抛 IpfsFetchError。
+        client 是限流用的调用方标识，需要回源时扣它的令牌"""
+        for _ in range(2):
+            entry = await self._lookup(cid, client)
+            try:
+                return entry, await asyncio.to_thread(os.stat, entry.path)
+            except FileNotFoundError:
+                # 被同一台机器上的别的 worker 淘汰了，重新下载一次
+                self._forget(cid)
+        raise IpfsFetchError(503, "IPFS cache is under heavy eviction, please retry")
+
+    async def _lookup(self, cid: str, client: Optional[str]) -> CachedObject:
+        entry = self._entries.get(cid)
+        if entry is not None:
+            self._entries.move_to_end(cid)
+            ipfs_cache_requests.inc("hit")
+            return entry
+
+        failure = self._failures.get(cid)
+        if failure is not None:
+            if failure[0] > time.monotonic():
+                ipfs_cache_requests.inc("negative")
+                raise failure[1]
+            del self._failures[cid]
+
+        while True:
+            pending = self._inflight.get(cid)
+            leader = pending is None
+            if leader:
+                pending = self._inflight[cid] = asyncio.ensure_future(self._load(cid, client))
+                pending.add_done_callback(lambda future: self._load_done(cid, future))
+            else:
+                ipfs_cache_requests.inc("coalesced")
+            try:
+                # shield：等待的请求被取消（客户端断开）时下载继续，其它请求还在等它
+                return await asyncio.shield(pending)
+            except IpfsFetchError as e:
+                # 429 是发起下载的客户端自己的额度用完了，等待的一方重新发起（扣自己的额度）；
+                # 这时 _load_done 已经把它从 _inflight 里拿掉了
+                if leader or e.status_code != 429:
+                    raise
+
+    def _load_done(self, cid: str, future: asyncio.Future) -> None:
+        self._inflight.pop(cid, None)
+        if not future.cancelled():
+            future.exception()  # 所有等待方都断开时也算取走了异常，不打 "never retrieved" 警告
+
+    async def _load(self, cid: str, client: Optional[str]) -> CachedObject:
+        path = self._path(cid)
+        entry = await asyncio.to_thread(self._adopt, path)
+        if entry is not None:
+            ipfs_cache_requests.inc("hit")
+        else:
+            ipfs_cache_requests.inc("miss")
+            self._charge_miss(client)
+            async with self._fetch_slots:
+                try:
+                    entry = await asyncio.to_thread(self._download, cid, path)
+                except IpfsFetchError as e:
+                    self._remember_failure(cid, e)
+                    raise
+                except Exception as e:
+                    error = IpfsFetchError(502, f"Failed to fetch from IPFS: {str(e)}")
+                    self._remember_failure(cid, error)
+                    raise error
+        await self._remember(cid, entry)
+        return entry
+
+    @staticmethod
+    def _charge_miss(client: Optional[str]) -> None:
+        """回源前扣发起下载的客户端的令牌；被拒绝的不记进失败缓存，别人请求同一个 CID 照常回源"""
+        if client is None or not RATE_LIMIT_ENABLED:
+            return
+        wait = rate_limiter.check(client, IPFS_MISS)
+        if wait > 0:
+            admission_rejected.inc("rate_limit", IPFS_MISS)
+            raise IpfsFetchError(429, "Too many uncached IPFS requests, please slow down", retry_after=wait)
+
+    def _remember_failure(self, cid: str, error: IpfsFetchError) -> None:
+        now = time.monotonic()
+        if len(self._failures) > 10000:
+            self._failures = {key: value for key, value in self._failures.items() if value[0] > now}
+        self._failures[cid] = (now + IPFS_NEGATIVE_TTL, error)
+
+    # ---- 磁盘 ----
+    @staticmethod
+    def _adopt(path: str) -> Optional[CachedObject]:
+        """磁盘上已经有的文件（之前的进程或别的 worker 下载的）"""
+        try:
+            with open(path, "rb") as f:
+                head = f.read(SNIFF_BYTES)
+                size = os.fstat(f.fileno()).st_size
+        except FileNotFoundError:
+            return None
+        return CachedObject(path, size, sniff_media_type(head))
+
+    @track_call("ipfs_gateway", "fetch_object")
+    def _download(self, cid: str, path: str) -> CachedObject:
+        """在线程里运行：流式下载到临时文件，大小超限时中途放弃"""
+        import requests
+        from app.services.ipfs import _get_session
+
+        try:
+            response = _get_session().get(f"{self.gateway_url}/{cid}", stream=True, timeout=IPFS_FETCH_TIMEOUT)
+        except requests.RequestException as e:
+            raise IpfsFetchError(502, f"IPFS gateway unreachable: {str(e)}")
+
+        with response:
+            if response.status_code == 404:
+                raise IpfsFetchError(404, "Content not found on IPFS")
+            if response.status_code != 200:
+                raise IpfsFetchError(502, f"IPFS gateway returned {response.status_code}")
+            declared = response.headers.get("Content-Length")
+            if declared and declared.isdigit() and int(declared) > IPFS_MAX_OBJECT_BYTES:
+                raise IpfsFetchError(413, "Content is too large to serve")
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, part = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{cid}.", suffix=".part")
+            size, head = 0, b""
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > IPFS_MAX_OBJECT_BYTES:
+                            raise IpfsFetchError(413, "Content is too large to serve")
+                        if len(head) < SNIFF_BYTES:
+                            head += chunk[:SNIFF_BYTES - len(head)]
+                        f.write(chunk)
+                os.replace(part, path)
+            except BaseException:
+                with suppress(FileNotFoundError):
+                    os.unlink(part)
+                raise
+        return CachedObject(path, size, sniff_media_type(head))
+
+    # ---- 容量 ----
+    async def _remember(self, cid: str, entry: CachedObject) -> None:
+        if cid not in self._entries:
+            self._entries[cid] = entry
+            self._bytes += entry.size
+        victims = self._evict()
+        if victims:
+            await asyncio.to_thread(_unlink_all, victims)
+
+    def _forget(self, cid: str) -> None:
+        entry = self._entries.pop(cid, None)
+        if entry is not None:
+            self._bytes -= entry.size
+            ipfs_cache_bytes.set(self._bytes)
+
+    def _evict(self) -> List[str]:
+        """超过容量时从最久未访问的开始淘汰（刚放进来的那个保留），返回要删除的文件"""
+        victims = []
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            victims.append(entry.path)
+        self.evictions += len(victims)
+        ipfs_cache_bytes.set(self._bytes)
+        return victims
+
+    async def load(self) -> None:
+        """启动时扫描缓存目录，按修改时间从旧到新登记，超出容量的直接淘汰"""
+        found = await asyncio.to_thread(self._scan)
+        self._entries.clear()
+        self._bytes = 0
+        for cid, entry in found:
+            self._entries[cid] = entry
+            self._bytes += entry.size
+        victims = self._evict()
+        if victims:
+            await asyncio.to_thread(_unlink_all, victims)
+
+    def _scan(self) -> List[Tuple[str, CachedObject]]:
+        found = []
+        now = time.time()
+        os.makedirs(self.directory, exist_ok=True)
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for item in os.scandir(shard.path):
+                stat = item.stat()
+                if item.name.endswith(".part"):
+                    if now - stat.st_mtime > STALE_PART_SECONDS:
+                        with suppress(FileNotFoundError):
+                            os.unlink(item.path)
+                    continue
+                if not valid_cid(item.name):
+                    continue
+                with open(item.path, "rb") as f:
+                    head = f.read(SNIFF_BYTES)
+                found.append((stat.st_mtime, item.name, CachedObject(item.path, stat.st_size, sniff_media_type(head))))
+        found.sort(key=lambda row: row[0])
+        return [(cid, entry) for _, cid, entry in found]
+
+    def stats(self) -> Dict:
+        return {
+            "directory": self.directory,
+            "objects": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "inflight": len(self._inflight),
+            "negative_entries": len(self._failures),
+            "evictions": self.evictions,
+        }
+
+
+def _unlink_all(paths: List[str]) -> None:
+    for path in paths:
+        with suppress(FileNotFoundError):
+            os.unlink(path)
+
+
+ipfs_cache = IpfsCache()
@@ -0,0 +1,352 @@
+"""Kimi (Moonshot) API 异步客户端
+
+所有请求共用一个 AsyncOpenAI 客户端（底层是同一个 httpx 连接池），
+并经过 ConcurrencyLimiter：超过并发上限的请求排队，队列满或等待超时
+会被明确拒绝，而不是无声地堆积。
+
+上游调用外面包了一层熔断器（breaker）；后台探测任务定期检查 Kimi
+是否可用，结果缓存在 health_status 里供健康检查直接读取。
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from app.config import (
+    KIMI_API_KEY,
+    KIMI_BREAKER_FAILURE_RATE,
+    KIMI_BREAKER_OPEN_SECONDS,
+    KIMI_BREAKER_SLOW_CALL_SECONDS,
+    KIMI_HEALTH_INTERVAL,
+    KIMI_BASE_URL,
+    KIMI_MODEL,
+    KIMI_MAX_CONCURRENCY,
+    KIMI_MAX_QUEUE,
+    KIMI_QUEUE_TIMEOUT,
+    KIMI_REQUEST_TIMEOUT,
+)
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.metrics import track_call
+
+
+class KimiNotConfiguredError(Exception):
+    """没有配置 KIMI_API_KEY 或 openai 库不可用"""
+
+
+class KimiOverloadedError(Exception):
+    """并发已满且队列已满 / 排队超时"""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class KimiTimeoutError(Exception):
+    """上游请求超过 KIMI_REQUEST_TIMEOUT"""
+
+
+class ConcurrencyLimiter:
+    """限制同时进行的上游请求数，并给排队长度和等待时间加上上限"""
+
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.completed = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.waits = 0
+
+    async def acquire(self) -> None:
+        started = time.perf_counter()
+        if not self._semaphore.locked():
+            # 有空位时 acquire 不会让出事件循环
+            await self._semaphore.acquire()
+        else:
+            if self.queue_depth >= self.max_queue:
+                self.rejected_queue_full += 1
+                raise KimiOverloadedError("AI service is busy, queue is full", retry_after=self._retry_after())
+
+            self.queue_depth += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                raise KimiOverloadedError(
+                    f"AI service is busy, waited more than {self.queue_timeout:g}s",
+                    retry_after=self._retry_after(),
+                )
+            finally:
+                self.queue_depth -= 1
+
+        waited = time.perf_counter() - started
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        self.waits += 1
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self.completed += 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _retry_after(self) -> int:
+        return max(1, int(self.queue_timeout))
+
+    def stats(self) -> Dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_wait_seconds": self.total_wait / self.waits if self.waits else 0.0,
+            "max_wait_seconds": self.max_wait,
+        }
+
+
+limiter = ConcurrencyLimiter(KIMI_MAX_CONCURRENCY, KIMI_MAX_QUEUE, KIMI_QUEUE_TIMEOUT)
+breaker = CircuitBreaker(
+    "kimi",
+    failure_rate=KIMI_BREAKER_FAILURE_RATE,
+    slow_call_seconds=KIMI_BREAKER_SLOW_CALL_SECONDS,
+    open_seconds=KIMI_BREAKER_OPEN_SECONDS,
+)
+
+# 全局共享的 AsyncOpenAI 客户端
+client = None
+
+
+def get_ai_client():
+    """Get the async AI client, initializing it if needed and API key is available."""
+    global client
+    if client is None and KIMI_API_KEY and KIMI_API_KEY.strip():
+        try:
+            # Import OpenAI only when needed to avoid initialization issues
+            import httpx
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(
+                api_key=KIMI_API_KEY.strip(),
+                base_url=KIMI_BASE_URL,
+                timeout=KIMI_REQUEST_TIMEOUT,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=KIMI_MAX_CONCURRENCY,
+                        max_keepalive_connections=KIMI_MAX_CONCURRENCY,
+                    ),
+                    timeout=KIMI_REQUEST_TIMEOUT,
+                ),
+            )
+            print("✅ AI client initialized successfully")
+        except ImportError as e:
+            print(f"⚠️  Warning: OpenAI library not available: {str(e)}")
+            client = None
+        except Exception as e:
+            print(f"⚠️  Warning: Failed to initialize AI client: {str(e)}")
+            client = None
+    return client
+
+
+def _is_upstream_failure(e: BaseException) -> bool:
+    """超时、连接错误、429 和 5xx 算上游故障；其它 4xx 是请求本身的问题，不计入熔断"""
+    from openai import APIStatusError
+
+    if isinstance(e, APIStatusError):
+        return e.status_code == 429 or e.status_code >= 500
+    return isinstance(e, Exception)
+
+
+def _record_failure(e: BaseException) -> None:
+    if _is_upstream_failure(e):
+        breaker.record(False)
+    else:
+        breaker.release_trial()
+
+
+@track_call("kimi", "chat_completion")
+async def create_chat_completion(
+    messages: List[Dict],
+    temperature: float = 0.6,
+    model: Optional[str] = None,
+) -> str:
+    """在熔断器和并发限制内调用 Kimi chat completions，返回回复文本"""
+    ai_client = get_ai_client()
+    if not ai_client:
+        raise KimiNotConfiguredError("AI service not configured. Please set KIMI_API_KEY in environment variables.")
+
+    from openai import APITimeoutError
+
+    breaker.before_call()
+    try:
+        async with limiter.slot():
+            started = time.perf_counter()
+            try:
+                async with asyncio.timeout(KIMI_REQUEST_TIMEOUT):
+                    completion = await ai_client.chat.completions.create(
+                        model=model or KIMI_MODEL,
+                        messages=messages,
+                        temperature=temperature,
+                    )
+            except (TimeoutError, APITimeoutError):
+                breaker.record(False)
+                raise KimiTimeoutError(f"AI API did not respond within {KIMI_REQUEST_TIMEOUT:g}s")
+            except Exception as e:
+                _record_failure(e)
+                raise
+            breaker.record(True, time.perf_counter() - started)
+    except (KimiOverloadedError, asyncio.CancelledError):
+        breaker.release_trial()
+        raise
+    return completion.choices[0].message.content
+
+
+class KimiStream:
+    """一次流式 completion：迭代得到增量文本，结束后必须 aclose() 释放并发名额
+
+    熔断器只在流结束时记一次结果：读完算成功（慢不慢按打开时拿到响应头的延迟算，
+    生成得长不算慢），中途出错按 _record_failure 算，没读完就关闭（客户端断开）不算
+    结果，只归还试探名额。
+    """
+
+    def __init__(self, upstream, open_latency: float):
+        self._upstream = upstream
+        self._open_latency = open_latency
+        self._closed = False
+        self._settled = False
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._upstream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            if not self._settled:
+                self._settled = True
+                _record_failure(e)
+            raise
+        if not self._settled:
+            self._settled = True
+            breaker.record(True, self._open_latency)
+
+    async def aclose(self) -> None:
+        """关闭上游连接（客户端断开时即取消上游生成）并释放名额；可重复调用"""
+        if self._closed:
+            return
+        self._closed = True
+        if not self._settled:
+            self._settled = True
+            breaker.release_trial()
+        try:
+            await self._upstream.close()
+        finally:
+            limiter.release()
+
+
+@track_call("kimi", "chat_stream_open")
+async def open_chat_stream(
+    messages: List[Dict],
+    temperature: float = 0.6,
+    model: Optional[str] = None,
+) -> KimiStream:
+    """占用一个并发名额并打开流式 completion；出错时在返回前就抛出，方便返回正确的状态码"""
+    ai_client = get_ai_client()
+    if not ai_client:
+        raise KimiNotConfiguredError("AI service not configured. Please set KIMI_API_KEY in environment variables.")
+
+    from openai import APITimeoutError
+
+    breaker.before_call()
+    try:
+        await limiter.acquire()
+    except BaseException:
+        breaker.release_trial()
+        raise
+
+    started = time.perf_counter()
+    try:
+        async with asyncio.timeout(KIMI_REQUEST_TIMEOUT):
+            upstream = await ai_client.chat.completions.create(
+                model=model or KIMI_MODEL,
+                messages=messages,
+                temperature=temperature,
+                stream=True,
+            )
+    except (TimeoutError, APITimeoutError):
+        limiter.release()
+        breaker.record(False)
+        raise KimiTimeoutError(f"AI API did not respond within {KIMI_REQUEST_TIMEOUT:g}s")
+    except Exception as e:
+        limiter.release()
+        _record_failure(e)
+        raise
+    except BaseException:
+        limiter.release()
+        breaker.release_trial()
+        raise
+    # 结果等流结束时再记（见 KimiStream）
+    return KimiStream(upstream, time.perf_counter() - started)
+
+
+# 后台健康探测的最新结果，健康检查接口直接读取
+health_status: Dict = {"status": "unknown", "api_connection": "not_checked", "checked_at": None}
+_prober_task: Optional[asyncio.Task] = None
+
+
+async def probe_once() -> None:
+    """用不产生 token 费用的 models.list 探测 Kimi 是否可用"""
+    ai_client = get_ai_client()
+    if not ai_client:
+        health_status.update(
+            status="unhealthy",
+            api_connection="not_configured",
+            error="AI client not configured - KIMI_API_KEY not found",
+            checked_at=time.time(),
+        )
+        return
+
+    started = time.perf_counter()
+    try:
+        async with asyncio.timeout(KIMI_REQUEST_TIMEOUT):
+            await ai_client.models.list()
+    except Exception as e:
+        breaker.record_probe(False)
+        health_status.update(status="unhealthy", api_connection="failed", error=str(e) or type(e).__name__,
+                             checked_at=time.time())
+        return
+
+    latency = time.perf_counter() - started
+    breaker.record_probe(True, latency)
+    health_status.update(status="healthy", api_connection="active", error=None,
+                         latency_seconds=round(latency, 3), checked_at=time.time())
+
+
+async def _probe_forever() -> None:
+    while True:
+        try:
+            await probe_once()
+        except Exception as e:
+            print(f"⚠️  Warning: AI health probe failed: {str(e)}")
+        await asyncio.sleep(KIMI_HEALTH_INTERVAL)
+
+
+def start_health_prober() -> None:
+    """在事件循环里启动后台健康探测（重复调用无副作用）"""
+    global _prober_task
+    if _prober_task is None or _prober_task.done():
+        _prober_task = asyncio.create_task(_probe_forever())
@@ -0,0 +1,183 @@
+"""LLM 响应缓存
+
+以规范化后的消息列表 + 模型 + temperature 为键缓存 completion 结果：
+- 只缓存 temperature 不高于阈值的请求（高 temperature 本来就期望每次不同）
+- 内存中 TTL + LRU，可选用 sqlite 文件持久化，重启后仍可命中
+- 同一个键的并发请求合并为一次上游调用（single-flight）
+"""
+import asyncio
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import orjson
+
+from app.config import (
+    KIMI_CACHE_MAX_ENTRIES,
+    KIMI_CACHE_MAX_TEMPERATURE,
+    KIMI_CACHE_PATH,
+    KIMI_CACHE_TTL,
+)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_messages(messages: List[Dict]) -> List[Tuple[str, str]]:
+    """去掉首尾空白并合并连续空白，避免无意义的差异导致缓存未命中"""
+    return [(m["role"], _WHITESPACE.sub(" ", m["content"]).strip()) for m in messages]
+
+
+class _DiskStore:
+    """sqlite 持久化层，所有方法都是阻塞的，调用方放到线程里执行"""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),))
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        return row
+
+    def set(self, key: str, value: str, expires_at: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)", (key, value, expires_at)
+            )
+
+
+class LLMResponseCache:
+    def __init__(self, max_entries: int, ttl: float, max_temperature: float, persist_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_temperature = max_temperature
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._disk = _DiskStore(persist_path) if persist_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        self.bypassed = 0
+
+    def cacheable(self, temperature: float) -> bool:
+        return self.max_entries > 0 and temperature <= self.max_temperature
+
+    @staticmethod
+    def make_key(messages: List[Dict], model: str, temperature: float) -> str:
+        payload = orjson.dumps([model, round(temperature, 3), normalize_messages(messages)])
+        return hashlib.sha256(payload).hexdigest()
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_memory(self, key: str, value: str, expires_at: float) -> None:
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(
+        self,
+        messages: List[Dict],
+        model: str,
+        temperature: float,
+        compute: Callable[[], Awaitable[str]],
+    ) -> str:
+        if not self.cacheable(temperature):
+            self.bypassed += 1
+            return await compute()
+
+        key = self.make_key(messages, model, temperature)
+        value = self._get_memory(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        # 已有相同请求在进行中，等待它的结果
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.collapsed += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # 发起上游请求的一方被取消了（例如客户端断开），重新发起
+                return await self.get_or_compute(messages, model, temperature, compute)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._load_or_compute(key, compute)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            # 错误不缓存，但要让等待中的请求一起失败
+            future.set_exception(e)
+            future.exception()  # 没有等待者时避免 "exception was never retrieved"
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _load_or_compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        if self._disk is not None:
+            row = await asyncio.to_thread(self._disk.get, key)
+            if row is not None:
+                self.disk_hits += 1
+                self._set_memory(key, row[0], row[1])
+                return row[0]
+
+        self.misses += 1
+        value = await compute()
+        expires_at = time.time() + self.ttl
+        self._set_memory(key, value, expires_at)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.set, key, value, expires_at)
+        return value
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.disk_hits + self.misses + self.collapsed
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "max_temperature": self.max_temperature,
+            "persistent": self._disk is not None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "collapsed": self.collapsed,
+            "bypassed": self.bypassed,
+            "hit_rate": (self.hits + self.disk_hits + self.collapsed) / lookups if lookups else 0.0,
+        }
+
+
+llm_cache = LLMResponseCache(
+    max_entries=KIMI_CACHE_MAX_ENTRIES,
+    ttl=KIMI_CACHE_TTL,
+    max_temperature=KIMI_CACHE_MAX_TEMPERATURE,
+    persist_path=KIMI_CACHE_PATH or None,
+)
@@ -0,0 +1,360 @@
+"""Prometheus 格式的运行指标
+
+没有引入 prometheus_client，这里只实现了用到的 Counter / Gauge / Histogram，
+记录一次观测只是几次字典查找和整数加法，可以在生产环境常开。
+
+采集的指标：
+- HTTP 请求延迟（按路由模板、方法、状态码）
+- SQL 语句耗时（SQLAlchemy 引擎事件）
+- 连接池取连接的等待时间和占用数
+- Pinata / IPFS 网关 / Kimi 调用的延迟和错误数
+- 事件循环延迟
+"""
+import asyncio
+import functools
+import inspect
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+UPSTREAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LOOP_LAG_INTERVAL = 0.5
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in list(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in list(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签: [各桶计数（非累积，最后一个是 +Inf）, sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in list(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ("method", "route", "status"),
+))
+http_requests_in_progress = registry.register(Gauge(
+    "http_requests_in_progress", "HTTP requests currently being served",
+))
+db_query_duration = registry.register(Histogram(
+    "db_query_duration_seconds", "SQL statement execution time", ("operation",), FAST_BUCKETS,
+))
+db_query_errors = registry.register(Counter(
+    "db_query_errors_total", "SQL statements that raised", ("operation",),
+))
+db_pool_checkout_wait = registry.register(Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection", (), FAST_BUCKETS,
+))
+db_pool_in_use = registry.register(Gauge(
+    "db_pool_connections_in_use", "Connections currently checked out of the pool",
+))
+upstream_duration = registry.register(Histogram(
+    "upstream_request_duration_seconds", "Latency of calls to external services",
+    ("service", "operation"), UPSTREAM_BUCKETS,
+))
+upstream_errors = registry.register(Counter(
+    "upstream_errors_total", "Failed calls to external services", ("service", "operation", "error"),
+))
+event_loop_lag = registry.register(Histogram(
+    "event_loop_lag_seconds", "Delay between a scheduled wakeup and when the event loop ran it",
+    (), FAST_BUCKETS,
+))
+event_loop_lag_max = registry.register(Gauge(
+    "event_loop_lag_max_seconds", "Largest event loop lag since the last scrape",
+))
+
+
+class RecentPeak:
+    """最近的峰值，按半衰期指数衰减（负载保护读取它判断当前是否过载）"""
+
+    def __init__(self, half_life: float):
+        self.half_life = half_life
+        self._value = 0.0
+        self._at = time.monotonic()
+
+    def update(self, value: float) -> None:
+        now = time.monotonic()
+        self._value = max(value, self._decayed(now))
+        self._at = now
+
+    def _decayed(self, now: float) -> float:
+        return self._value * 0.5 ** ((now - self._at) / self.half_life)
+
+    def value(self) -> float:
+        return self._decayed(time.monotonic())
+
+
+loop_lag_recent = RecentPeak(half_life=2.0)
+pool_wait_recent = RecentPeak(half_life=2.0)
+
+
+class MetricsMiddleware:
+    """纯 ASGI 中间件，记录每个 HTTP 请求的延迟
+
+    路由标签用路由模板（如 /api/bars/get/{bar_address}），没有匹配到路由的请求
+    归到 "unmatched"，避免标签基数随 URL 无限增长。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_progress.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_progress.dec()
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            http_request_duration.observe(
+                time.perf_counter() - started, scope["method"], route_path, str(status)
+            )
+
+
+def _operation(statement: str) -> str:
+    head = statement.lstrip().split(None, 1)
+    return head[0].upper() if head else "UNKNOWN"
+
+
+def instrument_engine(sync_engine) -> None:
+    """挂上 SQLAlchemy 引擎和连接池事件（异步引擎传 engine.sync_engine）"""
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        db_query_duration.observe(time.perf_counter() - started, _operation(statement))
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _handle_error(context):
+        stack = context.connection.info.get("query_started") if context.connection is not None else None
+        if stack:
+            stack.pop()
+        db_query_errors.inc(_operation(context.statement or ""))
+
+    @event.listens_for(sync_engine.pool, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        db_pool_in_use.inc()
+
+    @event.listens_for(sync_engine.pool, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        db_pool_in_use.dec()
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """记录从连接池取连接的等待时间（包括池满时的排队和新建连接）"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            db_pool_checkout_wait.observe(waited)
+            pool_wait_recent.update(waited)
+
+
+def track_call(service: str, operation: str):
+    """装饰器：记录外部调用的延迟，抛出异常时按异常类型计入错误数（同步、异步函数都可以）"""
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    upstream_errors.inc(service, operation, type(e).__name__)
+                    raise
+                finally:
+                    upstream_duration.observe(time.perf_counter() - started, service, operation)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                upstream_errors.inc(service, operation, type(e).__name__)
+                raise
+            finally:
+                upstream_duration.observe(time.perf_counter() - started, service, operation)
+        return wrapper
+
+    return decorator
+
+
+_loop_lag_task: Optional[asyncio.Task] = None
+_loop_lag_peak = 0.0
+
+
+async def _monitor_loop_lag() -> None:
+    global _loop_lag_peak
+    while True:
+        scheduled = time.perf_counter() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(0.0, time.perf_counter() - scheduled)
+        event_loop_lag.observe(lag)
+        loop_lag_recent.update(lag)
+        _loop_lag_peak = max(_loop_lag_peak, lag)
+
+
+def start_loop_lag_monitor() -> None:
+    """在事件循环里启动延迟监测（重复调用无副作用）"""
+    global _loop_lag_task
+    if _loop_lag_task is None or _loop_lag_task.done():
+        _loop_lag_task = asyncio.create_task(_monitor_loop_lag())
+
+
+def render_metrics() -> str:
+    """抓取时调用：输出所有指标，并重置"自上次抓取以来"的峰值"""
+    global _loop_lag_peak
+    event_loop_lag_max.set(_loop_lag_peak)
+    _loop_lag_peak = 0.0
+    return registry.render()
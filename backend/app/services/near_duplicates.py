@@ -0,0 +1,232 @@
+"""近似重复 recipe 检测（MinHash + LSH）
+
+有人把别人的配方改几个字重新铸造。和整个目录两两比较是 O(n²)，这里用 MinHash 把每个
+配方（规范化后的 cocktail_recipe）压成 NUM_PERM 个整数的签名：两个签名对应位置相等的
+比例，是两段文字的字符 shingle 集合 Jaccard 相似度的无偏估计。签名切成 BANDS 段、每段
+ROWS 个数，任意一段完全相同的两个配方就落进同一个桶（LSH）：
+
+- 查询只和落在同一个桶里的候选比较签名，耗时和目录大小基本无关
+- 相似度为 s 的一对成为候选的概率是 1 - (1 - s^ROWS)^BANDS：20 段 × 6 行时 s = 0.7 约
+  92%，s = 0.8 以上几乎一定命中，s = 0.3 只有 1.5%；配方里常见的套话（"shake with ice"）
+  让不相关的配方也有一部分 shingle 相同，每段行数多一些才不会让候选太多
+- shingle 用 9 个字符：不相关配方的相似度大多在 0.1 以下，改一个数字的复制品在 0.8 以上
+- 新 recipe 提交后增量加入；启动时全量构建，其它 worker 写入后按 id 刷新
+"""
+import asyncio
+import re
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.config import NEAR_DUPLICATE_MAX_RESULTS, NEAR_DUPLICATE_THRESHOLD
+from app.models.recipe import Recipe
+from app.services.autocomplete import normalize
+
+NUM_PERM = 120
+BANDS = 20
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 9
+_PRIME = (1 << 32) + 15  # 大于 2^32 的最小素数
+_WORD = re.compile(r"[^\W_]+")
+
+_hash_functions = None
+
+
+def _parameters():
+    """NUM_PERM 个哈希函数 (a·x + b) mod p 的 a、b；固定种子，重启后签名不变"""
+    global _hash_functions
+    if _hash_functions is None:
+        import numpy as np
+
+        rng = np.random.default_rng(6551)
+        _hash_functions = (
+            rng.integers(1, 1 << 32, NUM_PERM, dtype=np.uint64),
+            rng.integers(0, 1 << 32, NUM_PERM, dtype=np.uint64),
+        )
+    return _hash_functions
+
+
+def recipe_text(cocktail_recipe: Optional[str]) -> str:
+    """忽略大小写、重音、标点和空白的差异"""
+    return " ".join(_WORD.findall(normalize(cocktail_recipe or "")))
+
+
+def shingles(text: str) -> List[int]:
+    """长度为 SHINGLE_SIZE 的字符片段（去重后的 crc32）"""
+    if len(text) <= SHINGLE_SIZE:
+        return [zlib.crc32(text.encode())] if text else []
+    return list({zlib.crc32(text[i:i + SHINGLE_SIZE].encode()) for i in range(len(text) - SHINGLE_SIZE + 1)})
+
+
+def signature(cocktail_recipe: Optional[str]):
+    """MinHash 签名（长度 NUM_PERM 的 uint64 数组）；没有内容时返回 None"""
+    import numpy as np
+
+    hashed = shingles(recipe_text(cocktail_recipe))
+    if not hashed:
+        return None
+    a, b = _parameters()
+    values = np.asarray(hashed, dtype=np.uint64)
+    # a、x 都小于 2^32：a·x + b 不会溢出 uint64，模一个 32 位的素数才能把乘积充分打散
+    return ((np.outer(values, a) + b) % np.uint64(_PRIME)).min(axis=0)
+
+
+def _band_keys(sig) -> List[bytes]:
+    raw = sig.tobytes()
+    width = len(raw) // BANDS
+    return [raw[i * width:(i + 1) * width] for i in range(BANDS)]
+
+
+class NearDuplicateIndex:
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self._signatures: Dict[int, object] = {}                  # recipe id -> 签名
+        self._recipes: Dict[int, Tuple[str, str, str]] = {}       # recipe id -> (地址, 名字, 创建者)
+        self._buckets: List[Dict[bytes, set]] = [{} for _ in range(BANDS)]
+        # 全量重建期间到达的增量，重建完成后补上
+        self._replay: Optional[List[Tuple]] = None
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    # ---- 写入 ----
+    def add(self, recipe_id: int, recipe_address: str, cocktail_name: str,
+            owner_address: Optional[str], cocktail_recipe: Optional[str]) -> None:
+        """新增或更新一个 recipe（配方内容变了会换桶）"""
+        if self._replay is not None:
+            self._replay.append((recipe_id, recipe_address, cocktail_name, owner_address, cocktail_recipe))
+        self._remove(recipe_id)
+        sig = signature(cocktail_recipe)
+        if sig is None:
+            return
+        self._signatures[recipe_id] = sig
+        self._recipes[recipe_id] = (recipe_address, cocktail_name, owner_address)
+        for band, key in enumerate(_band_keys(sig)):
+            self._buckets[band].setdefault(key, set()).add(recipe_id)
+
+    def _remove(self, recipe_id: int) -> None:
+        sig = self._signatures.pop(recipe_id, None)
+        if sig is None:
+            return
+        del self._recipes[recipe_id]
+        for band, key in enumerate(_band_keys(sig)):
+            members = self._buckets[band].get(key)
+            if members is not None:
+                members.discard(recipe_id)
+                if not members:
+                    del self._buckets[band][key]
+
+    # ---- 查询 ----
+    def _describe(self, recipe_id: int, similarity: float) -> Dict:
+        recipe_address, cocktail_name, owner_address = self._recipes[recipe_id]
+        return {
+            "recipe_address": recipe_address,
+            "cocktail_name": cocktail_name,
+            "owner_address": owner_address,
+            "similarity": round(similarity, 3),
+        }
+
+    def _similarities(self, sig, recipe_ids: List[int]):
+        """签名对应位置相等的比例（估计的 Jaccard 相似度），一次算一批"""
+        import numpy as np
+
+        return (np.stack([self._signatures[recipe_id] for recipe_id in recipe_ids]) == sig).mean(axis=1)
+
+    def find(self, cocktail_recipe: Optional[str], exclude_address: Optional[str] = None,
+             limit: int = NEAR_DUPLICATE_MAX_RESULTS) -> List[Dict]:
+        """和这段配方近似重复的已有 recipe，相似度从高到低"""
+        sig = signature(cocktail_recipe)
+        if sig is None:
+            return []
+        candidates = [
+            recipe_id for recipe_id in self._candidates(sig) if self._recipes[recipe_id][0] != exclude_address
+        ]
+        if not candidates:
+            return []
+        scored = [
+            (float(score), recipe_id)
+            for score, recipe_id in zip(self._similarities(sig, candidates), candidates)
+            if score >= self.threshold
+        ]
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [self._describe(recipe_id, score) for score, recipe_id in scored[:limit]]
+
+    def _candidates(self, sig) -> set:
+        candidates = set()
+        for band, key in enumerate(_band_keys(sig)):
+            candidates.update(self._buckets[band].get(key, ()))
+        return candidates
+
+    def clusters(self, limit: int = 100) -> Dict:
+        """全目录的近似重复簇，大的在前。按提交顺序（id）扫描，还没归簇的 recipe 当作原作，
+        和它相似度过阈值、也还没归簇的候选都算它的复制品；不做传递合并，免得一串
+        "每步都像" 的配方连成一个大簇"""
+        assigned = set()
+        found = []
+        for original in sorted(self._signatures):
+            if original in assigned:
+                continue
+            sig = self._signatures[original]
+            candidates = sorted(self._candidates(sig) - assigned - {original})
+            if not candidates:
+                continue
+            copies = [
+                (recipe_id, float(score))
+                for recipe_id, score in zip(candidates, self._similarities(sig, candidates))
+                if score >= self.threshold
+            ]
+            if not copies:
+                continue
+            assigned.update(recipe_id for recipe_id, _ in copies)
+            found.append({
+                "size": len(copies) + 1,
+                "owners": len({self._recipes[recipe_id][2] for recipe_id in (original, *(c for c, _ in copies))}),
+                "original": self._describe(original, 1.0),
+                "copies": [self._describe(recipe_id, score) for recipe_id, score in copies],
+            })
+        found.sort(key=lambda cluster: -cluster["size"])
+        return {"total": len(found), "clusters": found[:limit]}
+
+    def stats(self) -> Dict:
+        return {
+            "recipes": len(self._signatures),
+            "buckets": sum(len(buckets) for buckets in self._buckets),
+            "threshold": self.threshold,
+        }
+
+    # ---- 构建 ----
+    def build(self, rows: Iterable[Tuple]) -> None:
+        """用 (id, 地址, 名字, 创建者, 配方) 全量构建"""
+        for row in rows:
+            self.add(*row)
+
+    async def refresh(self, db, recipe_ids: Iterable[int]) -> None:
+        """重新读取指定的 recipes（其它 worker 写入后调用）"""
+        recipe_ids = set(recipe_ids)
+        if not recipe_ids:
+            return
+        result = await db.execute(
+            select(Recipe.id, Recipe.recipe_address, Recipe.cocktail_name, Recipe.owner_address, Recipe.cocktail_recipe)
+            .where(Recipe.id.in_(recipe_ids))
+        )
+        for row in result:
+            self.add(*row)
+
+    async def rebuild(self, db) -> None:
+        """启动时全量构建；签名计算放在线程里，不阻塞事件循环"""
+        self._replay = []
+        rows = (await db.execute(
+            select(Recipe.id, Recipe.recipe_address, Recipe.cocktail_name, Recipe.owner_address, Recipe.cocktail_recipe)
+        )).all()
+        fresh = NearDuplicateIndex(self.threshold)
+        try:
+            await asyncio.to_thread(fresh.build, rows)
+        finally:
+            replay, self._replay = self._replay, None
+        self.__dict__.update(fresh.__dict__)
+        for row in replay:
+            self.add(*row)
+
+
+near_duplicate_index = NearDuplicateIndex()
@@ -0,0 +1,236 @@
+"""事务性发件箱的写入和后台发送
+
+写接口调用 enqueue()，和业务数据在同一个事务里写入一条 outbox 记录，HTTP 请求不用
+等链上 / IPFS 的确认。后台 dispatcher 循环：
+1. 用 FOR UPDATE SKIP LOCKED 领取一批到期的条目（多 worker 时互不重复），标记为
+   in_flight 并设置租约，领取的事务马上提交，发送期间不占着行锁；
+2. 同一个 key 只发送最新的一条，旧的标记为 superseded（enqueue 时也会把同一 key
+   还没发送的旧条目标记掉）；
+3. 有限并发地发送，成功标记 done，失败按指数退避 + 抖动重试，超过次数标记 failed。
+
+租约过期还没完成的 in_flight 条目（worker 中途挂掉）会被重新领取。
+"""
+import asyncio
+import random
+import time
+from datetime import timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import orjson
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import (
+    OUTBOX_BACKOFF_BASE,
+    OUTBOX_BACKOFF_MAX,
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_CONCURRENCY,
+    OUTBOX_LEASE_SECONDS,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_POLL_INTERVAL,
+)
+from app.models.outbox import DONE, FAILED, IN_FLIGHT, PENDING, SUPERSEDED, OutboxEntry
+from app.services.metrics import Counter, Gauge, registry
+
+BAR_PROFILE_SYNC = "bar_profile_sync"
+
+outbox_backlog = registry.register(Gauge(
+    "outbox_backlog", "Outbox entries by status", ("status",),
+))
+outbox_oldest_pending_age = registry.register(Gauge(
+    "outbox_oldest_pending_age_seconds", "Age of the oldest pending outbox entry",
+))
+outbox_dispatched = registry.register(Counter(
+    "outbox_dispatched_total", "Outbox entries processed by the dispatcher", ("topic", "outcome"),
+))
+
+
+async def enqueue(db: AsyncSession, topic: str, key: str, payload: Dict) -> None:
+    """在调用方的事务里加入一条待发送记录（不 commit），同一 key 还没发送的旧记录作废"""
+    await db.execute(
+        update(OutboxEntry)
+        .where(OutboxEntry.topic == topic, OutboxEntry.aggregate_key == key, OutboxEntry.status == PENDING)
+        .values(status=SUPERSEDED)
+    )
+    db.add(OutboxEntry(topic=topic, aggregate_key=key, payload=orjson.dumps(payload).decode(), status=PENDING))
+
+
+async def latest_status(db: AsyncSession, topic: str, key: str) -> Optional[Dict]:
+    """某个 key 最新一条记录的发送状态，加上最近一次发送成功的结果；没有记录时返回 None"""
+    base = select(OutboxEntry).where(OutboxEntry.topic == topic, OutboxEntry.aggregate_key == key)
+    latest = (await db.execute(base.order_by(OutboxEntry.id.desc()).limit(1))).scalar_one_or_none()
+    if latest is None:
+        return None
+    done = latest if latest.status == DONE else (await db.execute(
+        base.where(OutboxEntry.status == DONE).order_by(OutboxEntry.id.desc()).limit(1)
+    )).scalar_one_or_none()
+    return {
+        "status": latest.status,
+        "attempts": latest.attempts,
+        "last_error": latest.last_error,
+        "result": orjson.loads(done.result) if done is not None and done.result else None,
+        "completed_at": done.updated_at.isoformat() if done is not None and done.updated_at else None,
+    }
+
+
+async def _sync_bar_profile(payload: Dict) -> Dict:
+    """把酒吧资料的新元数据 pin 到 IPFS，返回新的 metadata CID
+
+    链上 tokenURI 只能由 ID NFT 的持有者用自己的钱包更新，后端没有签名私钥，
+    所以这里产出新的 CID，由前端在持有者确认后上链。
+    """
+    from app.services.ipfs import upload_bar_to_pinata
+
+    cid = await asyncio.to_thread(
+        upload_bar_to_pinata,
+        payload["bar_photo_cid"],
+        payload["bar_name"],
+        payload["bar_location"],
+        payload["bar_intro"],
+    )
+    return {"metadata_cid": cid}
+
+
+HANDLERS: Dict[str, Callable[[Dict], Awaitable[Dict]]] = {
+    BAR_PROFILE_SYNC: _sync_bar_profile,
+}
+
+
+def _backoff(attempts: int) -> float:
+    delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class OutboxDispatcher:
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self._task = None
+
+    async def _claim(self) -> List[OutboxEntry]:
+        now = func.now()
+        async with self.session_factory() as db:
+            claimable = (
+                select(OutboxEntry.id)
+                .where(or_(
+                    (OutboxEntry.status == PENDING) & (OutboxEntry.next_attempt_at <= now),
+                    (OutboxEntry.status == IN_FLIGHT) & (OutboxEntry.lease_until < now),
+                ))
+                .order_by(OutboxEntry.id)
+                .limit(OUTBOX_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            )
+            result = await db.execute(
+                update(OutboxEntry)
+                .where(OutboxEntry.id.in_(claimable.scalar_subquery()))
+                .values(
+                    status=IN_FLIGHT,
+                    attempts=OutboxEntry.attempts + 1,
+                    lease_until=now + timedelta(seconds=OUTBOX_LEASE_SECONDS),
+                )
+                .returning(OutboxEntry)
+                .execution_options(synchronize_session=False)
+            )
+            entries = list(result.scalars())
+            await db.commit()
+        return entries
+
+    async def _finish(self, entry_id: int, **values) -> None:
+        async with self.session_factory() as db:
+            await db.execute(
+                update(OutboxEntry)
+                .where(OutboxEntry.id == entry_id, OutboxEntry.status == IN_FLIGHT)
+                .values(lease_until=None, **values)
+            )
+            await db.commit()
+
+    async def _dispatch(self, entry: OutboxEntry) -> None:
+        handler = HANDLERS.get(entry.topic)
+        try:
+            if handler is None:
+                raise ValueError(f"No handler for outbox topic {entry.topic}")
+            result = await handler(orjson.loads(entry.payload))
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            if entry.attempts >= OUTBOX_MAX_ATTEMPTS:
+                outbox_dispatched.inc(entry.topic, "failed")
+                await self._finish(entry.id, status=FAILED, last_error=error)
+            else:
+                outbox_dispatched.inc(entry.topic, "retry")
+                await self._finish(
+                    entry.id,
+                    status=PENDING,
+                    last_error=error,
+                    next_attempt_at=func.now() + timedelta(seconds=_backoff(entry.attempts)),
+                )
+            return
+        outbox_dispatched.inc(entry.topic, "done")
+        await self._finish(entry.id, status=DONE, last_error=None, result=orjson.dumps(result).decode())
+
+    async def run_once(self) -> int:
+        """领取并发送一批，返回领取到的条数"""
+        entries = await self._claim()
+        if not entries:
+            return 0
+
+        # 同一个 key 只发最新的一条
+        latest: Dict[tuple, OutboxEntry] = {}
+        for entry in entries:
+            key = (entry.topic, entry.aggregate_key)
+            if key not in latest or entry.id > latest[key].id:
+                latest[key] = entry
+        for entry in entries:
+            if latest[(entry.topic, entry.aggregate_key)] is not entry:
+                outbox_dispatched.inc(entry.topic, "superseded")
+                await self._finish(entry.id, status=SUPERSEDED)
+
+        semaphore = asyncio.Semaphore(OUTBOX_CONCURRENCY)
+
+        async def dispatch(entry):
+            async with semaphore:
+                await self._dispatch(entry)
+
+        await asyncio.gather(*(dispatch(entry) for entry in latest.values()))
+        return len(entries)
+
+    async def stats(self) -> Dict:
+        """积压情况：各状态条数和最老的待发送条目的等待时间"""
+        async with self.session_factory() as db:
+            counts = dict((await db.execute(
+                select(OutboxEntry.status, func.count()).group_by(OutboxEntry.status)
+            )).all())
+            oldest = (await db.execute(
+                select(func.extract("epoch", func.now() - func.min(OutboxEntry.created_at)))
+                .where(OutboxEntry.status.in_([PENDING, IN_FLIGHT]))
+            )).scalar()
+        for status in (PENDING, IN_FLIGHT, DONE, SUPERSEDED, FAILED):
+            outbox_backlog.set(counts.get(status, 0), status)
+        outbox_oldest_pending_age.set(float(oldest or 0))
+        return {"counts": counts, "oldest_pending_age_seconds": float(oldest or 0)}
+
+    async def _run_forever(self) -> None:
+        last_stats = 0.0
+        while True:
+            try:
+                claimed = await self.run_once()
+                if time.monotonic() - last_stats > 15:
+                    await self.stats()
+                    last_stats = time.monotonic()
+            except Exception as e:
+                print(f"⚠️  Warning: outbox dispatcher failed: {str(e)}")
+                claimed = 0
+            # 一批领满了说明可能还有积压，马上继续
+            if claimed < OUTBOX_BATCH_SIZE:
+                await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+    def start(self) -> None:
+        """在事件循环里启动后台发送（重复调用无副作用）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_forever())
+
+
+def _session_factory():
+    from app.db.session import AsyncSessionLocal
+    return AsyncSessionLocal()
+
+
+outbox_dispatcher = OutboxDispatcher(_session_factory)
@@ -0,0 +1,193 @@
+"""recipe 价格历史
+
+上架、改价、成交都往 recipe_price_points 追加一行（原始序列，只追加不修改），并在
+同一个事务里把这个价格并进小时 / 天 / 周三个粒度的 recipe_price_rollups：一条
+INSERT ... ON CONFLICT DO UPDATE 同时写三行，min / max 用 LEAST / GREATEST，合计值直接
+相加，并发写入同一个区间也不会丢更新。
+
+图表接口只读 rollup 表：一年的日线是按主键读 365 行，和原始成交有多少行无关；
+时间范围没指定粒度时自动选一个，让返回的区间数保持在几百个以内。
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import ARRAY, Float, case, delete, func, insert, literal, select, text
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.config import PRICE_HISTORY_MAX_BUCKETS
+from app.models.price_history import DAY, HOUR, SALE, WEEK, RecipePricePoint, RecipePriceRollup
+from app.models.recipe import Recipe
+from app.models.transaction import Transaction
+
+GRANULARITIES = (HOUR, DAY, WEEK)
+
+
+def naive_utc(timestamp: datetime) -> datetime:
+    """库里的时间列不带时区（和 transactions.timestamp 一致），带时区的先换成 UTC"""
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """和 Postgres 的 date_trunc 一致：周从周一开始"""
+    if granularity == HOUR:
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    day = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == DAY:
+        return day
+    return day - timedelta(days=day.weekday())
+
+
+def pick_granularity(since: datetime, until: datetime) -> str:
+    span = until - since
+    if span <= timedelta(days=14):
+        return HOUR      # 最多 336 个区间
+    if span <= timedelta(days=730):
+        return DAY       # 最多 730 个
+    return WEEK
+
+
+async def record_price(
+    db,
+    recipe_address: str,
+    kind: str,
+    price: Optional[float],
+    timestamp: Optional[datetime] = None,
+    buyer: Optional[str] = None,
+) -> None:
+    """在调用方的事务里追加一个价格点并更新三个粒度的 rollup（不 commit）；没有价格时什么也不做"""
+    if price is None:
+        return
+    price = float(price)
+    at = naive_utc(timestamp or datetime.now(timezone.utc))
+    sale = kind == SALE
+
+    await db.execute(insert(RecipePricePoint).values(
+        recipe_address=recipe_address, kind=kind, price=price, buyer=buyer, timestamp=at,
+    ))
+
+    stmt = pg_insert(RecipePriceRollup).values([
+        {
+            "recipe_address": recipe_address,
+            "granularity": granularity,
+            "bucket_start": bucket_start(at, granularity),
+            "price_min": price,
+            "price_max": price,
+            "price_sum": price,
+            "points": 1,
+            "price_last": price,
+            "last_at": at,
+            "sales": 1 if sale else 0,
+            "sales_value": price if sale else 0.0,
+        }
+        for granularity in GRANULARITIES
+    ])
+    rollup, new = RecipePriceRollup.__table__.c, stmt.excluded
+    # 迟到的价格点（时间更早）不覆盖 price_last
+    newer = new.last_at >= rollup.last_at
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[rollup.recipe_address, rollup.granularity, rollup.bucket_start],
+        set_={
+            "price_min": func.least(rollup.price_min, new.price_min),
+            "price_max": func.greatest(rollup.price_max, new.price_max),
+            "price_sum": rollup.price_sum + new.price_sum,
+            "points": rollup.points + new.points,
+            "price_last": case((newer, new.price_last), else_=rollup.price_last),
+            "last_at": case((newer, new.last_at), else_=rollup.last_at),
+            "sales": rollup.sales + new.sales,
+            "sales_value": rollup.sales_value + new.sales_value,
+        },
+    ))
+
+
+async def price_series(
+    db,
+    recipe_address: str,
+    granularity: str,
+    since: datetime,
+    until: datetime,
+) -> List[Dict]:
+    """[since, until] 内的区间，按时间升序；超过 PRICE_HISTORY_MAX_BUCKETS 个时只返回最近的"""
+    since, until = naive_utc(since), naive_utc(until)
+    rows = (await db.execute(
+        select(RecipePriceRollup)
+        .where(
+            RecipePriceRollup.recipe_address == recipe_address,
+            RecipePriceRollup.granularity == granularity,
+            RecipePriceRollup.bucket_start >= bucket_start(since, granularity),
+            RecipePriceRollup.bucket_start <= until,
+        )
+        .order_by(RecipePriceRollup.bucket_start.desc())
+        .limit(PRICE_HISTORY_MAX_BUCKETS)
+    )).scalars().all()
+    return [
+        {
+            "start": row.bucket_start.isoformat(),
+            "min": row.price_min,
+            "max": row.price_max,
+            "avg": row.price_sum / row.points,
+            "last": row.price_last,
+            "points": row.points,
+            "sales": row.sales,
+            "sales_value": row.sales_value,
+        }
+        for row in reversed(rows)
+    ]
+
+
+async def backfill_sales(db) -> int:
+    """价格历史还是空的时候，用已有的成交（按 recipe 当前的标价）补出原始序列；返回补了多少行"""
+    if (await db.execute(select(RecipePricePoint.id).limit(1))).first() is not None:
+        return 0
+    prices = (
+        select(Recipe.recipe_address, func.max(Recipe.price).label("price"))
+        .where(Recipe.price.is_not(None))
+        .group_by(Recipe.recipe_address)
+        .subquery()
+    )
+    result = await db.execute(insert(RecipePricePoint).from_select(
+        ["recipe_address", "kind", "price", "buyer", "timestamp"],
+        select(Transaction.recipe_address, literal(SALE), prices.c.price, Transaction.buyer, Transaction.timestamp)
+        .join(prices, prices.c.recipe_address == Transaction.recipe_address),
+    ))
+    return result.rowcount or 0
+
+
+async def rebuild_rollups(db) -> int:
+    """从原始序列整体重算 rollup 表（在数据库里聚合，不把原始行读到进程里）；返回写入的行数
+
+    重算期间锁住 rollup 表：并发的 record_price 会等到这个事务提交后再把自己的点并进去，
+    既不会被 DELETE 抹掉也不会算两遍。
+    """
+    await db.execute(text(f"LOCK TABLE {RecipePriceRollup.__tablename__} IN EXCLUSIVE MODE"))
+    await db.execute(delete(RecipePriceRollup))
+    points = RecipePricePoint
+    is_sale = points.kind == SALE
+    written = 0
+    for granularity in GRANULARITIES:
+        bucket = func.date_trunc(granularity, points.timestamp)
+        last_price = func.array_agg(
+            aggregate_order_by(points.price, points.timestamp.desc()), type_=ARRAY(Float)
+        )[1]
+        result = await db.execute(insert(RecipePriceRollup).from_select(
+            ["recipe_address", "granularity", "bucket_start", "price_min", "price_max", "price_sum", "points",
+             "price_last", "last_at", "sales", "sales_value"],
+            select(
+                points.recipe_address, literal(granularity), bucket,
+                func.min(points.price), func.max(points.price), func.sum(points.price), func.count(),
+                last_price, func.max(points.timestamp),
+                func.count().filter(is_sale), func.coalesce(func.sum(points.price).filter(is_sale), 0.0),
+            ).group_by(points.recipe_address, bucket),
+        ))
+        written += result.rowcount or 0
+    return written
+
+
+async def rebuild_price_history(db) -> Dict:
+    """补齐原始序列（只在为空时）并重算 rollup，然后提交"""
+    backfilled = await backfill_sales(db)
+    rollups = await rebuild_rollups(db)
+    await db.commit()
+    return {"backfilled_points": backfilled, "rollups": rollups}
@@ -0,0 +1,101 @@
+"""按需的请求剖析
+
+请求头 X-Profile-Token 等于 PROFILE_TOKEN，或者按 PROFILE_SAMPLE_RATE 随机抽中的请求，
+会用 pyinstrument 的 async 模式剖析整个请求（await 数据库、HTTP 的等待时间也记在
+调用栈上）。结果放在有界的环形缓冲区里，通过 /api/admin/profiles 以 speedscope
+格式下载（https://www.speedscope.app 可以直接打开）。
+
+没有命中的请求只多一次随机数判断；没装 pyinstrument 时中间件直接透传。
+"""
+import hmac
+import random
+import time
+import uuid
+from collections import deque
+from typing import Dict, List, Optional
+
+from app.config import PROFILE_BUFFER_SIZE, PROFILE_INTERVAL, PROFILE_SAMPLE_RATE, PROFILE_TOKEN
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import HTMLRenderer, SpeedscopeRenderer
+except ImportError:
+    Profiler = None
+
+PROFILE_HEADER = b"x-profile-token"
+
+
+class ProfileStore:
+    """最近的剖析结果，超出容量时丢弃最旧的"""
+
+    def __init__(self, max_profiles: int):
+        self._profiles: deque = deque(maxlen=max_profiles)
+
+    def add(self, profile: Dict) -> None:
+        self._profiles.append(profile)
+
+    def list(self) -> List[Dict]:
+        return [{k: v for k, v in p.items() if k != "session"} for p in reversed(self._profiles)]
+
+    def get(self, profile_id: str) -> Optional[Dict]:
+        for profile in self._profiles:
+            if profile["id"] == profile_id:
+                return profile
+        return None
+
+
+profile_store = ProfileStore(PROFILE_BUFFER_SIZE)
+
+
+def render_profile(profile: Dict, fmt: str = "speedscope") -> str:
+    renderer = HTMLRenderer() if fmt == "html" else SpeedscopeRenderer()
+    return renderer.render(profile["session"])
+
+
+def _wants_profile(scope) -> bool:
+    if PROFILE_TOKEN:
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return hmac.compare_digest(value, PROFILE_TOKEN.encode())
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class ProfilingMiddleware:
+    """纯 ASGI 中间件，被选中的请求在响应头里带 X-Profile-Id"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if Profiler is None or scope["type"] != "http" or not _wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+        started_at = time.time()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            session = profiler.stop()
+            route = scope.get("route")
+            profile_store.add({
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(route, "path", None),
+                "status": status,
+                "duration_seconds": round(session.duration, 4),
+                "started_at": started_at,
+                "session": session,
+            })
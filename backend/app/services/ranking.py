@@ -0,0 +1,250 @@
+"""交易网络上的酒吧排名
+
+transactions 里每笔成交是一条 buyer → seller 的边（买方授权了卖方创建的 recipe），
+同一对酒吧的多笔成交合并成一条带权重的边，存成 SciPy 的 CSR 稀疏矩阵。
+
+- 影响力：PageRank，向量化的幂迭代（每轮一次稀疏矩阵乘向量），没有出边的
+  酒吧把分数均匀分给所有酒吧
+- 社区：在无向化的图上做标签传播，每轮用稀疏矩阵一次算出每个酒吧邻居里
+  各标签的权重和，取权重最大的标签；每轮随机更新一半节点，避免标签来回震荡
+
+计算在线程里进行，不阻塞事件循环；多 worker 时用 Postgres advisory lock 保证同一
+时间只有一个 worker 在算，结果整体写进 bar_rankings 表，各 worker 的接口直接读表。
+百万条边的图整个计算在几秒以内。
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, insert, select, text
+
+from app.config import RANKING_DAMPING, RANKING_INTERVAL
+from app.models.bar_ranking import BarRanking
+from app.models.transaction import Transaction
+from app.services.metrics import Gauge, Histogram, registry
+
+# pg_try_advisory_lock 的键
+RANKING_LOCK_KEY = 0x0B4C_2A4B
+INSERT_BATCH_SIZE = 5000
+
+ranking_duration = registry.register(Histogram(
+    "ranking_compute_seconds", "Time to recompute bar rankings", ("stage",),
+))
+ranking_graph_size = registry.register(Gauge(
+    "ranking_graph_size", "Size of the last trade graph ranked", ("kind",),
+))
+
+
+@dataclass
+class RankingResult:
+    bars: List[str]
+    pagerank: "object"          # numpy 数组，下同
+    community: "object"
+    community_size: "object"
+    sold: "object"
+    bought: "object"
+    iterations: int
+    edges: int
+
+
+def pagerank(adjacency, damping: float = RANKING_DAMPING, tol: float = 1e-9, max_iter: int = 100):
+    """adjacency[i, j] 是 i → j 的边权重；返回 (分数, 迭代次数)，分数之和为 1"""
+    import numpy as np
+    from scipy import sparse
+
+    n = adjacency.shape[0]
+    out_weight = np.asarray(adjacency.sum(axis=1)).ravel()
+    dangling = out_weight == 0
+    inverse = np.divide(1.0, out_weight, out=np.zeros(n), where=~dangling)
+    # 按行归一化后转置，每轮只需要 transition @ x
+    transition = (sparse.diags(inverse) @ adjacency).T.tocsr()
+
+    scores = np.full(n, 1.0 / n)
+    for iteration in range(1, max_iter + 1):
+        updated = damping * (transition @ scores + scores[dangling].sum() / n) + (1 - damping) / n
+        delta = np.abs(updated - scores).sum()
+        scores = updated
+        if delta < n * tol:
+            break
+    return scores / scores.sum(), iteration
+
+
+def label_propagation(adjacency, max_iter: int = 50, seed: int = 0):
+    """无向化后的标签传播；返回每个节点的社区编号，按社区大小从 0 开始编号"""
+    import numpy as np
+    from scipy import sparse
+
+    n = adjacency.shape[0]
+    undirected = (adjacency + adjacency.T).tocsr()
+    rows = np.repeat(np.arange(n), np.diff(undirected.indptr))
+    neighbors, weights = undirected.indices, undirected.data.astype(np.float64)
+    # 自环权重取该节点最大边权重的一半：和邻居打平时保留自己的标签
+    self_weight = np.maximum(undirected.max(axis=1).toarray().ravel() * 0.5, 0.5)
+
+    rng = np.random.default_rng(seed)
+    labels = np.arange(n)
+    for _ in range(max_iter):
+        votes = sparse.csr_matrix(
+            (np.concatenate([weights, self_weight]),
+             (np.concatenate([rows, np.arange(n)]), np.concatenate([labels[neighbors], labels]))),
+            shape=(n, n),
+        )
+        votes.sum_duplicates()  # 每行内按标签排好序
+        # 每行取权重最大的标签，打平时取编号最小的（比 csr.argmax 的逐行循环快得多）
+        starts = votes.indptr[:-1]
+        row_max = np.maximum.reduceat(votes.data, starts)
+        is_max = votes.data == np.repeat(row_max, np.diff(votes.indptr))
+        positions = np.where(is_max, np.arange(len(votes.data)), len(votes.data))
+        updated = votes.indices[np.minimum.reduceat(positions, starts)]
+        wants_change = updated != labels
+        if np.count_nonzero(wants_change) <= n // 1000:
+            break
+        # 每轮随机只更新一半节点：全部同时更新时二分结构上的标签会来回交换
+        labels = np.where(wants_change & (rng.random(n) < 0.5), updated, labels)
+
+    _, inverse, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+    order = np.argsort(-sizes, kind="stable")
+    renumber = np.empty_like(order)
+    renumber[order] = np.arange(len(order))
+    community = renumber[inverse]
+    return community, sizes[order][community]
+
+
+def compute_rankings(buyers: List[str], sellers: List[str], counts: List[int]) -> Optional[RankingResult]:
+    """按 (buyer, seller, 成交数) 三列计算排名；没有边时返回 None"""
+    import numpy as np
+    from scipy import sparse
+
+    if not buyers:
+        return None
+    started = time.perf_counter()
+    # 地址编码成连续的整数（dict 比 np.unique 对字符串排序快）
+    ids: Dict[str, int] = {}
+    source = np.fromiter((ids.setdefault(bar, len(ids)) for bar in buyers), dtype=np.int64, count=len(buyers))
+    target = np.fromiter((ids.setdefault(bar, len(ids)) for bar in sellers), dtype=np.int64, count=len(sellers))
+    bars = list(ids)
+    weight = np.asarray(counts, dtype=np.float64)
+    n = len(bars)
+    # 自己买自己的边不算
+    keep = source != target
+    adjacency = sparse.csr_matrix((weight[keep], (source[keep], target[keep])), shape=(n, n))
+    sold = np.bincount(target, weights=weight, minlength=n).astype(np.int64)
+    bought = np.bincount(source, weights=weight, minlength=n).astype(np.int64)
+    ranking_duration.observe(time.perf_counter() - started, "graph")
+
+    started = time.perf_counter()
+    scores, iterations = pagerank(adjacency)
+    ranking_duration.observe(time.perf_counter() - started, "pagerank")
+
+    started = time.perf_counter()
+    community, community_size = label_propagation(adjacency)
+    ranking_duration.observe(time.perf_counter() - started, "communities")
+
+    ranking_graph_size.set(n, "bars")
+    ranking_graph_size.set(adjacency.nnz, "edges")
+    return RankingResult(bars, scores, community, community_size, sold, bought, iterations, adjacency.nnz)
+
+
+class RankingJob:
+    def __init__(self, session_factory, interval: float = RANKING_INTERVAL):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._task = None
+        self.last_run: Optional[Dict] = None
+
+    async def _is_fresh(self, db) -> bool:
+        latest = (await db.execute(
+            select(func.extract("epoch", func.now() - func.max(BarRanking.computed_at)))
+        )).scalar()
+        return latest is not None and float(latest) < self.interval
+
+    async def run_once(self, force: bool = False) -> Optional[Dict]:
+        """重算并保存排名；别的 worker 正在算或结果还新鲜（force=False 时）返回 None"""
+        from app.db.session import engine
+
+        async with engine.connect() as lock_conn:
+            locked = (await lock_conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": RANKING_LOCK_KEY}
+            )).scalar()
+            await lock_conn.commit()
+            if not locked:
+                return None
+            try:
+                return await self._recompute(force)
+            finally:
+                await lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": RANKING_LOCK_KEY})
+                await lock_conn.commit()
+
+    async def _recompute(self, force: bool) -> Optional[Dict]:
+        started = time.perf_counter()
+        async with self.session_factory() as db:
+            if not force and await self._is_fresh(db):
+                return None
+            # 在数据库里先按酒吧对聚合，传过来的行数等于边数而不是成交数
+            rows = (await db.execute(
+                select(Transaction.buyer, Transaction.seller, func.count())
+                .group_by(Transaction.buyer, Transaction.seller)
+            )).all()
+        buyers = [row[0] for row in rows]
+        sellers = [row[1] for row in rows]
+        counts = [row[2] for row in rows]
+        del rows
+
+        result = await asyncio.to_thread(compute_rankings, buyers, sellers, counts)
+
+        started_write = time.perf_counter()
+        async with self.session_factory() as db:
+            await db.execute(delete(BarRanking))
+            if result is not None:
+                order = (-result.pagerank).argsort(kind="stable")
+                position = order.argsort()
+                values = [
+                    {
+                        "bar_address": bar,
+                        "pagerank": float(result.pagerank[i]),
+                        "rank": int(position[i]) + 1,
+                        "community": int(result.community[i]),
+                        "community_size": int(result.community_size[i]),
+                        "licenses_sold": int(result.sold[i]),
+                        "licenses_bought": int(result.bought[i]),
+                    }
+                    for i, bar in enumerate(result.bars)
+                ]
+                for start in range(0, len(values), INSERT_BATCH_SIZE):
+                    await db.execute(insert(BarRanking), values[start:start + INSERT_BATCH_SIZE])
+            from app.services.invalidation import invalidation_bus
+            await invalidation_bus.publish(db, ["rankings"])
+            await db.commit()
+        ranking_duration.observe(time.perf_counter() - started_write, "write")
+
+        self.last_run = {
+            "bars": len(result.bars) if result else 0,
+            "edges": result.edges if result else 0,
+            "communities": int(result.community.max()) + 1 if result else 0,
+            "pagerank_iterations": result.iterations if result else 0,
+            "seconds": round(time.perf_counter() - started, 3),
+            "finished_at": time.time(),
+        }
+        return self.last_run
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"⚠️  Warning: bar ranking job failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """在事件循环里启动定时重算（重复调用无副作用）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_forever())
+
+
+def _session_factory():
+    from app.db.session import AsyncSessionLocal
+    return AsyncSessionLocal()
+
+
+ranking_job = RankingJob(_session_factory)
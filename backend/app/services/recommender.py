@@ -0,0 +1,240 @@
+"""基于共同授权的 recipe 推荐
+
+信号：一个酒吧授权过（transactions 里的 buyer，或 Bar.used_recipes 里的）哪些
+recipe。把它看成 酒吧 × recipe 的 0/1 稀疏矩阵 A，recipe 之间的共现次数就是
+C = AᵀA（SciPy 稀疏矩阵乘法），相似度用余弦 C_ij / sqrt(n_i · n_j)，n_i 是授权过
+recipe i 的酒吧数。
+
+- 启动时全量构建 C，并为每个 recipe 预先算好最相似的 RECOMMENDER_NEIGHBORS 个，
+  查询 "授权了这个 recipe 的酒吧还授权了" 只是一次字典查找
+- 新成交时增量更新：共现增量先记在 _delta 里，只重算受影响的行（和这个 recipe 共现过
+  的所有 recipe，它们的余弦分母变了）的相似列表，增量攒到 RECOMMENDER_FOLD_THRESHOLD
+  条时合并进 C
+- "为你推荐" 用酒吧已授权的 recipe 的相似列表加权求和，没有授权记录的酒吧
+  退化为按热门程度推荐
+"""
+import asyncio
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import orjson
+from sqlalchemy import select
+
+from app.config import RECOMMENDER_FOLD_THRESHOLD, RECOMMENDER_NEIGHBORS
+from app.models.bar import Bar
+from app.models.transaction import Transaction
+
+
+class CoLicenseRecommender:
+    def __init__(self, neighbors: int = RECOMMENDER_NEIGHBORS):
+        self.neighbors = neighbors
+        self._item_ids: Dict[str, int] = {}
+        self._items: List[str] = []
+        self._counts: List[int] = []                  # n_i
+        self._bar_items: Dict[str, Set[int]] = {}
+        self._cooc = None                             # scipy.sparse.csr_matrix，只包含已合并的部分
+        self._delta: Dict[int, Dict[int, int]] = defaultdict(dict)
+        self._delta_size = 0
+        self._similar: Dict[int, List[Tuple[int, float]]] = {}
+        self._popular: List[int] = []
+        # 全量重建期间到达的增量，重建完成后补上
+        self._replay: Optional[List[Tuple[str, str]]] = None
+
+    def _item_id(self, recipe_address: str) -> int:
+        item = self._item_ids.get(recipe_address)
+        if item is None:
+            item = self._item_ids[recipe_address] = len(self._items)
+            self._items.append(recipe_address)
+            self._counts.append(0)
+        return item
+
+    # ---- 全量构建 ----
+    def build(self, licenses: Iterable[Tuple[str, str]]) -> None:
+        """用 (酒吧地址, recipe 地址) 对全量构建"""
+        import numpy as np
+        from scipy import sparse
+
+        self.__init__(self.neighbors)
+        bar_ids: Dict[str, int] = {}
+        for bar_address, recipe_address in licenses:
+            if not bar_address or not recipe_address:
+                continue
+            items = self._bar_items.setdefault(bar_address, set())
+            item = self._item_id(recipe_address)
+            if item not in items:
+                items.add(item)
+                bar_ids.setdefault(bar_address, len(bar_ids))
+        if not self._items:
+            return
+
+        rows = np.fromiter(
+            (bar_ids[bar] for bar, items in self._bar_items.items() for _ in items), dtype=np.int32,
+        )
+        cols = np.fromiter(
+            (item for items in self._bar_items.values() for item in items), dtype=np.int32,
+        )
+        incidence = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(len(bar_ids), len(self._items)),
+        )
+        cooc = (incidence.T @ incidence).tocsr()
+        counts = cooc.diagonal().astype(np.int64)
+        cooc.setdiag(0)
+        cooc.eliminate_zeros()
+        self._cooc = cooc
+        self._counts = counts.tolist()
+
+        # 每一行按余弦相似度取前 neighbors 个
+        norms = np.sqrt(np.maximum(counts, 1).astype(np.float64))
+        for item in range(cooc.shape[0]):
+            start, end = cooc.indptr[item], cooc.indptr[item + 1]
+            if start == end:
+                continue
+            self._similar[item] = self._top(cooc.indices[start:end], cooc.data[start:end], norms, item)
+        self._refresh_popular()
+
+    def _top(self, columns, values, norms, item: int) -> List[Tuple[int, float]]:
+        import numpy as np
+
+        scores = values / (norms[columns] * norms[item])
+        if len(scores) > self.neighbors:
+            keep = np.argpartition(-scores, self.neighbors - 1)[:self.neighbors]
+            columns, scores = columns[keep], scores[keep]
+        order = np.lexsort((columns, -scores))
+        return [(int(columns[i]), float(scores[i])) for i in order]
+
+    def _refresh_popular(self) -> None:
+        import numpy as np
+
+        counts = np.asarray(self._counts)
+        top = np.arange(len(counts))
+        if len(counts) > self.neighbors:
+            top = np.argpartition(-counts, self.neighbors - 1)[:self.neighbors]
+        top = top[np.lexsort((top, -counts[top]))]
+        self._popular = [int(i) for i in top if counts[i] > 0]
+
+    # ---- 增量更新 ----
+    def add(self, bar_address: str, recipe_address: str) -> None:
+        """一个酒吧新授权了一个 recipe（提交后调用，重复调用无副作用）"""
+        import numpy as np
+
+        if self._replay is not None:
+            self._replay.append((bar_address, recipe_address))
+        items = self._bar_items.setdefault(bar_address, set())
+        item = self._item_id(recipe_address)
+        if item in items:
+            return
+        for other in items:
+            self._delta[item][other] = self._delta[item].get(other, 0) + 1
+            self._delta[other][item] = self._delta[other].get(item, 0) + 1
+            self._delta_size += 2
+        self._counts[item] += 1
+        items.add(item)
+
+        # n_item 变了：和 item 共现过的每个 recipe 的相似度分母都变了（不只是这个酒吧的），
+        # 共现矩阵是对称的，这些 recipe 就是 item 这一行里的列
+        norms = np.sqrt(np.maximum(np.asarray(self._counts), 1).astype(np.float64))
+        columns, values = self._row(item)
+        if len(columns):
+            self._similar[item] = self._top(columns, values, norms, item)
+        for row in columns.tolist():
+            row_columns, row_values = self._row(row)
+            self._similar[row] = self._top(row_columns, row_values, norms, row)
+        self._refresh_popular()
+
+        if self._delta_size >= RECOMMENDER_FOLD_THRESHOLD:
+            self._fold()
+
+    def _row(self, item: int):
+        """合并后的共现行：C 里的部分加上 _delta 里的增量"""
+        import numpy as np
+
+        merged: Dict[int, float] = {}
+        if self._cooc is not None and item < self._cooc.shape[0]:
+            start, end = self._cooc.indptr[item], self._cooc.indptr[item + 1]
+            merged = dict(zip(self._cooc.indices[start:end].tolist(), self._cooc.data[start:end].tolist()))
+        for other, count in self._delta.get(item, {}).items():
+            merged[other] = merged.get(other, 0) + count
+        return np.fromiter(merged.keys(), dtype=np.int32), np.fromiter(merged.values(), dtype=np.float64)
+
+    def _fold(self) -> None:
+        """把增量合并进 C（相似列表在增量更新时已经算过，不用重算）"""
+        import numpy as np
+        from scipy import sparse
+
+        size = len(self._items)
+        rows, cols, data = [], [], []
+        for row, columns in self._delta.items():
+            for col, count in columns.items():
+                rows.append(row)
+                cols.append(col)
+                data.append(count)
+        delta = sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32), (rows, cols)), shape=(size, size),
+        )
+        if self._cooc is None:
+            self._cooc = delta
+        else:
+            base = self._cooc
+            base.resize((size, size))
+            self._cooc = (base + delta).tocsr()
+        self._delta.clear()
+        self._delta_size = 0
+
+    # ---- 查询 ----
+    def similar(self, recipe_address: str, limit: int) -> List[Tuple[str, float]]:
+        """授权了这个 recipe 的酒吧还授权了哪些，按相似度排序"""
+        item = self._item_ids.get(recipe_address)
+        if item is None:
+            return []
+        return [(self._items[other], score) for other, score in self._similar.get(item, ())[:limit]]
+
+    def recommend(self, bar_address: str, limit: int, exclude: Iterable[str] = ()) -> List[Tuple[str, float]]:
+        """为酒吧推荐还没授权过的 recipe；没有授权记录时按热门程度推荐"""
+        owned = self._bar_items.get(bar_address, set())
+        excluded = owned | {self._item_ids[a] for a in exclude if a in self._item_ids}
+        scores: Dict[int, float] = defaultdict(float)
+        for item in owned:
+            for other, score in self._similar.get(item, ()):
+                if other not in excluded:
+                    scores[other] += score
+        if not scores:
+            top_count = max((self._counts[i] for i in self._popular), default=1)
+            return [
+                (self._items[i], self._counts[i] / top_count) for i in self._popular if i not in excluded
+            ][:limit]
+        ranked = sorted(scores.items(), key=lambda pair: (-pair[1], pair[0]))[:limit]
+        return [(self._items[item], score) for item, score in ranked]
+
+    def stats(self) -> Dict:
+        return {
+            "recipes": len(self._items),
+            "bars": len(self._bar_items),
+            "cooccurrences": int(self._cooc.nnz) if self._cooc is not None else 0,
+            "pending_delta": self._delta_size,
+        }
+
+    async def rebuild(self, db) -> None:
+        """从 transactions 和 Bar.used_recipes 全量构建；矩阵运算放在线程里，不阻塞事件循环"""
+        self._replay = []
+        licenses = list((await db.execute(
+            select(Transaction.buyer, Transaction.recipe_address).distinct()
+        )).all())
+        result = await db.execute(select(Bar.bar_address, Bar.used_recipes))
+        for bar_address, used_recipes in result:
+            try:
+                used = orjson.loads(used_recipes) if used_recipes else []
+            except orjson.JSONDecodeError:
+                continue
+            licenses.extend((bar_address, recipe_address) for recipe_address in used)
+
+        fresh = CoLicenseRecommender(self.neighbors)
+        try:
+            await asyncio.to_thread(fresh.build, licenses)
+        finally:
+            replay, self._replay = self._replay, None
+        self.__dict__.update(fresh.__dict__)
+        for bar_address, recipe_address in replay:
+            self.add(bar_address, recipe_address)
+
+
+recommender = CoLicenseRecommender()
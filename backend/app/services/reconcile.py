@@ -0,0 +1,439 @@
+"""链上元数据对账
+
+recipes / bars 每行记着写入时用的 metadata_cid。持有者在链上调用 RecipeNFT.updateTokenURI
+（或更新 ID NFT 的元数据）之后，库里的数据就过期了。对账任务定期：
+
+1. 按 id 分页读出 (id, token_id, metadata_cid)；酒吧没有 token_id 时先用
+   IDNFT.getTokenIdByAddress(bar_address) 查出来并记下
+2. 把 tokenURI(tokenId) 调用打包成 JSON-RPC 批量请求（一个 HTTP 请求里
+   RECONCILE_RPC_BATCH 个 eth_call），最多 RECONCILE_CONCURRENCY 个请求同时进行
+3. 只有 CID 变了的行才从 IPFS 重新拉取元数据（同样有限并发）
+4. 每页的更新用一条 executemany 的 UPDATE 写回，和缓存失效消息一起提交
+
+十万行的目录大约是一千个 RPC 请求，几分钟内就能全部核对一遍。多 worker 时用
+advisory lock 保证同一时间只有一个 worker 在跑，每轮的结果记在 metadata_reconcile_runs 表里。
+RPC 或 IPFS 失败的行不更新，下一轮再试。
+"""
+import asyncio
+import time
+from collections import Counter as Tally
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import orjson
+from sqlalchemy import func, insert, select, text, update
+
+from app.config import (
+    CHAIN_RPC_URL,
+    ID_NFT_ADDRESS,
+    RECIPE_NFT_ADDRESS,
+    RECONCILE_CONCURRENCY,
+    RECONCILE_INTERVAL,
+    RECONCILE_PAGE_SIZE,
+    RECONCILE_RPC_BATCH,
+)
+from app.models.bar import Bar
+from app.models.metadata_reconcile import MetadataReconcileRun
+from app.models.recipe import Recipe
+from app.services.metrics import Counter, registry, track_call
+
+# pg_try_advisory_lock 的键
+RECONCILE_LOCK_KEY = 0x0B4C_3C1D
+# 函数选择器：keccak256(签名) 的前 4 字节
+TOKEN_URI_SELECTOR = "0xc87b56dd"             # tokenURI(uint256)
+TOKEN_ID_BY_ADDRESS_SELECTOR = "0x8cbab7e4"   # getTokenIdByAddress(address)
+# pg_notify 的 payload 上限是 8000 字节，失效消息按这么多行一条分开发
+NOTIFY_CHUNK = 100
+
+reconcile_rows = registry.register(Counter(
+    "metadata_reconcile_rows_total", "Rows examined by the metadata reconciliation job", ("kind", "outcome"),
+))
+
+
+class RpcError(Exception):
+    """整个 JSON-RPC 请求失败（单个 eth_call 失败不算，对应位置返回 None）"""
+
+
+# ---- ABI 编解码（只需要 uint256 / address 参数和 uint256 / string 返回值）----
+def encode_uint(value: int) -> str:
+    return format(value, "064x")
+
+
+def encode_address(address: str) -> str:
+    raw = address.lower().removeprefix("0x")
+    if len(raw) != 40 or any(ch not in "0123456789abcdef" for ch in raw):
+        raise ValueError(f"Not an EVM address: {address}")
+    return raw.rjust(64, "0")
+
+
+def decode_uint(result: str) -> int:
+    raw = result.removeprefix("0x")
+    return int(raw, 16) if raw else 0
+
+
+def decode_string(result: str) -> str:
+    data = bytes.fromhex(result.removeprefix("0x"))
+    if len(data) < 64:
+        raise ValueError("ABI string result too short")
+    offset = int.from_bytes(data[:32], "big")
+    length = int.from_bytes(data[offset:offset + 32], "big")
+    return data[offset + 32:offset + 32 + length].decode("utf-8")
+
+
+def metadata_cid_from_uri(uri: str) -> Optional[str]:
+    """ipfs://<cid>、<网关>/ipfs/<cid> 或裸 CID -> fetch_metadata_from_ipfs 能用的 CID（可能带路径）"""
+    uri = uri.strip()
+    if uri.startswith("ipfs://"):
+        rest = uri[len("ipfs://"):].removeprefix("ipfs/")
+    elif "/ipfs/" in uri:
+        rest = uri.split("/ipfs/", 1)[1]
+    elif "://" in uri:
+        return None  # 不是 IPFS 上的元数据
+    else:
+        rest = uri
+    rest = rest.split("?", 1)[0].split("#", 1)[0].strip("/")
+    return rest or None
+
+
+# ---- 元数据 -> 列值（和 store_recipe / set_bar 的解析方式一致）----
+def bar_token_id(bar_address: Optional[str]) -> Optional[int]:
+    """全是数字的 bar_address 是 ID NFT 的 tokenId（create-idnft 页面拿不到账户地址时的写法）；
+    超出 token_id 列（BIGINT）范围的不认"""
+    if bar_address and bar_address.isascii() and bar_address.isdigit() and 0 < int(bar_address) < 1 << 63:
+        return int(bar_address)
+    return None
+
+
+def recipe_values(document: Dict) -> Dict:
+    item = document["metadata"]
+    if not item.get("cocktail_name"):
+        raise ValueError("metadata has no cocktail_name")
+    return {
+        "cocktail_name": item["cocktail_name"],
+        "cocktail_intro": item.get("cocktail_intro"),
+        "cocktail_photo": item["cocktail_photo"],
+        "cocktail_recipe": item.get("cocktail_recipe"),
+    }
+
+
+def bar_values(document: Dict) -> Dict:
+    item = document["metadata"]
+    if not item.get("barName") or not item.get("barLocation"):
+        raise ValueError("metadata has no barName / barLocation")
+    values = {
+        "bar_name": item["barName"],
+        "bar_location": item["barLocation"],
+        "bar_intro": item.get("barIntro", ""),
+        "bar_photo": item.get("barPhoto", "").replace("ipfs://", ""),
+    }
+    # 坐标是可选字段，旧的元数据里没有时保留库里的值
+    if item.get("barLatitude") is not None and item.get("barLongitude") is not None:
+        values["latitude"] = float(item["barLatitude"])
+        values["longitude"] = float(item["barLongitude"])
+    return values
+
+
+class ChainRpc:
+    def __init__(self, url: str, client=None):
+        self.url = url
+        self._http = client
+
+    def _client(self):
+        if self._http is None:
+            import httpx
+            self._http = httpx.AsyncClient(timeout=20.0)
+        return self._http
+
+    @track_call("chain_rpc", "eth_call_batch")
+    async def eth_call_batch(self, calls: List[Tuple[str, str]]) -> List[Optional[str]]:
+        """一个 HTTP 请求里发出多个 eth_call (合约地址, calldata)；单个调用 revert 时对应位置是 None"""
+        payload = [
+            {"jsonrpc": "2.0", "id": i, "method": "eth_call", "params": [{"to": to, "data": data}, "latest"]}
+            for i, (to, data) in enumerate(calls)
+        ]
+        response = await self._client().post(
+            self.url, content=orjson.dumps(payload), headers={"Content-Type": "application/json"}
+        )
+        response.raise_for_status()
+        body = orjson.loads(response.content)
+        if not isinstance(body, list):
+            # 整个批量请求被拒绝，例如超过了节点的批量上限
+            error = body.get("error") if isinstance(body, dict) else None
+            raise RpcError((error or {}).get("message", "Invalid JSON-RPC batch response"))
+        results: List[Optional[str]] = [None] * len(calls)
+        for item in body:
+            index = item.get("id")
+            if isinstance(index, int) and 0 <= index < len(calls) and isinstance(item.get("result"), str):
+                results[index] = item["result"]
+        return results
+
+
+class MetadataReconciler:
+    def __init__(self, session_factory, rpc: Optional[ChainRpc] = None, interval: float = RECONCILE_INTERVAL):
+        self.session_factory = session_factory
+        self.rpc = rpc or (ChainRpc(CHAIN_RPC_URL) if CHAIN_RPC_URL else None)
+        self.interval = interval
+        self._slots = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+        self._task = None
+        self.last_run: Optional[Dict] = None
+
+    @property
+    def configured(self) -> bool:
+        return self.rpc is not None and bool(RECIPE_NFT_ADDRESS or ID_NFT_ADDRESS)
+
+    async def _is_fresh(self, db) -> bool:
+        latest = (await db.execute(
+            select(func.extract("epoch", func.now() - func.max(MetadataReconcileRun.finished_at)))
+        )).scalar()
+        return latest is not None and float(latest) < self.interval
+
+    async def run_once(self, force: bool = False) -> Optional[Dict]:
+        """核对一遍整个目录；别的 worker 正在跑或上一轮还新鲜（force=False 时）返回 None"""
+        from app.db.session import engine
+
+        async with engine.connect() as lock_conn:
+            locked = (await lock_conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": RECONCILE_LOCK_KEY}
+            )).scalar()
+            await lock_conn.commit()
+            if not locked:
+                return None
+            try:
+                if not force:
+                    async with self.session_factory() as db:
+                        if await self._is_fresh(db):
+                            return None
+                return await self.reconcile()
+            finally:
+                await lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": RECONCILE_LOCK_KEY})
+                await lock_conn.commit()
+
+    async def reconcile(self) -> Dict:
+        started = time.perf_counter()
+        tally: Tally = Tally()
+        if RECIPE_NFT_ADDRESS:
+            await self._reconcile_recipes(tally)
+        if ID_NFT_ADDRESS:
+            await self._reconcile_bars(tally)
+
+        summary = {
+            "checked": tally["checked"],
+            "changed": tally["changed"],
+            "failed": tally["failed"],
+            "untracked": tally["untracked"],
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        async with self.session_factory() as db:
+            await db.execute(insert(MetadataReconcileRun).values(**{**summary, "seconds": int(summary["seconds"])}))
+            await db.commit()
+        self.last_run = {**summary, "finished_at": time.time()}
+        return self.last_run
+
+    # ---- 分页、并发 ----
+    async def _pages(self, model, *columns):
+        """按 id 分页（keyset），每页单独一个短会话，不长时间占着连接"""
+        last_id = 0
+        while True:
+            async with self.session_factory() as db:
+                rows = (await db.execute(
+                    select(model.id, *columns).where(model.id > last_id).order_by(model.id).limit(RECONCILE_PAGE_SIZE)
+                )).all()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1].id
+
+    async def _call_all(self, contract: str, calldata: List[str]) -> List[Optional[str]]:
+        """分成 RECONCILE_RPC_BATCH 个一组的批量请求并发发出；失败的那组全部是 None"""
+        async def call_chunk(start: int) -> List[Optional[str]]:
+            chunk = calldata[start:start + RECONCILE_RPC_BATCH]
+            async with self._slots:
+                try:
+                    return await self.rpc.eth_call_batch([(contract, data) for data in chunk])
+                except Exception as e:
+                    print(f"⚠️  Warning: metadata reconcile RPC batch failed: {str(e)}")
+                    return [None] * len(chunk)
+
+        chunks = await asyncio.gather(*(call_chunk(start) for start in range(0, len(calldata), RECONCILE_RPC_BATCH)))
+        return [result for chunk in chunks for result in chunk]
+
+    async def _fetch_all(self, cids: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        from app.services.ipfs import fetch_metadata_from_ipfs
+
+        async def fetch(cid: str) -> Tuple[str, Optional[Dict]]:
+            async with self._slots:
+                try:
+                    return cid, await asyncio.to_thread(fetch_metadata_from_ipfs, cid)
+                except Exception:
+                    return cid, None
+
+        return dict(await asyncio.gather(*(fetch(cid) for cid in cids)))
+
+    async def _changed_rows(self, kind: str, contract: str, tracked: List[Tuple[object, int]],
+                            tally: Tally) -> List[Tuple[object, str]]:
+        """tracked 是 (行, token_id)；查出链上当前的 CID，返回 CID 和库里不一样的 (行, 新 CID)"""
+        uris = await self._call_all(contract, [TOKEN_URI_SELECTOR + encode_uint(token_id) for _, token_id in tracked])
+        changed = []
+        for (row, _), result in zip(tracked, uris):
+            try:
+                cid = metadata_cid_from_uri(decode_string(result)) if result else None
+            except (ValueError, UnicodeDecodeError):
+                cid = None
+            if cid is None:
+                tally["failed"] += 1
+                reconcile_rows.inc(kind, "failed")
+                continue
+            tally["checked"] += 1
+            if cid != row.metadata_cid:
+                changed.append((row, cid))
+            else:
+                reconcile_rows.inc(kind, "unchanged")
+        return changed
+
+    async def _values_for(self, kind: str, changed: List[Tuple[object, str]], parse, tally: Tally) -> List[Dict]:
+        documents = await self._fetch_all({cid for _, cid in changed})
+        values = []
+        for row, cid in changed:
+            try:
+                values.append({"id": row.id, "metadata_cid": cid, **parse(documents[cid])})
+            except (KeyError, TypeError, ValueError):
+                tally["failed"] += 1
+                reconcile_rows.inc(kind, "failed")
+                continue
+            tally["changed"] += 1
+            reconcile_rows.inc(kind, "changed")
+        return values
+
+    # ---- recipes ----
+    async def _reconcile_recipes(self, tally: Tally) -> None:
+        async for rows in self._pages(Recipe, Recipe.token_id, Recipe.metadata_cid):
+            tracked = [(row, row.token_id) for row in rows if row.token_id is not None]
+            tally["untracked"] += len(rows) - len(tracked)
+            changed = await self._changed_rows("recipe", RECIPE_NFT_ADDRESS, tracked, tally)
+            if changed:
+                values = await self._values_for("recipe", changed, recipe_values, tally)
+                if values:
+                    await self._apply_recipes(values)
+
+    async def _apply_recipes(self, values: List[Dict]) -> None:
+        from app.services.autocomplete import autocomplete_index
+        from app.services.invalidation import invalidation_bus
+        from app.services.near_duplicates import near_duplicate_index
+        from app.services.retrieval import catalog_index
+
+        ids = [value["id"] for value in values]
+        async with self.session_factory() as db:
+            # 按主键的批量 UPDATE：一条语句 executemany
+            await db.execute(update(Recipe), values)
+            for start in range(0, len(ids), NOTIFY_CHUNK):
+                await invalidation_bus.publish(db, ["recipes"], recipe_ids=ids[start:start + NOTIFY_CHUNK])
+            await db.commit()
+            rows = (await db.execute(
+                select(Recipe.id, Recipe.recipe_address, Recipe.cocktail_name, Recipe.cocktail_intro,
+                       Recipe.price, Recipe.owner_address, Recipe.cocktail_recipe).where(Recipe.id.in_(ids))
+            )).all()
+        for row in rows:
+            catalog_index.index_recipe(row.id, row.cocktail_name, row.cocktail_intro, row.recipe_address, row.price)
+            autocomplete_index.add_recipe(row.recipe_address, row.cocktail_name, row.owner_address)
+            near_duplicate_index.add(
+                row.id, row.recipe_address, row.cocktail_name, row.owner_address, row.cocktail_recipe
+            )
+
+    # ---- bars ----
+    async def _reconcile_bars(self, tally: Tally) -> None:
+        async for rows in self._pages(Bar, Bar.bar_address, Bar.token_id, Bar.metadata_cid):
+            # 还不知道 token_id 的酒吧先从链上按地址查（0 表示没有 ID NFT）
+            resolved: Dict[int, int] = {}
+            unknown = []
+            for row in rows:
+                if row.token_id is not None:
+                    continue
+                token_id = bar_token_id(row.bar_address)
+                if token_id is not None:
+                    # 前端在拿不到 ERC-6551 地址时把十进制 tokenId 当 bar_address 传上来
+                    resolved[row.id] = token_id
+                    continue
+                try:
+                    unknown.append((row, TOKEN_ID_BY_ADDRESS_SELECTOR + encode_address(row.bar_address)))
+                except ValueError:
+                    print(f"⚠️  Warning: bar {row.bar_address!r} is neither an address nor a token id, skipping")
+            if unknown:
+                results = await self._call_all(ID_NFT_ADDRESS, [data for _, data in unknown])
+                for (row, _), result in zip(unknown, results):
+                    token_id = decode_uint(result) if result else 0
+                    if token_id:
+                        resolved[row.id] = token_id
+
+            tracked = [
+                (row, row.token_id if row.token_id is not None else resolved[row.id])
+                for row in rows if row.token_id is not None or row.id in resolved
+            ]
+            tally["untracked"] += len(rows) - len(tracked)
+
+            changed = await self._changed_rows("bar", ID_NFT_ADDRESS, tracked, tally)
+            values = await self._values_for("bar", changed, bar_values, tally) if changed else []
+            # CID 没变但刚查到 token_id 的行也要记下，下一轮不用再查
+            updated = {value["id"] for value in values}
+            for value in values:
+                if value["id"] in resolved:
+                    value["token_id"] = resolved[value["id"]]
+            token_only = [{"id": row_id, "token_id": token_id}
+                          for row_id, token_id in resolved.items() if row_id not in updated]
+            if values or token_only:
+                await self._apply_bars(values, token_only)
+
+    async def _apply_bars(self, values: List[Dict], token_only: List[Dict]) -> None:
+        from app.services.autocomplete import autocomplete_index
+        from app.services.geo import geo_index
+        from app.services.invalidation import invalidation_bus
+        from app.services.retrieval import catalog_index
+
+        ids = [value["id"] for value in values]
+        async with self.session_factory() as db:
+            if token_only:
+                await db.execute(update(Bar), token_only)
+            if not values:
+                await db.commit()
+                return
+            # 有的行带坐标、有的不带，按列集合分组，每组一条 executemany
+            groups: Dict[Tuple[str, ...], List[Dict]] = {}
+            for value in values:
+                groups.setdefault(tuple(sorted(value)), []).append(value)
+            for group in groups.values():
+                await db.execute(update(Bar), group)
+            rows = (await db.execute(
+                select(Bar.bar_address, Bar.bar_name, Bar.bar_location, Bar.bar_intro, Bar.latitude, Bar.longitude)
+                .where(Bar.id.in_(ids))
+            )).all()
+            addresses = [row.bar_address for row in rows]
+            for start in range(0, len(addresses), NOTIFY_CHUNK):
+                await invalidation_bus.publish(db, ["bars"], bar_addresses=addresses[start:start + NOTIFY_CHUNK])
+            await db.commit()
+        for row in rows:
+            catalog_index.index_bar(row.bar_address, row.bar_name, row.bar_location, row.bar_intro)
+            geo_index.upsert(row.bar_address, row.latitude, row.longitude)
+            autocomplete_index.add_bar(row.bar_address, row.bar_name)
+
+    # ---- 定时 ----
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"⚠️  Warning: metadata reconcile failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """在事件循环里启动定时对账（没有配置 RPC / 合约地址时不启动，重复调用无副作用）"""
+        if not self.configured:
+            print("⚠️  Warning: CHAIN_RPC_URL or contract addresses not set, metadata reconcile disabled")
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_forever())
+
+
+def _session_factory():
+    from app.db.session import AsyncSessionLocal
+    return AsyncSessionLocal()
+
+
+metadata_reconciler = MetadataReconciler(_session_factory)
@@ -0,0 +1,236 @@
+"""进程内 BM25 检索索引
+
+给 /agent 提供本店数据（recipes 的 cocktail_name / cocktail_intro 和
+酒吧资料）作为参考资料，不依赖外部服务。
+
+倒排表按词项存放在 array.array 里：追加是 O(1)，查询时用
+np.frombuffer 零拷贝转成 NumPy 数组做向量化打分，所以写接口可以
+逐条增量更新，不需要重建整个矩阵。被替换的文档打墓碑标记，墓碑
+过多时整体压缩重建。
+"""
+import math
+import re
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.config import RETRIEVAL_TOP_K
+from app.models.bar import Bar
+from app.models.recipe import Recipe
+
+_LATIN = re.compile(r"[a-z0-9]+")
+_CJK_RUN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]+")
+_SNIPPET_LENGTH = 240
+
+
+def tokenize(text: str) -> List[str]:
+    """拉丁字母按单词切分，中文按单字 + 相邻二字切分"""
+    text = (text or "").lower()
+    tokens = _LATIN.findall(text)
+    for run in _CJK_RUN.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._vocab: Dict[str, int] = {}
+        self._post_docs: List[array] = []   # 每个词项的文档 id（int32）
+        self._post_tfs: List[array] = []    # 对应的词频（float32）
+        self._df = array("i")               # 每个词项出现在多少个有效文档里
+        self._doc_len = array("f")
+        self._alive = bytearray()
+        self._doc_terms: List[Optional[Dict[int, int]]] = []  # 每个文档的 {词项: 词频}
+        self._snippets: List[Optional[str]] = []
+        self._keys: Dict[str, int] = {}
+        self._total_len = 0.0
+        self._live = 0
+
+    def __len__(self) -> int:
+        return self._live
+
+    def upsert(self, key: str, text: str, snippet: str) -> None:
+        """新增或替换一个文档"""
+        self.remove(key)
+
+        counts: Dict[int, int] = {}
+        for token in tokenize(text):
+            term_id = self._vocab.get(token)
+            if term_id is None:
+                term_id = self._vocab[token] = len(self._vocab)
+                self._post_docs.append(array("i"))
+                self._post_tfs.append(array("f"))
+                self._df.append(0)
+            counts[term_id] = counts.get(term_id, 0) + 1
+        self._append(key, counts, snippet[:_SNIPPET_LENGTH])
+
+    def _append(self, key: str, counts: Dict[int, int], snippet: str) -> None:
+        doc_id = len(self._doc_len)
+        for term_id, tf in counts.items():
+            self._post_docs[term_id].append(doc_id)
+            self._post_tfs[term_id].append(tf)
+            self._df[term_id] += 1
+
+        length = sum(counts.values())
+        self._doc_len.append(length)
+        self._alive.append(1)
+        self._doc_terms.append(counts)
+        self._snippets.append(snippet)
+        self._keys[key] = doc_id
+        self._total_len += length
+        self._live += 1
+
+    def remove(self, key: str) -> None:
+        doc_id = self._keys.pop(key, None)
+        if doc_id is None:
+            return
+        self._alive[doc_id] = 0
+        for term_id in self._doc_terms[doc_id]:
+            self._df[term_id] -= 1
+        self._total_len -= self._doc_len[doc_id]
+        self._live -= 1
+        self._doc_terms[doc_id] = None
+        self._snippets[doc_id] = None
+
+        # 墓碑超过一半时压缩
+        dead = len(self._doc_len) - self._live
+        if dead > 1000 and dead > self._live:
+            self._compact()
+
+    def _compact(self) -> None:
+        """丢掉墓碑文档，按原顺序重放有效文档（词表保留）"""
+        live_docs = [(key, self._doc_terms[doc_id], self._snippets[doc_id]) for key, doc_id in self._keys.items()]
+        self._post_docs = [array("i") for _ in self._vocab]
+        self._post_tfs = [array("f") for _ in self._vocab]
+        self._df = array("i", bytes(4 * len(self._vocab)))
+        self._doc_len = array("f")
+        self._alive = bytearray()
+        self._doc_terms = []
+        self._snippets = []
+        self._keys = {}
+        self._total_len = 0.0
+        self._live = 0
+        for key, counts, snippet in live_docs:
+            self._append(key, counts, snippet)
+
+    def search(self, query: str, k: int = RETRIEVAL_TOP_K) -> List[Tuple[float, str]]:
+        """返回 [(score, snippet)]，按分数从高到低"""
+        if not self._live or k <= 0:
+            return []
+        import numpy as np  # 第一次检索时才导入，不拖慢启动
+        term_ids = {self._vocab[t] for t in tokenize(query) if t in self._vocab}
+        if not term_ids:
+            return []
+
+        n_docs = len(self._doc_len)
+        doc_len = np.frombuffer(self._doc_len, dtype=np.float32)
+        alive = np.frombuffer(self._alive, dtype=np.uint8)
+        avgdl = self._total_len / self._live
+        scores = np.zeros(n_docs, dtype=np.float32)
+
+        for term_id in term_ids:
+            df = self._df[term_id]
+            if df <= 0:
+                continue
+            docs = np.frombuffer(self._post_docs[term_id], dtype=np.int32)
+            tfs = np.frombuffer(self._post_tfs[term_id], dtype=np.float32)
+            idf = math.log(1.0 + (self._live - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * doc_len[docs] / avgdl)
+            # 每个文档在一个词项的倒排表里只出现一次，可以直接按下标累加
+            scores[docs] += idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+
+        scores *= alive
+        candidates = np.flatnonzero(scores)
+        if candidates.size > k:
+            candidates = candidates[np.argpartition(scores[candidates], -k)[-k:]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(float(scores[i]), self._snippets[i]) for i in ranked]
+
+
+def _recipe_text(name: str, intro: Optional[str]) -> str:
+    # 名字重复一次，提高名字命中的权重
+    return f"{name} {name} {intro or ''}"
+
+
+def _recipe_snippet(name: str, intro: Optional[str], recipe_address: str, price: Optional[float]) -> str:
+    price_text = f"，价格 {price}" if price is not None else ""
+    return f"[Recipe] {name}：{intro or ''}（地址 {recipe_address}{price_text}）"
+
+
+def _bar_text(name: str, location: str, intro: Optional[str]) -> str:
+    return f"{name} {name} {location} {intro or ''}"
+
+
+def _bar_snippet(name: str, location: str, intro: Optional[str], bar_address: str) -> str:
+    return f"[Bar] {name}，位于 {location}：{intro or ''}（地址 {bar_address}）"
+
+
+class CatalogIndex:
+    """recipes 和 bars 的检索索引，写接口提交后调用 index_recipe / index_bar"""
+
+    def __init__(self):
+        self.index = BM25Index()
+
+    def index_recipe(self, recipe_id: int, name: str, intro: Optional[str], recipe_address: str,
+                     price: Optional[float]) -> None:
+        self.index.upsert(
+            f"recipe:{recipe_id}",
+            _recipe_text(name, intro),
+            _recipe_snippet(name, intro, recipe_address, price),
+        )
+
+    def index_bar(self, bar_address: str, name: str, location: str, intro: Optional[str]) -> None:
+        self.index.upsert(
+            f"bar:{bar_address}",
+            _bar_text(name, location, intro),
+            _bar_snippet(name, location, intro, bar_address),
+        )
+
+    def search(self, query: str, k: int = RETRIEVAL_TOP_K) -> List[str]:
+        return [snippet for _, snippet in self.index.search(query, k)]
+
+    async def refresh(self, db, recipe_ids: Iterable[int] = (), bar_addresses: Iterable[str] = ()) -> None:
+        """重新读取指定的 recipes / bars（其它 worker 写入后调用），已删除的从索引里去掉"""
+        recipe_ids = set(recipe_ids)
+        if recipe_ids:
+            result = await db.execute(
+                select(Recipe.id, Recipe.cocktail_name, Recipe.cocktail_intro, Recipe.recipe_address, Recipe.price)
+                .where(Recipe.id.in_(recipe_ids))
+            )
+            for recipe_id, name, intro, recipe_address, price in result:
+                self.index_recipe(recipe_id, name, intro, recipe_address, price)
+                recipe_ids.discard(recipe_id)
+            for recipe_id in recipe_ids:
+                self.index.remove(f"recipe:{recipe_id}")
+
+        bar_addresses = set(bar_addresses)
+        if bar_addresses:
+            result = await db.execute(
+                select(Bar.bar_address, Bar.bar_name, Bar.bar_location, Bar.bar_intro)
+                .where(Bar.bar_address.in_(bar_addresses))
+            )
+            for bar_address, name, location, intro in result:
+                self.index_bar(bar_address, name, location, intro)
+                bar_addresses.discard(bar_address)
+            for bar_address in bar_addresses:
+                self.index.remove(f"bar:{bar_address}")
+
+    async def rebuild(self, db) -> None:
+        """启动时从数据库全量构建"""
+        self.index = BM25Index()
+        result = await db.execute(
+            select(Recipe.id, Recipe.cocktail_name, Recipe.cocktail_intro, Recipe.recipe_address, Recipe.price)
+        )
+        for recipe_id, name, intro, recipe_address, price in result:
+            self.index_recipe(recipe_id, name, intro, recipe_address, price)
+
+        result = await db.execute(select(Bar.bar_address, Bar.bar_name, Bar.bar_location, Bar.bar_intro))
+        for bar_address, name, location, intro in result:
+            self.index_bar(bar_address, name, location, intro)
+
+
+catalog_index = CatalogIndex()
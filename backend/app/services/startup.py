@@ -0,0 +1,58 @@
+"""启动耗时报告和就绪状态
+
+main.py 里每个 import 和初始化步骤都用 startup_report.step(...) 计时。
+重的初始化（数据库重置和假数据、检索索引、AI 客户端）放在后台预热任务里，
+进程启动后马上可以响应存活检查（/health/live），预热完成后 /health/ready 才返回 200。
+
+这个模块只依赖标准库，main.py 最先导入它。
+"""
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+_PROCESS_STARTED = time.perf_counter()
+
+
+class StartupReport:
+    def __init__(self):
+        self.steps: List[Dict] = []
+        self.ready = False
+        self.error: Optional[str] = None
+        self.ready_after: Optional[float] = None
+
+    @contextmanager
+    def step(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.steps.append({"step": name, "seconds": round(time.perf_counter() - started, 4), "error": str(e)})
+            raise
+        self.steps.append({"step": name, "seconds": round(time.perf_counter() - started, 4)})
+
+    def mark_ready(self) -> None:
+        self.ready = True
+        self.ready_after = round(time.perf_counter() - _PROCESS_STARTED, 4)
+
+    def mark_failed(self, error: str) -> None:
+        self.error = error
+
+    def summary(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "ready_after_seconds": self.ready_after,
+            "uptime_seconds": round(time.perf_counter() - _PROCESS_STARTED, 1),
+            "error": self.error,
+            "steps": self.steps,
+        }
+
+    def print_report(self) -> None:
+        print("⏱️  Startup report:")
+        for step in self.steps:
+            status = f"  ❌ {step['error']}" if "error" in step else ""
+            print(f"   {step['seconds'] * 1000:8.1f} ms  {step['step']}{status}")
+        if self.ready:
+            print(f"   ready {self.ready_after:.2f}s after process start")
+
+
+startup_report = StartupReport()
@@ -0,0 +1,158 @@
+"""目录类接口的 HTTP 条件请求支持
+
+每张表一个数据版本号，存在 Postgres 的 data_versions 表里：写接口在事务里调用
+invalidation_bus.publish()，它把相关表的版本号加一（和写入一起提交），提交后本进程
+立刻用上新版本，其它 worker 从 NOTIFY 消息里拿到同样的版本号。所有 worker 算出的
+ETag 一样，请求落到哪个 worker 都能命中 304。
+
+ETag / Last-Modified 直接由版本号推出，所以在查询数据库之前就能判断客户端缓存是否
+仍然有效。data_versions 不属于任何模型，reset_db 不会删它，重置后版本号继续往上加，
+旧 ETag 不会误命中。
+"""
+import hashlib
+import math
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Iterable, Optional, Sequence
+
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from app.utils.serialization import wants_msgpack
+
+TABLES = ("recipes", "bars", "transactions", "rankings")
+# 写事务里已经加过、等提交后生效的版本号（session.info 里的键）
+_STAGED = "data_versions"
+
+
+class DataVersions:
+    """按表记录的数据版本号和最后修改时间（本进程缓存的 data_versions 表）"""
+
+    def __init__(self):
+        # 数据库的标识（建表时随机生成）；还没从数据库读到时为 None，此时不发 ETag
+        self.epoch: Optional[str] = None
+        self._versions: Dict[str, int] = {}
+        self._modified: Dict[str, float] = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.epoch is not None
+
+    async def stage(self, db, tables: Iterable[str]) -> Dict[str, Sequence]:
+        """在写事务里调用（commit 之前）：数据库里的版本号加一，提交后本进程生效；
+        返回 {表: (版本号, 修改时间)}，由 NOTIFY 带给其它 worker"""
+        result = await db.execute(text(
+            "UPDATE data_versions SET version = version + 1, modified_at = clock_timestamp()"
+            " WHERE table_name = ANY(:tables)"
+            " RETURNING table_name, version, extract(epoch FROM modified_at)"
+        ), {"tables": list(tables)})
+        staged = {table: (version, float(modified)) for table, version, modified in result}
+        db.info.setdefault(_STAGED, {}).update(staged)
+        return staged
+
+    def apply(self, versions: Dict[str, Sequence]) -> None:
+        """用上新的版本号；消息可能乱序到达，版本号只进不退"""
+        for table, (version, modified) in versions.items():
+            if version > self._versions.get(table, 0):
+                self._versions[table] = version
+                self._modified[table] = modified
+
+    async def load(self, db) -> None:
+        """启动时和 LISTEN 断线重连后从数据库整体读一遍"""
+        rows = (await db.execute(text(
+            "SELECT table_name, version, extract(epoch FROM modified_at), epoch FROM data_versions"
+        ))).all()
+        self.apply({table: (version, float(modified)) for table, version, modified, _ in rows})
+        self.epoch = hashlib.sha1("|".join(sorted(epoch for *_, epoch in rows)).encode()).hexdigest()[:8]
+
+    async def bump_all(self, db) -> None:
+        """不经过 publish 的整体写入（重置并注入假数据）之后调用，由调用方提交"""
+        await self.stage(db, TABLES)
+
+    def version(self, table: str) -> int:
+        return self._versions.get(table, 0)
+
+    def last_modified(self, *tables: str) -> float:
+        return max((self._modified.get(t, 0.0) for t in tables), default=0.0)
+
+
+data_versions = DataVersions()
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_staged_versions(session) -> None:
+    staged = session.info.pop(_STAGED, None)
+    if staged:
+        data_versions.apply(staged)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_staged_versions(session) -> None:
+    session.info.pop(_STAGED, None)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """弱比较（RFC 9110 8.8.3.2）"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+class HttpCache:
+    """一个请求的缓存校验器：根据表版本生成 ETag / Last-Modified"""
+
+    def __init__(self, request: Request, *tables: str, cache_control: str):
+        self.request = request
+        self.cache_control = cache_control
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[int] = None
+        if not data_versions.ready:
+            return
+
+        # 同一个 URL 的 JSON 和 MessagePack 表示要用不同的 ETag
+        versions = ",".join(f"{t}={data_versions.version(t)}" for t in tables)
+        representation = "msgpack" if wants_msgpack(request) else "json"
+        key = f"{data_versions.epoch}|{request.url.path}?{request.url.query}|{versions}|{representation}"
+        self.etag = f'W/"{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
+
+        # Last-Modified 只能精确到秒：最后一次修改就在这一秒里时，这一秒内后面还可能再有
+        # 修改，而它们的 Last-Modified 会一样，所以先不发，客户端只能用 ETag 校验
+        modified = data_versions.last_modified(*tables)
+        if math.floor(modified) < math.floor(time.time()):
+            self.last_modified = math.floor(modified)
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        headers = {"Cache-Control": self.cache_control}
+        if self.etag:
+            headers["ETag"] = self.etag
+        if self.last_modified is not None:
+            headers["Last-Modified"] = formatdate(self.last_modified, usegmt=True)
+        return headers
+
+    def is_fresh(self) -> bool:
+        """客户端缓存是否仍然有效；If-None-Match 优先于 If-Modified-Since"""
+        if self.etag is None:
+            return False
+        if_none_match = self.request.headers.get("if-none-match")
+        if if_none_match is not None:
+            return _etag_matches(if_none_match, self.etag)
+
+        if_modified_since = self.request.headers.get("if-modified-since")
+        if if_modified_since and self.last_modified is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return self.last_modified <= since
+        return False
+
+    def not_modified(self) -> Response:
+        return Response(status_code=304, headers={**self.headers, "Vary": "Accept, Accept-Encoding"})
+
+    def check(self) -> Optional[Response]:
+        """命中时返回 304 响应，否则返回 None"""
+        return self.not_modified() if self.is_fresh() else None
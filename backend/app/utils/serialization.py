@@ -0,0 +1,130 @@
+"""列表接口的轻量序列化工具
+
+- recipe_card: 统一的 recipe 卡片序列化（原来在 recipes.py 里重复了四次）
+- negotiate: 按 Accept 头返回 orjson 编码的 JSON，或可选的 MessagePack；
+  超过阈值的响应体按 Accept-Encoding 做 brotli / gzip 压缩
+"""
+import gzip
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import orjson
+from fastapi import Request
+from fastapi.responses import ORJSONResponse, Response
+from sqlalchemy import select
+
+from app.config import COMPRESSION_MIN_SIZE
+from app.models.recipe import Recipe
+
+try:
+    import msgpack
+except ImportError:  # MessagePack 是可选依赖
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # 没有 brotli 时只用 gzip
+    brotli = None
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# 列表接口只需要这些列，不再加载完整的 ORM 对象
+RECIPE_CARD_COLUMNS = (
+    Recipe.recipe_address,
+    Recipe.cocktail_name,
+    Recipe.cocktail_intro,
+    Recipe.cocktail_photo,
+    Recipe.owner_address,
+    Recipe.user_address,
+    Recipe.price,
+)
+
+
+def select_recipe_cards(*extra_columns):
+    """返回只包含卡片字段（以及额外列）的 Core 查询"""
+    return select(*RECIPE_CARD_COLUMNS, *extra_columns)
+
+
+def load_json_list(raw: Any) -> Any:
+    """解析以 JSON 字符串存储的地址列表；空值原样返回"""
+    return orjson.loads(raw) if raw else raw
+
+
+def recipe_card(row: Mapping[str, Any]) -> dict:
+    """把一行 recipe 数据转换成对外的卡片格式，cocktail_recipe 始终不公开"""
+    return {
+        "recipe_address": row["recipe_address"],
+        "cocktail_name": row["cocktail_name"],
+        "cocktail_intro": row["cocktail_intro"],
+        "cocktail_photo": row["cocktail_photo"],
+        "cocktail_recipe": None,
+        "owner_address": row["owner_address"],
+        "user_address": load_json_list(row["user_address"]),
+        "price": row["price"],
+    }
+
+
+async def scored_recipe_cards(db, scored: List[Tuple[str, float]]) -> List[dict]:
+    """按 [(recipe_address, score), ...] 的顺序取 recipe 卡片，附带 score；已删除的跳过"""
+    if not scored:
+        return []
+    result = await db.execute(
+        select_recipe_cards().where(Recipe.recipe_address.in_([address for address, _ in scored]))
+    )
+    rows = {row["recipe_address"]: row for row in result.mappings()}
+    cards = []
+    for address, score in scored:
+        if address in rows:
+            card = recipe_card(rows[address])
+            card["score"] = round(score, 4)
+            cards.append(card)
+    return cards
+
+
+def wants_msgpack(request: Request) -> bool:
+    """客户端是否接受 MessagePack（且服务端装了 msgpack）"""
+    if msgpack is None:
+        return False
+    accept = request.headers.get("accept", "")
+    return any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+
+
+def _accepted_encodings(request: Request) -> set:
+    encodings = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        encodings.add(coding.strip().lower())
+    return encodings
+
+
+def _compress(request: Request, body: bytes, headers: Dict[str, str]) -> bytes:
+    """响应体超过 COMPRESSION_MIN_SIZE 时按客户端支持的编码压缩"""
+    if len(body) < COMPRESSION_MIN_SIZE:
+        return body
+    encodings = _accepted_encodings(request)
+    if brotli is not None and "br" in encodings:
+        headers["Content-Encoding"] = "br"
+        return brotli.compress(body, quality=4)
+    if "gzip" in encodings:
+        headers["Content-Encoding"] = "gzip"
+        return gzip.compress(body, compresslevel=5)
+    return body
+
+
+def negotiate(
+    request: Request,
+    content: Any,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """按 Accept 头选择响应编码（默认 orjson），并按 Accept-Encoding 压缩"""
+    headers = {**(headers or {}), "Vary": "Accept, Accept-Encoding"}
+    if wants_msgpack(request):
+        media_type = MSGPACK_MEDIA_TYPES[0]
+        body = msgpack.packb(content, use_bin_type=True)
+    else:
+        media_type = ORJSONResponse.media_type
+        body = orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    body = _compress(request, body, headers)
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
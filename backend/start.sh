@@ -22,9 +22,17 @@ PORT=${PORT:-8000}
 # Set default host
 HOST=${HOST:-0.0.0.0}
 
-# Set number of workers (defaults to 1 for better compatibility)
+# Set number of workers (defaults to 1)
+# In-process caches stay coherent across workers via Postgres LISTEN/NOTIFY,
+# and one-time startup work (DB reset/seed) is coordinated with an advisory lock.
+# AI chat sessions, the LLM cache, the circuit breaker and rate-limit buckets are
+# still per process: with more workers, session follow-ups can 404 and limits are
+# multiplied by the worker count. Only raise WORKERS behind sticky sessions.
 WORKERS=${WORKERS:-1}
 
+# Shared by all workers of this launch so one-time initialization runs once
+export BOOT_ID=${BOOT_ID:-$(date +%s)-$$}
+
 echo "🌐 Starting server on $HOST:$PORT with $WORKERS workers..."
 
 # Start the application
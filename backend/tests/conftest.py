@@ -0,0 +1,50 @@
+# backend/tests/conftest.py
+"""测试默认用 sqlite 内存库代替 Postgres；用到 Postgres 专有语法的测试标记为 postgres，
+只在设置了 TEST_DATABASE_URL（一个可以随意清空的 postgresql+asyncpg 库）时运行"""
+import os
+
+# app.config 在导入时拼 DATABASE_URL，没有 .env 时给个占位端口（测试不会连它）
+os.environ.setdefault("POSTGRES_PORT", "5432")
+os.environ.setdefault("QUERY_BUDGET_MODE", "log")
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db import query_budget
+from app.models.bar import Base as BarBase
+from app.models.market_event import Base as MarketEventBase
+from app.models.outbox import Base as OutboxBase
+from app.models.price_history import Base as PriceHistoryBase
+from app.models.recipe import Base as RecipeBase
+from app.models.transaction import Base as TransactionBase
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def session_factory():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    query_budget.instrument_engine(engine.sync_engine)
+    async with engine.begin() as conn:
+        for base in (RecipeBase, BarBase, TransactionBase, OutboxBase, MarketEventBase, PriceHistoryBase):
+            await conn.run_sync(base.metadata.create_all)
+    yield sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    await engine.dispose()
+
+
+@pytest.fixture
+async def pg_session_factory():
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL 没有设置")
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        for base in (RecipeBase, BarBase, TransactionBase, OutboxBase, MarketEventBase, PriceHistoryBase):
+            await conn.run_sync(base.metadata.drop_all)
+            await conn.run_sync(base.metadata.create_all)
+    yield sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    await engine.dispose()
@@ -0,0 +1,75 @@
+import httpx
+import pytest
+
+from app.services import admission
+from app.services.admission import AI, READ, WRITE, AdmissionMiddleware, RateLimiter, classify, client_keys
+
+
+def _scope(client="10.0.0.1", **headers):
+    return {
+        "type": "http",
+        "client": (client, 5000),
+        "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()],
+    }
+
+
+def test_classify():
+    assert classify("GET", "/api/recipes/get_all_recipes") == READ
+    assert classify("POST", "/api/trans/complete_transaction") == WRITE
+    assert classify("POST", "/api/ai/chat") == AI
+    assert classify("GET", "/health/live") is None
+    assert classify("POST", "/api/admin/reindex") is None
+    assert classify("OPTIONS", "/api/recipes/get_all_recipes") is None
+
+
+def test_forwarded_for_ignored_unless_trusted(monkeypatch):
+    monkeypatch.setattr(admission, "TRUST_FORWARDED_FOR", False)
+    assert client_keys(_scope(x_forwarded_for="1.2.3.4")) == ["ip:10.0.0.1"]
+
+
+def test_forwarded_for_uses_the_proxy_added_entry(monkeypatch):
+    monkeypatch.setattr(admission, "TRUST_FORWARDED_FOR", True)
+    monkeypatch.setattr(admission, "FORWARDED_FOR_HOPS", 1)
+    # 最左边的是客户端自己写的，最右边的才是可信代理追加的
+    assert client_keys(_scope(x_forwarded_for="6.6.6.6, 203.0.113.9")) == ["ip:203.0.113.9"]
+    monkeypatch.setattr(admission, "FORWARDED_FOR_HOPS", 2)
+    assert client_keys(_scope(x_forwarded_for="6.6.6.6, 203.0.113.9, 10.1.1.1")) == ["ip:203.0.113.9"]
+
+
+def test_wallet_is_an_extra_bucket_not_a_replacement():
+    keys = client_keys(_scope(x_wallet_address=" 0xABC "))
+    assert keys == ["ip:10.0.0.1", "wallet:0xabc"]
+
+
+def test_token_bucket_refuses_after_burst():
+    limiter = RateLimiter({READ: (1.0, 2.0)}, max_clients=10)
+    assert limiter.check("ip:a", READ) == 0
+    assert limiter.check("ip:a", READ) == 0
+    assert limiter.check("ip:a", READ) > 0
+    assert limiter.check("ip:b", READ) == 0
+
+
+def test_limiter_forgets_least_recent_clients():
+    limiter = RateLimiter({READ: (1.0, 1.0)}, max_clients=2)
+    for client in ("a", "b", "c"):
+        limiter.check(client, READ)
+    assert limiter.stats()["clients"] == 2
+
+
+@pytest.mark.anyio
+async def test_middleware_rejects_rotating_wallets_from_one_ip(monkeypatch):
+    monkeypatch.setattr(admission, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(admission, "load_pressure", lambda: 0.0)
+    monkeypatch.setattr(admission, "rate_limiter", RateLimiter({READ: (0.001, 2.0)}, max_clients=100))
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    transport = httpx.ASGITransport(app=AdmissionMiddleware(app), client=("10.0.0.7", 5000))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        statuses = [
+            (await client.get("/api/bars/get_all_bars", headers={"X-Wallet-Address": f"0x{i}"})).status_code
+            for i in range(3)
+        ]
+    assert statuses == [200, 200, 429]
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.api import ai_agent
+from app.services.chat_sessions import session_store
+
+
+class FakeStream:
+    def __init__(self, release: asyncio.Event):
+        self.release = release
+        self.closed = False
+
+    def __aiter__(self):
+        return self._tokens()
+
+    async def _tokens(self):
+        yield "Hello"
+        await self.release.wait()
+        yield " there"
+
+    async def aclose(self):
+        self.closed = True
+
+
+def _fake_upstream(monkeypatch, release=None):
+    streams = []
+
+    async def open_chat_stream(messages, temperature):
+        streams.append(FakeStream(release or asyncio.Event()))
+        return streams[-1]
+
+    monkeypatch.setattr(ai_agent, "open_chat_stream", open_chat_stream)
+    return streams
+
+
+@pytest.mark.anyio
+async def test_second_turn_is_rejected_while_a_stream_is_open(monkeypatch):
+    release = asyncio.Event()
+    streams = _fake_upstream(monkeypatch, release)
+    session = session_store.create()
+
+    response = await ai_agent.chat_in_session_stream(session.id, ai_agent.SessionChatRequest(message="hi"))
+    body = response.body_iterator
+    assert b"Hello" in await body.__anext__()
+    with pytest.raises(HTTPException) as rejected:
+        await ai_agent.chat_in_session_stream(session.id, ai_agent.SessionChatRequest(message="again"))
+    assert rejected.value.status_code == 409
+
+    release.set()
+    rest = b"".join([chunk async for chunk in body])
+    assert b"event: done" in rest
+    await response.background()  # 生成器里已经归还过锁，后台任务再执行一次也没关系
+    assert streams[0].closed
+    assert not session.lock.locked()
+    history = session.prompt_history({"role": "user", "content": "next"}, 10000)
+    assert [m["content"] for m in history] == ["hi", "Hello there", "next"]
+
+
+@pytest.mark.anyio
+async def test_lock_is_released_when_the_stream_is_never_read(monkeypatch):
+    _fake_upstream(monkeypatch)
+    session = session_store.create()
+    response = await ai_agent.chat_in_session_stream(session.id, ai_agent.SessionChatRequest(message="hi"))
+    assert session.lock.locked()
+    await response.background()
+    assert not session.lock.locked()
+
+
+@pytest.mark.anyio
+async def test_lock_is_released_when_upstream_fails_to_open(monkeypatch):
+    async def open_chat_stream(messages, temperature):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(ai_agent, "open_chat_stream", open_chat_stream)
+    session = session_store.create()
+    with pytest.raises(HTTPException):
+        await ai_agent.chat_in_session_stream(session.id, ai_agent.SessionChatRequest(message="hi"))
+    assert not session.lock.locked()
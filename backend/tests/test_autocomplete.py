@@ -0,0 +1,46 @@
+from app.services.autocomplete import BAR, RECIPE, AutocompleteIndex, normalize
+
+
+def test_normalize_strips_accents_case_and_spaces():
+    assert normalize("  Piña   COLADA ") == "pina colada"
+
+
+def _index():
+    index = AutocompleteIndex()
+    index.add_recipe("0xr1", "Negroni Sbagliato", "0xo1")
+    index.add_recipe("0xr2", "Old Fashioned", "0xo2")
+    index.add_recipe("0xr3", "Negroni", "0xo1")
+    index.add_bar("0xb1", "The Negroni Club")
+    return index
+
+
+def test_prefix_matches_any_word_and_both_kinds():
+    index = _index()
+    texts = [s["text"] for s in index.suggest("negr")]
+    assert set(texts) == {"Negroni Sbagliato", "Negroni", "The Negroni Club"}
+    assert [s["text"] for s in index.suggest("fash")] == ["Old Fashioned"]
+    assert [s["kind"] for s in index.suggest("negr", kinds=(BAR,))] == [BAR]
+
+
+def test_sales_raise_popularity():
+    index = _index()
+    index.record_sale("0xr1")
+    index.record_sale("0xr1")
+    first = index.suggest("negroni", kinds=(RECIPE,))[0]
+    assert first["address"] == "0xr1"
+    assert first["popularity"] == 2
+
+
+def test_typo_fallback_is_marked():
+    index = _index()
+    result = index.suggest("negorni")
+    assert result
+    assert all(s["typo"] for s in result)
+    assert "Negroni" in {s["text"] for s in result}
+
+
+def test_rename_replaces_old_terms():
+    index = _index()
+    index.add_recipe("0xr2", "Manhattan", "0xo2")
+    assert "Old Fashioned" not in {s["text"] for s in index.suggest("old fash")}
+    assert [s["address"] for s in index.suggest("manh")] == ["0xr2"]
@@ -0,0 +1,129 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import circuit_breaker
+from app.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(circuit_breaker, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def _breaker(**kwargs):
+    options = {"window": 4, "min_calls": 3, "failure_rate": 0.5, "slow_call_seconds": 10, "open_seconds": 30}
+    options.update(kwargs)
+    return CircuitBreaker("test", **options)
+
+
+def _call(breaker, ok=True, latency=None):
+    breaker.before_call()
+    breaker.record(ok, latency)
+
+
+def _tripped():
+    breaker = _breaker(min_calls=1)
+    _call(breaker, ok=False)
+    assert breaker.state == OPEN
+    return breaker
+
+
+def test_stays_closed_until_min_calls(clock):
+    breaker = _breaker()
+    _call(breaker, ok=False)
+    _call(breaker, ok=False)
+    assert breaker.state == CLOSED
+    _call(breaker, ok=True)
+    assert breaker.state == OPEN
+    assert breaker.trips == 1
+
+
+def test_failure_rate_is_over_the_recent_window(clock):
+    breaker = _breaker()
+    for _ in range(3):
+        _call(breaker, ok=True)
+    _call(breaker, ok=False)                 # 1/4
+    assert breaker.state == CLOSED
+    _call(breaker, ok=False)                 # 窗口滑动后 2/4
+    assert breaker.state == OPEN
+
+
+def test_slow_calls_count_as_failures(clock):
+    breaker = _breaker()
+    _call(breaker, latency=1)
+    _call(breaker, latency=10)               # 不超过阈值不算慢
+    _call(breaker, latency=10.5)
+    assert breaker.state == CLOSED
+    _call(breaker, latency=11)
+    assert breaker.state == OPEN
+
+
+def test_open_circuit_rejects_until_the_cooldown_ends(clock):
+    breaker = _tripped()
+    clock.now += 10
+    with pytest.raises(CircuitOpenError) as rejected:
+        breaker.before_call()
+    assert rejected.value.retry_after == pytest.approx(20)
+    assert breaker.rejected == 1
+    assert breaker.stats()["retry_after_seconds"] == 20
+
+    clock.now += 20
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def test_half_open_allows_a_single_trial(clock):
+    breaker = _tripped()
+    clock.now += 30
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record(True, 1)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["recent_calls"] == 0
+
+
+def test_failed_trial_reopens_the_circuit(clock):
+    breaker = _tripped()
+    clock.now += 30
+    breaker.before_call()
+    breaker.record(True, 11)                 # 慢的试探也算失败
+    assert breaker.state == OPEN
+    assert breaker.trips == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_released_trial_lets_the_next_call_try(clock):
+    breaker = _tripped()
+    clock.now += 30
+    breaker.before_call()
+    breaker.release_trial()
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def test_successful_probe_half_opens_early(clock):
+    breaker = _tripped()
+    breaker.record_probe(False)
+    assert breaker.state == OPEN
+    breaker.record_probe(True, 1)
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()                    # 不用等冷却结束
+    breaker.record(True, 1)
+    assert breaker.state == CLOSED
+
+
+def test_probe_results_count_while_closed(clock):
+    breaker = _breaker()
+    for _ in range(3):
+        breaker.record_probe(False)
+    assert breaker.state == OPEN
+    # 半开时探测结果不影响试探调用
+    breaker.record_probe(True)
+    breaker.before_call()
+    breaker.record_probe(False)
+    assert breaker.state == HALF_OPEN
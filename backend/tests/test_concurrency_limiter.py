@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from app.services.kimi import ConcurrencyLimiter, KimiOverloadedError
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.anyio
+async def test_waiters_queue_in_order_until_a_slot_is_released():
+    limiter = ConcurrencyLimiter(max_in_flight=1, max_queue=5, queue_timeout=5)
+    await limiter.acquire()
+    order = []
+
+    async def wait(name):
+        async with limiter.slot():
+            order.append(name)
+
+    tasks = [asyncio.create_task(wait(name)) for name in ("a", "b")]
+    await _settle()
+    assert (limiter.in_flight, limiter.queue_depth) == (1, 2)
+    assert order == []
+
+    limiter.release()
+    await asyncio.gather(*tasks)
+    assert order == ["a", "b"]
+    stats = limiter.stats()
+    assert (stats["in_flight"], stats["queue_depth"], stats["completed"]) == (0, 0, 3)
+    assert stats["max_wait_seconds"] > 0
+
+
+@pytest.mark.anyio
+async def test_rejects_when_the_queue_is_full():
+    limiter = ConcurrencyLimiter(max_in_flight=1, max_queue=1, queue_timeout=7)
+    await limiter.acquire()
+    queued = asyncio.create_task(limiter.acquire())
+    await _settle()
+    with pytest.raises(KimiOverloadedError, match="queue is full") as rejected:
+        await limiter.acquire()
+    assert rejected.value.retry_after == 7
+    assert limiter.stats()["rejected_queue_full"] == 1
+
+    limiter.release()
+    await queued
+    assert limiter.stats()["in_flight"] == 1
+
+
+@pytest.mark.anyio
+async def test_gives_up_after_the_queue_timeout():
+    limiter = ConcurrencyLimiter(max_in_flight=1, max_queue=5, queue_timeout=0.05)
+    await limiter.acquire()
+    with pytest.raises(KimiOverloadedError, match="waited more than 0.05s") as rejected:
+        await limiter.acquire()
+    assert rejected.value.retry_after == 1
+    stats = limiter.stats()
+    assert (stats["rejected_timeout"], stats["queue_depth"], stats["in_flight"]) == (1, 0, 1)
+
+    # 超时的请求没有占走名额
+    limiter.release()
+    await asyncio.wait_for(limiter.acquire(), timeout=1)
+
+
+@pytest.mark.anyio
+async def test_slot_is_released_when_the_call_fails():
+    limiter = ConcurrencyLimiter(max_in_flight=2, max_queue=0, queue_timeout=1)
+    with pytest.raises(RuntimeError):
+        async with limiter.slot():
+            assert limiter.stats()["in_flight"] == 1
+            raise RuntimeError("upstream error")
+    stats = limiter.stats()
+    assert (stats["in_flight"], stats["completed"], stats["avg_wait_seconds"] >= 0) == (0, 1, True)
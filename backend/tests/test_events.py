@@ -0,0 +1,62 @@
+import orjson
+import pytest
+
+from app.db import session as db_session
+from app.models.market_event import MarketEvent
+from app.services import events
+from app.services.events import RECIPE_LISTED, RECIPE_SOLD, EventHub, Subscriber
+
+
+def _subscriber(bars=(), types=()):
+    return Subscriber(set(bars), set(), set(types))
+
+
+@pytest.fixture
+async def hub(session_factory, monkeypatch):
+    """market_events 里有 1..50 号事件：偶数号是 bar1 的成交，奇数号是 bar2 的上架"""
+    monkeypatch.setattr(db_session, "AsyncSessionLocal", session_factory)
+    monkeypatch.setattr(events, "EVENT_REPLAY_LIMIT", 10)
+    async with session_factory() as db:
+        for event_id in range(1, 51):
+            sold = event_id % 2 == 0
+            payload = {"data": {}, "bar_addresses": ["bar1" if sold else "bar2"], "recipe_address": None}
+            # sqlite 里 BIGINT 主键不会自增，直接给 id
+            db.add(MarketEvent(id=event_id, type=RECIPE_SOLD if sold else RECIPE_LISTED,
+                               payload=orjson.dumps(payload).decode()))
+        await db.commit()
+    return EventHub(buffer_size=5)
+
+
+async def _read(stream, count):
+    chunks = []
+    async for chunk in stream:
+        chunks.append(chunk)
+        if len(chunks) == count:
+            break
+    await stream.aclose()
+    return chunks
+
+
+@pytest.mark.anyio
+async def test_replay_filters_before_applying_the_limit(hub):
+    # 40 号之后只有 5 个 bar2 的事件，分页时不能被别的事件挤掉
+    replayed = await hub.replay(_subscriber(bars={"bar2"}), 40)
+    assert [e.id for e in replayed] == [41, 43, 45, 47, 49]
+    replayed = await hub.replay(_subscriber(types={RECIPE_LISTED}), 30)
+    assert [e.id for e in replayed] == [31, 33, 35, 37, 39, 41, 43, 45, 47, 49]
+
+
+@pytest.mark.anyio
+async def test_replay_gives_up_when_too_many_or_pruned(hub, session_factory):
+    assert await hub.replay(_subscriber(bars={"bar1"}), 20) is None
+    async with session_factory() as db:
+        await db.execute(MarketEvent.__table__.delete().where(MarketEvent.id <= 45))
+        await db.commit()
+    assert await hub.replay(_subscriber(), 40) is None
+    assert [e.id for e in await hub.replay(_subscriber(), 45)] == [46, 47, 48, 49, 50]
+
+
+@pytest.mark.anyio
+async def test_stream_sends_reset_with_the_newest_id(hub):
+    chunks = await _read(hub.stream(_subscriber(bars={"bar1"}), 0), 2)
+    assert chunks[1] == b'id: 50\nevent: reset\ndata: {"last_event_id":50}\n\n'
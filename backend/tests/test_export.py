@@ -0,0 +1,120 @@
+import asyncio
+import gc
+import zlib
+from datetime import datetime, timedelta
+
+import orjson
+import pytest
+
+from app.models.transaction import Transaction
+from app.services import export
+from app.services.export import CSV, NDJSON, ExportFilters, decode_cursor, encode_cursor, stream_export
+
+
+def test_cursor_round_trip():
+    filters = ExportFilters(address="0xa", since=datetime(2026, 1, 1))
+    token = encode_cursor("transactions", filters, 42)
+    assert "=" not in token
+    assert decode_cursor(token, "transactions", ExportFilters(address="0xa", since=datetime(2026, 1, 1))) == 42
+
+
+def test_cursor_is_rejected_for_other_filters_or_datasets():
+    token = encode_cursor("transactions", ExportFilters(address="0xa"), 42)
+    with pytest.raises(ValueError, match="does not match"):
+        decode_cursor(token, "transactions", ExportFilters(address="0xb"))
+    with pytest.raises(ValueError, match="does not match"):
+        decode_cursor(token, "recipes", ExportFilters(address="0xa"))
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor("not-a-cursor", "transactions", ExportFilters(address="0xa"))
+
+
+@pytest.fixture
+def slots(monkeypatch):
+    semaphore = asyncio.Semaphore(1)
+    monkeypatch.setattr(export, "export_slots", semaphore)
+    return semaphore
+
+
+@pytest.fixture
+async def transactions(session_factory, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_CHECKPOINT_ROWS", 2)
+    monkeypatch.setattr(export, "EXPORT_FETCH_SIZE", 2)
+    start = datetime(2026, 1, 1)
+    async with session_factory() as db:
+        db.add_all([
+            Transaction(buyer=f"0xb{i}", seller="0xs", recipe_address="0xr", timestamp=start + timedelta(hours=i))
+            for i in range(5)
+        ])
+        await db.commit()
+    return session_factory
+
+
+async def _read(stream):
+    return b"".join([chunk async for chunk in stream])
+
+
+@pytest.mark.anyio
+async def test_ndjson_checkpoints_resume_at_the_next_row(transactions, slots):
+    filters = ExportFilters()
+    slot = await export.try_acquire_slot()
+    lines = [orjson.loads(line) for line in (await _read(
+        stream_export(transactions, "transactions", NDJSON, filters, slot)
+    )).splitlines()]
+    assert [line.get("id") for line in lines if "id" in line] == [1, 2, 3, 4, 5]
+    cursors = [line for line in lines if "_cursor" in line]
+    assert [decode_cursor(c["_cursor"], "transactions", filters) for c in cursors] == [2, 4, 5]
+    assert cursors[-1]["_complete"] is True and lines[-1] is cursors[-1]
+    assert not slots.locked()
+
+    after_id = decode_cursor(cursors[0]["_cursor"], "transactions", filters)
+    slot = await export.try_acquire_slot()
+    resumed = [orjson.loads(line) for line in (await _read(
+        stream_export(transactions, "transactions", NDJSON, filters, slot, after_id=after_id)
+    )).splitlines()]
+    assert [line["id"] for line in resumed if "id" in line] == [3, 4, 5]
+
+
+@pytest.mark.anyio
+async def test_csv_export_with_filters_and_gzip(transactions, slots):
+    filters = ExportFilters(since=datetime(2026, 1, 1, 1), until=datetime(2026, 1, 1, 4))
+    slot = await export.try_acquire_slot()
+    body = zlib.decompress(
+        await _read(stream_export(transactions, "transactions", CSV, filters, slot, after_id=2, gzip=True)), 31
+    )
+    rows = body.decode().splitlines()
+    assert rows[0] == "id,buyer,seller,recipe_address,timestamp"
+    assert [row.split(",")[0] for row in rows[1:]] == ["3", "4"]
+    assert not slots.locked()
+
+
+@pytest.mark.anyio
+async def test_only_one_export_per_slot(slots):
+    slot = await export.try_acquire_slot()
+    assert await export.try_acquire_slot() is None
+    slot.release()
+    slot.release()  # 重复归还不会多放出名额
+    assert (await export.try_acquire_slot()) is not None
+    assert await export.try_acquire_slot() is None
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("gzip", [False, True])
+async def test_slot_is_released_when_a_stream_is_closed_early(transactions, slots, gzip):
+    stream = stream_export(transactions, "transactions", NDJSON, ExportFilters(), await export.try_acquire_slot(),
+                           gzip=gzip)
+    await stream.__anext__()
+    assert slots.locked()
+    await stream.aclose()
+    assert not slots.locked()
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("gzip", [False, True])
+async def test_slot_is_released_when_an_unstarted_stream_is_collected(transactions, slots, gzip):
+    stream = stream_export(transactions, "transactions", CSV, ExportFilters(), await export.try_acquire_slot(),
+                           gzip=gzip)
+    await stream.aclose()  # 没开始的生成器关闭时不执行 finally
+    assert slots.locked()
+    del stream
+    gc.collect()
+    assert not slots.locked()
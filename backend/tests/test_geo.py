@@ -0,0 +1,50 @@
+from app.services.geo import GeoIndex, valid_coordinates
+
+
+def test_valid_coordinates():
+    assert valid_coordinates(31.2, 121.5)
+    assert not valid_coordinates(None, 121.5)
+    assert not valid_coordinates(91, 0)
+    assert not valid_coordinates(0, -181)
+
+
+def test_nearest_orders_by_distance_and_respects_radius():
+    index = GeoIndex()
+    index.upsert("far", 31.2900, 121.4737)     # 北边约 6.6 公里
+    index.upsert("near", 31.2310, 121.4740)
+    index.upsert("beijing", 39.9042, 116.4074)
+
+    result = index.nearest(31.2304, 121.4737, radius_km=10, k=5)
+    assert [key for key, _ in result] == ["near", "far"]
+    assert all(distance <= 10 for _, distance in result)
+    assert index.nearest(31.2304, 121.4737, radius_km=10, k=1)[0][0] == "near"
+
+
+def test_upsert_moves_and_invalid_coordinates_remove():
+    index = GeoIndex()
+    index.upsert("a", 10.0, 10.0)
+    index.upsert("a", 50.0, 50.0)
+    assert len(index) == 1
+    assert index.nearest(10.0, 10.0, radius_km=50, k=5) == []
+    assert index.nearest(50.0, 50.0, radius_km=1, k=5)[0][0] == "a"
+
+    index.upsert("a", None, None)
+    assert len(index) == 0
+
+
+def test_antimeridian_wraps():
+    index = GeoIndex()
+    index.upsert("fiji", -17.0, 179.9)
+    result = index.nearest(-17.0, -179.9, radius_km=50, k=1)
+    assert result and result[0][0] == "fiji"
+
+
+def test_compaction_keeps_live_entries():
+    index = GeoIndex()
+    for i in range(2500):
+        index.upsert(f"bar{i}", (i % 80) * 0.5, (i % 160) * 0.5)
+    for i in range(2400):
+        index.remove(f"bar{i}")
+    assert len(index) == 100
+    assert index.stats()["slots"] < 2500
+    assert index.nearest((2450 % 80) * 0.5, (2450 % 160) * 0.5, radius_km=1, k=1)[0][0] == "bar2450"
@@ -0,0 +1,69 @@
+import time
+from email.utils import formatdate
+
+import pytest
+from starlette.requests import Request
+
+from app.utils import http_cache
+from app.utils.http_cache import DataVersions, HttpCache
+
+
+def _request(path="/api/recipes/get_all_recipes", query="", **headers):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": query.encode(),
+        "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()],
+    })
+
+
+@pytest.fixture
+def versions(monkeypatch):
+    versions = DataVersions()
+    versions.epoch = "test"
+    versions.apply({"recipes": (3, time.time() - 60), "bars": (1, time.time() - 60)})
+    monkeypatch.setattr(http_cache, "data_versions", versions)
+    return versions
+
+
+def test_no_etag_before_versions_are_loaded(monkeypatch):
+    monkeypatch.setattr(http_cache, "data_versions", DataVersions())
+    cache = HttpCache(_request(if_none_match="*"), "recipes", cache_control="no-cache")
+    assert cache.etag is None
+    assert cache.check() is None
+
+
+def test_matching_etag_returns_304(versions):
+    etag = HttpCache(_request(), "recipes", cache_control="no-cache").etag
+    response = HttpCache(_request(if_none_match=f'"other", {etag}'), "recipes", cache_control="no-cache").check()
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+
+def test_etag_depends_on_version_query_and_representation(versions):
+    etag = HttpCache(_request(), "recipes", cache_control="no-cache").etag
+    assert HttpCache(_request(query="q=1"), "recipes", cache_control="no-cache").etag != etag
+    assert HttpCache(_request(accept="application/msgpack"), "recipes", cache_control="no-cache").etag != etag
+    versions.apply({"recipes": (4, time.time() - 30)})
+    assert HttpCache(_request(if_none_match=etag), "recipes", cache_control="no-cache").check() is None
+
+
+def test_versions_only_move_forward(versions):
+    versions.apply({"recipes": (2, time.time())})
+    assert versions.version("recipes") == 3
+
+
+def test_if_modified_since(versions):
+    cache = HttpCache(_request(), "recipes", "bars", cache_control="no-cache")
+    stamp = cache.headers["Last-Modified"]
+    assert HttpCache(_request(if_modified_since=stamp), "recipes", cache_control="no-cache").check() is not None
+    earlier = formatdate(cache.last_modified - 10, usegmt=True)
+    assert HttpCache(_request(if_modified_since=earlier), "recipes", cache_control="no-cache").check() is None
+
+
+def test_no_last_modified_within_the_current_second(versions):
+    versions.apply({"recipes": (5, time.time())})
+    cache = HttpCache(_request(), "recipes", cache_control="no-cache")
+    assert "Last-Modified" not in cache.headers
+    assert cache.etag is not None
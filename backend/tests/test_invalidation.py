@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from app.services import invalidation
+from app.services.invalidation import InvalidationBus
+
+
+@pytest.mark.anyio
+async def test_start_gives_up_when_listen_never_connects(monkeypatch):
+    attempts = []
+
+    async def connect(dsn):
+        attempts.append(dsn)
+        raise OSError("pg_hba.conf rejects connection")
+
+    monkeypatch.setattr("asyncpg.connect", connect)
+    monkeypatch.setattr(invalidation, "RECONNECT_SECONDS", 0.01)
+    bus = InvalidationBus()
+    with pytest.raises(RuntimeError, match="pg_hba.conf rejects connection"):
+        await bus.start(timeout=0.1)
+    assert len(attempts) > 1  # 超时之前一直在重试
+    await asyncio.sleep(0)
+    assert bus._task.done()
+    assert not bus.stats()["listening"]
+
+
+@pytest.mark.anyio
+async def test_start_returns_once_listening(monkeypatch):
+    class FakeConnection:
+        def __init__(self):
+            self.channels = []
+
+        async def add_listener(self, channel, callback):
+            self.channels.append(channel)
+
+        def is_closed(self):
+            return False
+
+        async def close(self):
+            pass
+
+    conn = FakeConnection()
+
+    async def connect(dsn):
+        return conn
+
+    monkeypatch.setattr("asyncpg.connect", connect)
+    bus = InvalidationBus()
+    bus.add_channel("market_events", lambda payload: None)
+    await bus.start(timeout=1)
+    assert conn.channels == [invalidation.CHANNEL, "market_events"]
+    assert bus.stats()["listening"]
+    bus._task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await bus._task
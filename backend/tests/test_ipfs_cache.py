@@ -0,0 +1,96 @@
+import asyncio
+import os
+import threading
+
+import pytest
+from starlette.requests import Request
+
+from app.api.ipfs import _client_has_it
+from app.services import ipfs_cache as ipfs_cache_module
+from app.services.admission import IPFS_MISS, RateLimiter
+from app.services.ipfs_cache import CachedObject, IpfsCache, IpfsFetchError
+
+
+def _request(**headers):
+    return Request({
+        "type": "http",
+        "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()],
+    })
+
+
+def test_only_a_matching_if_none_match_short_circuits():
+    etag = '"Qm' + 'a' * 44 + '"'
+    assert _client_has_it(_request(if_none_match=f'"other", W/{etag}'), etag)
+    assert not _client_has_it(_request(if_none_match="*"), etag)
+    assert not _client_has_it(_request(if_modified_since="Wed, 21 Oct 2015 07:28:00 GMT"), etag)
+
+
+@pytest.mark.anyio
+async def test_misses_are_charged_per_client(tmp_path, monkeypatch):
+    monkeypatch.setattr(ipfs_cache_module, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ipfs_cache_module, "rate_limiter", RateLimiter({IPFS_MISS: (0.001, 2.0)}, max_clients=10))
+    cache = IpfsCache(directory=str(tmp_path))
+
+    def download(cid, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n")
+        return CachedObject(path, 8, "image/png")
+
+    monkeypatch.setattr(cache, "_download", download)
+
+    cids = ["Qm" + ch * 44 for ch in "bcd"]
+    await cache.get(cids[0], client="ip:1")
+    await cache.get(cids[1], client="ip:1")
+    with pytest.raises(IpfsFetchError) as rejected:
+        await cache.get(cids[2], client="ip:1")
+    assert rejected.value.status_code == 429 and rejected.value.retry_after > 0
+
+    # 命中缓存不扣令牌；被拒绝的 CID 不进失败缓存，别的客户端照常回源
+    await cache.get(cids[0], client="ip:1")
+    entry, _ = await cache.get(cids[2], client="ip:2")
+    assert entry.media_type == "image/png"
+
+
+@pytest.mark.anyio
+async def test_waiters_are_not_rejected_for_the_leaders_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(ipfs_cache_module, "RATE_LIMIT_ENABLED", True)
+    limiter = RateLimiter({IPFS_MISS: (0.001, 1.0)}, max_clients=10)
+    monkeypatch.setattr(ipfs_cache_module, "rate_limiter", limiter)
+    cache = IpfsCache(directory=str(tmp_path))
+    downloads = []
+    release = threading.Event()
+
+    def download(cid, path):
+        release.wait(5)
+        downloads.append(cid)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n")
+        return CachedObject(path, 8, "image/png")
+
+    monkeypatch.setattr(cache, "_download", download)
+    cid = "Qm" + "e" * 44
+    assert limiter.check("ip:1", IPFS_MISS) == 0  # ip:1 的额度已经用完
+
+    # ip:1 发起下载，ip:2 合并进来；ip:1 被限流，ip:2 按自己的额度重新发起
+    first = asyncio.create_task(cache.get(cid, client="ip:1"))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(cache.get(cid, client="ip:2"))
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(first, second, return_exceptions=True)
+    assert isinstance(results[0], IpfsFetchError) and results[0].status_code == 429
+    assert results[1][0].media_type == "image/png"
+    assert downloads == [cid]
+
+    # 合并进别人下载的请求不扣令牌：ip:1 额度用完了也能拿到 ip:3 发起的下载结果
+    other = "Qm" + "f" * 44
+    release.clear()
+    third = asyncio.create_task(cache.get(other, client="ip:3"))
+    await asyncio.sleep(0)
+    fourth = asyncio.create_task(cache.get(other, client="ip:1"))
+    await asyncio.sleep(0.05)
+    release.set()
+    assert [entry.media_type for entry, _ in await asyncio.gather(third, fourth)] == ["image/png"] * 2
+    assert downloads == [cid, other]
@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import kimi
+from app.services.circuit_breaker import HALF_OPEN, CircuitBreaker
+from app.services.kimi import KimiStream
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class FakeUpstream:
+    def __init__(self, texts, error=None):
+        self.texts = texts
+        self.error = error
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        for text in self.texts:
+            yield _chunk(text)
+        if self.error is not None:
+            raise self.error
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker("test", min_calls=1, failure_rate=0.5)
+    monkeypatch.setattr(kimi, "breaker", breaker)
+    monkeypatch.setattr(kimi.limiter, "release", lambda: None)
+    return breaker
+
+
+@pytest.mark.anyio
+async def test_finished_stream_records_one_success(breaker):
+    stream = KimiStream(FakeUpstream(["a", "b"]), open_latency=0.1)
+    assert [text async for text in stream] == ["a", "b"]
+    await stream.aclose()
+    assert breaker.stats()["recent_calls"] == 1
+    assert breaker.stats()["recent_failures"] == 0
+
+
+@pytest.mark.anyio
+async def test_failed_stream_records_only_the_failure(breaker):
+    stream = KimiStream(FakeUpstream(["a"], error=ConnectionError("reset")), open_latency=0.1)
+    with pytest.raises(ConnectionError):
+        async for _ in stream:
+            pass
+    await stream.aclose()
+    # 打开时不再先记一次成功：一次失败就达到 50% 的阈值
+    assert breaker.stats()["trips"] == 1
+
+
+@pytest.mark.anyio
+async def test_abandoned_stream_only_returns_the_trial(breaker):
+    breaker.state = HALF_OPEN
+    breaker.before_call()
+    stream = KimiStream(FakeUpstream(["a", "b"]), open_latency=0.1)
+    await stream.aclose()
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()  # 试探名额已经归还，下一次调用可以试探
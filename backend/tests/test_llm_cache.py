@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+
+from app.services import llm_cache as llm_cache_module
+from app.services.llm_cache import LLMResponseCache
+
+MESSAGES = [{"role": "user", "content": "  hello   world "}]
+
+
+class FakeCompute:
+    """记录调用次数；gate 没有 set 之前一直挂起"""
+
+    def __init__(self, value="answer", error=None):
+        self.value = value
+        self.error = error
+        self.calls = 0
+        self.gate = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.gate.wait()
+        if self.error is not None:
+            raise self.error
+        return f"{self.value}-{self.calls}"
+
+
+def _cache(**kwargs):
+    options = {"max_entries": 10, "ttl": 60, "max_temperature": 0.3}
+    options.update(kwargs)
+    return LLMResponseCache(**options)
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_key_ignores_whitespace_but_not_temperature_or_model():
+    key = LLMResponseCache.make_key(MESSAGES, "m", 0.2)
+    assert key == LLMResponseCache.make_key([{"role": "user", "content": "hello world"}], "m", 0.2)
+    assert key != LLMResponseCache.make_key(MESSAGES, "m", 0.1)
+    assert key != LLMResponseCache.make_key(MESSAGES, "other", 0.2)
+
+
+@pytest.mark.anyio
+async def test_concurrent_callers_share_one_upstream_call():
+    cache, compute = _cache(), FakeCompute()
+    tasks = [asyncio.create_task(cache.get_or_compute(MESSAGES, "m", 0.2, compute)) for _ in range(5)]
+    await _settle()
+    compute.gate.set()
+    assert await asyncio.gather(*tasks) == ["answer-1"] * 5
+    assert compute.calls == 1
+    assert (cache.misses, cache.collapsed) == (1, 4)
+    assert await cache.get_or_compute(MESSAGES, "m", 0.2, compute) == "answer-1"
+    assert cache.hits == 1
+
+
+@pytest.mark.anyio
+async def test_high_temperature_bypasses_the_cache():
+    cache, compute = _cache(), FakeCompute()
+    compute.gate.set()
+    assert await cache.get_or_compute(MESSAGES, "m", 0.9, compute) == "answer-1"
+    assert await cache.get_or_compute(MESSAGES, "m", 0.9, compute) == "answer-2"
+    assert cache.bypassed == 2
+
+
+@pytest.mark.anyio
+async def test_waiter_retries_when_the_leader_is_cancelled():
+    cache, compute = _cache(), FakeCompute()
+    leader = asyncio.create_task(cache.get_or_compute(MESSAGES, "m", 0.2, compute))
+    await _settle()
+    waiter = asyncio.create_task(cache.get_or_compute(MESSAGES, "m", 0.2, compute))
+    await _settle()
+    leader.cancel()
+    await _settle()
+    assert compute.calls == 2  # 等待的一方重新发起了上游请求
+    compute.gate.set()
+    assert await waiter == "answer-2"
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+
+@pytest.mark.anyio
+async def test_cancelled_waiter_does_not_cancel_the_leader():
+    cache, compute = _cache(), FakeCompute()
+    leader = asyncio.create_task(cache.get_or_compute(MESSAGES, "m", 0.2, compute))
+    await _settle()
+    waiter = asyncio.create_task(cache.get_or_compute(MESSAGES, "m", 0.2, compute))
+    await _settle()
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    compute.gate.set()
+    assert await leader == "answer-1"
+    assert compute.calls == 1
+
+
+@pytest.mark.anyio
+async def test_errors_reach_every_waiter_and_are_not_cached():
+    cache, compute = _cache(), FakeCompute(error=RuntimeError("upstream down"))
+    tasks = [asyncio.create_task(cache.get_or_compute(MESSAGES, "m", 0.2, compute)) for _ in range(3)]
+    await _settle()
+    compute.gate.set()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) and str(r) == "upstream down" for r in results)
+    assert compute.calls == 1
+
+    compute.error = None
+    assert await cache.get_or_compute(MESSAGES, "m", 0.2, compute) == "answer-2"
+
+
+@pytest.mark.anyio
+async def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache_module.time, "time", lambda: now[0])
+    cache, compute = _cache(ttl=60), FakeCompute()
+    compute.gate.set()
+    assert await cache.get_or_compute(MESSAGES, "m", 0.2, compute) == "answer-1"
+    now[0] += 59
+    assert await cache.get_or_compute(MESSAGES, "m", 0.2, compute) == "answer-1"
+    now[0] += 2
+    assert await cache.get_or_compute(MESSAGES, "m", 0.2, compute) == "answer-2"
+
+
+@pytest.mark.anyio
+async def test_lru_keeps_at_most_max_entries():
+    cache, compute = _cache(max_entries=2), FakeCompute()
+    compute.gate.set()
+    first, second, third = ([{"role": "user", "content": text}] for text in ("a", "b", "c"))
+    await cache.get_or_compute(first, "m", 0.2, compute)
+    await cache.get_or_compute(second, "m", 0.2, compute)
+    await cache.get_or_compute(first, "m", 0.2, compute)   # first 变成最近使用的
+    await cache.get_or_compute(third, "m", 0.2, compute)   # 挤掉 second
+    assert cache.stats()["entries"] == 2
+    assert await cache.get_or_compute(first, "m", 0.2, compute) == "answer-1"
+    assert await cache.get_or_compute(second, "m", 0.2, compute) == "answer-4"
+
+
+@pytest.mark.anyio
+async def test_disk_store_survives_a_new_cache(tmp_path):
+    path = str(tmp_path / "llm_cache.sqlite")
+    compute = FakeCompute()
+    compute.gate.set()
+    assert await _cache(persist_path=path).get_or_compute(MESSAGES, "m", 0.2, compute) == "answer-1"
+    restarted = _cache(persist_path=path)
+    assert await restarted.get_or_compute(MESSAGES, "m", 0.2, compute) == "answer-1"
+    assert (restarted.disk_hits, compute.calls) == (1, 1)
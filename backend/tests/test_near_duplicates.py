@@ -0,0 +1,55 @@
+from app.services.near_duplicates import NearDuplicateIndex, recipe_text, shingles, signature
+
+ORIGINAL = (
+    "Stir 30 ml gin, 30 ml Campari and 30 ml sweet vermouth with ice for twenty seconds, "
+    "strain over a large ice cube and garnish with an orange peel."
+)
+COPY = ORIGINAL.replace("twenty", "thirty").upper()
+UNRELATED = (
+    "Shake 50 ml white rum, 25 ml fresh lime juice and 15 ml sugar syrup hard with ice, "
+    "double strain into a chilled coupe."
+)
+
+
+def test_recipe_text_ignores_case_and_punctuation():
+    assert recipe_text("Gin,  Campari!") == recipe_text("gin campari")
+    assert shingles("") == []
+    assert signature("") is None
+
+
+def test_signature_is_deterministic():
+    assert (signature(ORIGINAL) == signature(ORIGINAL)).all()
+
+
+def test_find_reports_edited_copy_but_not_unrelated_recipe():
+    index = NearDuplicateIndex()
+    index.add(1, "0xoriginal", "Negroni", "0xalice", ORIGINAL)
+    index.add(2, "0xdaiquiri", "Daiquiri", "0xbob", UNRELATED)
+
+    found = index.find(COPY)
+    assert [match["recipe_address"] for match in found] == ["0xoriginal"]
+    assert found[0]["similarity"] >= index.threshold
+    assert index.find(COPY, exclude_address="0xoriginal") == []
+
+
+def test_update_moves_recipe_between_buckets():
+    index = NearDuplicateIndex()
+    index.add(1, "0xr1", "Negroni", "0xalice", ORIGINAL)
+    index.add(1, "0xr1", "Daiquiri", "0xalice", UNRELATED)
+    assert len(index) == 1
+    assert index.find(ORIGINAL) == []
+    assert index.find(UNRELATED)[0]["recipe_address"] == "0xr1"
+
+
+def test_clusters_group_copies_under_the_earliest_recipe():
+    index = NearDuplicateIndex()
+    index.add(1, "0xoriginal", "Negroni", "0xalice", ORIGINAL)
+    index.add(2, "0xcopy", "Negroni 2", "0xmallory", COPY)
+    index.add(3, "0xdaiquiri", "Daiquiri", "0xbob", UNRELATED)
+
+    clusters = index.clusters()
+    assert clusters["total"] == 1
+    cluster = clusters["clusters"][0]
+    assert cluster["original"]["recipe_address"] == "0xoriginal"
+    assert [copy["recipe_address"] for copy in cluster["copies"]] == ["0xcopy"]
+    assert cluster["owners"] == 2
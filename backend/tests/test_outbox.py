@@ -0,0 +1,107 @@
+import orjson
+import pytest
+from sqlalchemy import select
+
+from app.models.outbox import DONE, FAILED, IN_FLIGHT, PENDING, SUPERSEDED, OutboxEntry
+from app.services import outbox
+from app.services.outbox import OutboxDispatcher, _backoff, enqueue
+
+
+def test_backoff_grows_and_is_capped(monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_BACKOFF_BASE", 5)
+    monkeypatch.setattr(outbox, "OUTBOX_BACKOFF_MAX", 60)
+    assert 2.5 <= _backoff(1) <= 5
+    assert 10 <= _backoff(3) <= 20
+    assert 30 <= _backoff(20) <= 60
+
+
+@pytest.mark.anyio
+async def test_enqueue_supersedes_pending_entries_for_the_same_key(session_factory):
+    async with session_factory() as db:
+        await enqueue(db, "topic", "bar1", {"n": 1})
+        await db.commit()
+        await enqueue(db, "topic", "bar1", {"n": 2})
+        await enqueue(db, "topic", "bar2", {"n": 3})
+        await db.commit()
+        rows = (await db.execute(select(OutboxEntry.aggregate_key, OutboxEntry.status).order_by(OutboxEntry.id))).all()
+    assert rows == [("bar1", SUPERSEDED), ("bar1", PENDING), ("bar2", PENDING)]
+
+
+async def _in_flight(session_factory, attempts):
+    async with session_factory() as db:
+        entry = OutboxEntry(topic="test", aggregate_key="k", payload=orjson.dumps({"x": 1}).decode(),
+                            status=IN_FLIGHT, attempts=attempts)
+        db.add(entry)
+        await db.commit()
+        return entry
+
+
+async def _status(session_factory, entry_id):
+    async with session_factory() as db:
+        return (await db.execute(
+            select(OutboxEntry.status, OutboxEntry.last_error, OutboxEntry.result).where(OutboxEntry.id == entry_id)
+        )).one()
+
+
+@pytest.mark.anyio
+async def test_dispatch_records_result(session_factory, monkeypatch):
+    async def handler(payload):
+        return {"echo": payload["x"]}
+
+    monkeypatch.setitem(outbox.HANDLERS, "test", handler)
+    entry = await _in_flight(session_factory, attempts=1)
+    await OutboxDispatcher(session_factory)._dispatch(entry)
+    status, error, result = await _status(session_factory, entry.id)
+    assert (status, error, orjson.loads(result)) == (DONE, None, {"echo": 1})
+
+
+@pytest.mark.anyio
+async def test_dispatch_retries_then_gives_up(session_factory, monkeypatch):
+    async def handler(payload):
+        raise RuntimeError("pinata down")
+
+    monkeypatch.setitem(outbox.HANDLERS, "test", handler)
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 3)
+    dispatcher = OutboxDispatcher(session_factory)
+
+    entry = await _in_flight(session_factory, attempts=1)
+    await dispatcher._dispatch(entry)
+    assert (await _status(session_factory, entry.id))[:2] == (PENDING, "pinata down")
+
+    entry = await _in_flight(session_factory, attempts=3)
+    await dispatcher._dispatch(entry)
+    assert (await _status(session_factory, entry.id))[:2] == (FAILED, "pinata down")
+
+
+@pytest.mark.anyio
+async def test_pinned_cid_is_readable_from_sync_status(session_factory, monkeypatch):
+    from app.api.bars import get_bar_sync_status
+    from app.models.bar import Bar
+
+    async def pin(payload):
+        return {"metadata_cid": "bafy-" + payload["bar_name"]}
+
+    monkeypatch.setitem(outbox.HANDLERS, outbox.BAR_PROFILE_SYNC, pin)
+    async with session_factory() as db:
+        db.add(Bar(bar_address="0xbar", bar_name="Old", bar_photo="p", bar_location="loc", metadata_cid="bafy-old"))
+        await db.commit()
+        status = await get_bar_sync_status("0xbar", db)
+    assert (status["status"], status["metadata_cid"]) == (None, None)
+
+    async with session_factory() as db:
+        await enqueue(db, outbox.BAR_PROFILE_SYNC, "0xbar", {"bar_name": "New"})
+        await db.commit()
+        entry = (await db.execute(select(OutboxEntry))).scalar_one()
+        entry.status, entry.attempts = IN_FLIGHT, 1
+        await db.commit()
+    await OutboxDispatcher(session_factory)._dispatch(entry)
+
+    # 之后又有一条还没发送的更新：状态是 pending，CID 仍然是上一次成功的结果
+    async with session_factory() as db:
+        await enqueue(db, outbox.BAR_PROFILE_SYNC, "0xbar", {"bar_name": "Newer"})
+        await db.commit()
+        status = await get_bar_sync_status("0xbar", db)
+    assert status["status"] == PENDING
+    assert status["metadata_cid"] == "bafy-New"
+    assert status["current_metadata_cid"] == "bafy-old"
+    assert status["completed_at"] is not None
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from app.models.price_history import DAY, HOUR, LISTED, SALE, WEEK, RecipePriceRollup
+from app.services import price_history
+from app.services.price_history import bucket_start, naive_utc, pick_granularity, price_series, record_price
+
+
+def test_naive_utc_converts_aware_times_and_keeps_naive_ones():
+    aware = datetime(2026, 3, 1, 2, 30, tzinfo=timezone(timedelta(hours=8)))
+    assert naive_utc(aware) == datetime(2026, 2, 28, 18, 30)
+    assert naive_utc(datetime(2026, 3, 1, 2, 30)) == datetime(2026, 3, 1, 2, 30)
+
+
+def test_bucket_start_truncates_to_hour_and_day():
+    at = datetime(2026, 10, 14, 17, 45, 12, 999)
+    assert bucket_start(at, HOUR) == datetime(2026, 10, 14, 17)
+    assert bucket_start(at, DAY) == datetime(2026, 10, 14)
+    # 带时区的时间按原样截断，换算成 UTC 是调用方（naive_utc）的事
+    aware = at.replace(tzinfo=timezone.utc)
+    assert bucket_start(aware, HOUR) == datetime(2026, 10, 14, 17, tzinfo=timezone.utc)
+    assert bucket_start(naive_utc(at.replace(tzinfo=timezone(timedelta(hours=-5)))), DAY) == datetime(2026, 10, 14)
+
+
+def test_bucket_start_weeks_begin_on_monday():
+    monday = datetime(2026, 10, 12)
+    assert monday.weekday() == 0
+    assert bucket_start(monday, WEEK) == monday
+    assert bucket_start(datetime(2026, 10, 18, 23, 59), WEEK) == monday      # 周日还在同一周
+    assert bucket_start(datetime(2026, 10, 19, 0, 0), WEEK) == datetime(2026, 10, 19)
+    assert bucket_start(datetime(2027, 1, 1, 12), WEEK) == datetime(2026, 12, 28)  # 跨年
+
+
+def test_pick_granularity_span_limits():
+    since = datetime(2026, 1, 1)
+    assert pick_granularity(since, since + timedelta(days=14)) == HOUR
+    assert pick_granularity(since, since + timedelta(days=14, seconds=1)) == DAY
+    assert pick_granularity(since, since + timedelta(days=730)) == DAY
+    assert pick_granularity(since, since + timedelta(days=731)) == WEEK
+
+
+def _rollup(hours_after, price):
+    start = datetime(2026, 1, 1) + timedelta(hours=hours_after)
+    return RecipePriceRollup(
+        recipe_address="0xr", granularity=HOUR, bucket_start=start,
+        price_min=price, price_max=price, price_sum=price * 2, points=2,
+        price_last=price, last_at=start, sales=1, sales_value=price,
+    )
+
+
+@pytest.mark.anyio
+async def test_price_series_keeps_the_most_recent_buckets(session_factory, monkeypatch):
+    monkeypatch.setattr(price_history, "PRICE_HISTORY_MAX_BUCKETS", 3)
+    async with session_factory() as db:
+        db.add_all([_rollup(h, float(h)) for h in range(6)])
+        await db.commit()
+        series = await price_series(db, "0xr", HOUR, datetime(2026, 1, 1), datetime(2026, 1, 2))
+    assert [bucket["start"] for bucket in series] == [
+        datetime(2026, 1, 1, h).isoformat() for h in (3, 4, 5)
+    ]
+    assert series[0]["avg"] == 3.0
+
+
+@pytest.mark.anyio
+async def test_price_series_starts_at_the_bucket_containing_since(session_factory):
+    async with session_factory() as db:
+        db.add_all([_rollup(h, float(h)) for h in range(4)])
+        await db.commit()
+        series = await price_series(
+            db, "0xr", HOUR, datetime(2026, 1, 1, 1, 30, tzinfo=timezone.utc), datetime(2026, 1, 1, 2, 10)
+        )
+    assert [bucket["start"] for bucket in series] == [datetime(2026, 1, 1, h).isoformat() for h in (1, 2)]
+
+
+@pytest.mark.anyio
+@pytest.mark.postgres
+async def test_record_price_merges_points_into_every_granularity(pg_session_factory):
+    at = datetime(2026, 10, 14, 17, 5)
+    async with pg_session_factory() as db:
+        await record_price(db, "0xr", LISTED, 10, timestamp=at)
+        await record_price(db, "0xr", SALE, 4, timestamp=at + timedelta(minutes=30), buyer="0xb")
+        await record_price(db, "0xr", LISTED, 7, timestamp=at - timedelta(minutes=1))  # 迟到的点
+        await record_price(db, "0xr", LISTED, None)
+        await db.commit()
+        rows = {row.granularity: row for row in (await db.execute(select(RecipePriceRollup))).scalars()}
+    assert {g: rows[g].bucket_start for g in rows} == {
+        HOUR: datetime(2026, 10, 14, 17), DAY: datetime(2026, 10, 14), WEEK: datetime(2026, 10, 12),
+    }
+    for row in rows.values():
+        assert (row.price_min, row.price_max, row.price_sum, row.points) == (4, 10, 21, 3)
+        assert (row.price_last, row.sales, row.sales_value) == (4, 1, 4)
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+
+import httpx
+import orjson
+import pytest
+from fastapi import FastAPI
+
+from app.api import bars, recipes, trans_and_mint
+from app.db.query_budget import assert_max_queries, statement_shape
+from app.models.bar import Bar
+from app.models.recipe import Recipe
+from app.models.transaction import Transaction
+from app.services.geo import GeoIndex
+
+
+def test_statement_shape_ignores_literals_and_in_lists():
+    assert statement_shape("SELECT * FROM t WHERE id IN ($1, $2, $3) LIMIT 10") == \
+        statement_shape("SELECT *  FROM t WHERE id IN ($1) LIMIT 20")
+
+
+@pytest.fixture
+async def client(session_factory, monkeypatch):
+    """挂上三组路由，数据库换成填好数据的 sqlite"""
+    async with session_factory() as db:
+        start = datetime(2025, 1, 1)
+        for i in range(20):
+            db.add(Recipe(recipe_address=f"0xr{i}", cocktail_name=f"Recipe {i}", cocktail_photo="Qm",
+                          cocktail_recipe=f"secret {i}", owner_address=f"0xbar{i % 4}",
+                          user_address=orjson.dumps([f"0xbar{(i + 1) % 4}"]).decode(), price=1.0 + i))
+            db.add(Transaction(buyer=f"0xbar{i % 4}", seller=f"0xbar{(i + 1) % 4}", recipe_address=f"0xr{i}",
+                               timestamp=start + timedelta(days=i)))
+        db.add(Recipe(recipe_address="0xfresh", cocktail_name="Fresh Recipe", cocktail_photo="Qm",
+                      owner_address="0xbar0", price=5.0))
+        for i in range(4):
+            db.add(Bar(bar_address=f"0xbar{i}", bar_name=f"Bar {i}", bar_photo="Qm", bar_location="Shanghai",
+                       latitude=31.23 + i * 0.001, longitude=121.47))
+        await db.commit()
+
+    geo = GeoIndex()
+    for i in range(4):
+        geo.upsert(f"0xbar{i}", 31.23 + i * 0.001, 121.47)
+    monkeypatch.setattr(bars, "geo_index", geo)
+    monkeypatch.setattr(recipes, "AsyncSessionLocal", session_factory)
+
+    async def get_db():
+        async with session_factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(bars.router, prefix="/api/bars")
+    app.include_router(recipes.router, prefix="/api/recipes")
+    app.include_router(trans_and_mint.router, prefix="/api/trans")
+    app.dependency_overrides[bars.get_db] = get_db
+    app.dependency_overrides[trans_and_mint.get_db] = get_db
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.mark.anyio
+async def test_recipe_list_is_one_query(client):
+    with assert_max_queries(1):
+        response = await client.get("/api/recipes/get_all_recipes")
+    assert response.status_code == 200
+    assert len(response.json()) == 21
+
+
+@pytest.mark.anyio
+async def test_transaction_history_is_one_query(client):
+    with assert_max_queries(1):
+        response = await client.get("/api/trans/transaction_history/0xbar1")
+    assert response.status_code == 200
+    history = response.json()
+    assert {entry["type"] for entry in history} == {"buy", "sell"}
+    assert len(history) == 10
+    assert history == sorted(history, key=lambda entry: entry["timestamp"], reverse=True)
+
+
+@pytest.mark.anyio
+async def test_nearby_with_top_recipes_does_not_fan_out(client):
+    with assert_max_queries(2):
+        response = await client.get("/api/bars/nearby", params={"lat": 31.23, "lon": 121.47, "top_recipes": 3})
+    assert response.status_code == 200
+    nearby = response.json()
+    assert [bar["bar_address"] for bar in nearby] == ["0xbar0", "0xbar1", "0xbar2", "0xbar3"]
+    assert all(len(bar["top_recipes"]) == 3 for bar in nearby)
+
+
+@pytest.mark.anyio
+async def test_assert_max_queries_fails_when_exceeded(client):
+    with pytest.raises(AssertionError, match="at most 0 queries"):
+        with assert_max_queries(0):
+            await client.get("/api/recipes/get_all_recipes")
+
+
+@pytest.mark.anyio
+async def test_get_one_recipe_keeps_user_address_as_a_json_string(client):
+    response = await client.get("/api/recipes/get_one_recipe/0xr3/0xbar0")
+    recipe = response.json()
+    assert recipe["user_address"] == '["0xbar0"]'
+    assert recipe["cocktail_recipe"] == "secret 3"
+    assert (await client.get("/api/recipes/get_one_recipe/0xr3/0xbar2")).json()["cocktail_recipe"] is None
+
+
+@pytest.mark.anyio
+async def test_search_recipes_omits_missing_user_address(client):
+    by_address = {r["recipe_address"]: r for r in (await client.get("/api/recipes/search_recipes?query=Recipe")).json()}
+    assert by_address["0xr3"]["user_address"] == ["0xbar0"]
+    assert "user_address" not in by_address["0xfresh"]
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from app.services.ranking import compute_rankings, label_propagation, pagerank
+
+
+def _graph(n, edges):
+    rows, cols, weights = zip(*edges)
+    return sparse.csr_matrix((weights, (rows, cols)), shape=(n, n), dtype=np.float64)
+
+
+def _dense_pagerank(n, edges, damping):
+    """用稠密的 Google 矩阵求平稳分布作对照：没有出边的节点均匀分给所有节点"""
+    transition = np.zeros((n, n))
+    for source, target, weight in edges:
+        transition[source, target] += weight
+    out = transition.sum(axis=1)
+    transition[out == 0] = 1.0 / n
+    transition[out > 0] /= out[out > 0, None]
+    google = damping * transition + (1 - damping) / n
+    values, vectors = np.linalg.eig(google.T)
+    stationary = np.real(vectors[:, np.argmax(np.real(values))])
+    return stationary / stationary.sum()
+
+
+def test_pagerank_scores_sum_to_one_and_match_the_dense_solution():
+    edges = [(0, 1, 1.0), (1, 2, 2.0), (2, 0, 1.0), (2, 1, 1.0), (3, 2, 1.0)]
+    scores, iterations = pagerank(_graph(4, edges), damping=0.85)
+    assert scores.sum() == pytest.approx(1.0)
+    assert iterations < 100
+    assert scores == pytest.approx(_dense_pagerank(4, edges, 0.85), abs=1e-6)
+
+
+def test_pagerank_redistributes_dangling_nodes():
+    # 2 和孤立点 3 都没有出边，它们的分数均匀分给所有节点；3 只能拿到随机跳转和这部分份额
+    edges = [(0, 2, 1.0), (1, 2, 1.0)]
+    scores, _ = pagerank(_graph(4, edges), damping=0.85)
+    assert scores.sum() == pytest.approx(1.0)
+    assert scores == pytest.approx(_dense_pagerank(4, edges, 0.85), abs=1e-6)
+    assert scores[0] == pytest.approx(scores[3])
+    assert scores[3] == pytest.approx((1 - 0.85) / 4 + 0.85 * (scores[2] + scores[3]) / 4)
+
+
+def test_label_propagation_separates_disjoint_triangles():
+    edges = [(0, 1, 1.0), (1, 2, 1.0), (2, 0, 1.0), (3, 4, 1.0), (4, 5, 1.0), (5, 3, 1.0), (6, 3, 1.0)]
+    community, size = label_propagation(_graph(7, edges))
+    assert len(set(community[:3])) == 1
+    assert len(set(community[3:])) == 1
+    assert community[0] != community[3]
+    # 按社区大小编号：四个节点的那个是 0
+    assert community[3] == 0 and community[0] == 1
+    assert list(size) == [3, 3, 3, 4, 4, 4, 4]
+
+
+def test_compute_rankings_drops_self_trades_from_the_graph():
+    result = compute_rankings(["a", "a", "b"], ["a", "b", "c"], [5, 1, 2])
+    assert result.bars == ["a", "b", "c"]
+    assert result.edges == 2
+    expected, _ = pagerank(_graph(3, [(0, 1, 1.0), (1, 2, 2.0)]))
+    assert result.pagerank == pytest.approx(expected)
+    assert result.pagerank.argmax() == 2
+    assert list(result.sold) == [5, 1, 2]
+    assert list(result.bought) == [6, 2, 0]
+
+
+def test_compute_rankings_without_transactions():
+    assert compute_rankings([], [], []) is None
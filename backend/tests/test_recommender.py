@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+from app.services.recommender import CoLicenseRecommender
+
+LICENSES = [
+    ("bar1", "negroni"), ("bar1", "americano"), ("bar1", "spritz"),
+    ("bar2", "negroni"), ("bar2", "americano"),
+    ("bar3", "negroni"), ("bar3", "mojito"),
+    ("bar4", "mojito"), ("bar4", "daiquiri"),
+]
+
+
+def test_similar_uses_cosine_over_colicenses():
+    model = CoLicenseRecommender()
+    model.build(LICENSES)
+    similar = dict(model.similar("negroni", 10))
+    # negroni 3 家、americano 2 家、共同 2 家：2 / sqrt(3 * 2)
+    assert similar["americano"] == pytest.approx(2 / 6 ** 0.5)
+    assert next(iter(similar)) == "americano"
+    assert "daiquiri" not in similar
+
+
+def test_recommend_excludes_owned_and_falls_back_to_popular():
+    model = CoLicenseRecommender()
+    model.build(LICENSES)
+    recommended = [address for address, _ in model.recommend("bar2", 5)]
+    assert "negroni" not in recommended and "americano" not in recommended
+    assert recommended[0] in {"spritz", "mojito"}
+
+    popular = [address for address, _ in model.recommend("new-bar", 2)]
+    assert popular[0] == "negroni"
+
+
+def test_incremental_add_matches_full_rebuild():
+    rng = random.Random(7)
+    licenses = [(f"bar{rng.randrange(40)}", f"recipe{rng.randrange(60)}") for _ in range(400)]
+    half = len(licenses) // 2
+
+    # neighbors 取大一些，避免截断处同分的邻居取舍不同
+    incremental = CoLicenseRecommender(neighbors=1000)
+    incremental.build(licenses[:half])
+    for bar_address, recipe_address in licenses[half:]:
+        incremental.add(bar_address, recipe_address)
+    full = CoLicenseRecommender(neighbors=1000)
+    full.build(licenses)
+
+    for recipe in {recipe for _, recipe in licenses}:
+        expected = dict(full.similar(recipe, 1000))
+        actual = dict(incremental.similar(recipe, 1000))
+        assert actual.keys() == expected.keys()
+        for other, score in expected.items():
+            assert actual[other] == pytest.approx(score, abs=1e-6)
@@ -0,0 +1,59 @@
+import pytest
+
+from app.services.reconcile import (
+    bar_token_id,
+    decode_string,
+    decode_uint,
+    encode_address,
+    encode_uint,
+    metadata_cid_from_uri,
+    recipe_values,
+)
+
+
+def _abi_string(value: str) -> str:
+    data = value.encode()
+    padded = data + b"\0" * (-len(data) % 32)
+    return "0x" + encode_uint(32) + encode_uint(len(data)) + padded.hex()
+
+
+def test_encode_arguments():
+    assert encode_uint(5) == "0" * 63 + "5"
+    assert encode_address("0xAbCdEf0123456789abcdef0123456789ABCDEF01") == "0" * 24 + "abcdef0123456789abcdef0123456789abcdef01"
+    with pytest.raises(ValueError):
+        encode_address("0x1234")
+
+
+def test_decode_results():
+    assert decode_uint("0x" + encode_uint(1234)) == 1234
+    assert decode_uint("0x") == 0
+    uri = "ipfs://bafybeigdyrzt5sfp7udm7hu76uh7y26nf3efuylqabf3oclgtqy55fbzdi/metadata.json"
+    assert decode_string(_abi_string(uri)) == uri
+    assert decode_string(_abi_string("")) == ""
+    with pytest.raises(ValueError):
+        decode_string("0x" + encode_uint(32))
+
+
+def test_metadata_cid_from_uri():
+    assert metadata_cid_from_uri("ipfs://QmCid") == "QmCid"
+    assert metadata_cid_from_uri("ipfs://ipfs/QmCid/meta.json") == "QmCid/meta.json"
+    assert metadata_cid_from_uri("https://gateway.pinata.cloud/ipfs/QmCid?filename=x") == "QmCid"
+    assert metadata_cid_from_uri(" QmCid ") == "QmCid"
+    assert metadata_cid_from_uri("https://example.com/meta.json") is None
+
+
+def test_bar_token_id():
+    assert bar_token_id("42") == 42
+    assert bar_token_id("0x" + "1" * 40) is None
+    assert bar_token_id("0") is None
+    assert bar_token_id(str(1 << 63)) is None
+    assert bar_token_id("４２") is None  # 全角数字 isdigit() 也是 True
+    assert bar_token_id(None) is None
+
+
+def test_recipe_values():
+    values = recipe_values({"metadata": {"cocktail_name": "Negroni", "cocktail_photo": "QmPhoto"}})
+    assert values == {"cocktail_name": "Negroni", "cocktail_intro": None,
+                      "cocktail_photo": "QmPhoto", "cocktail_recipe": None}
+    with pytest.raises(ValueError):
+        recipe_values({"metadata": {"cocktail_photo": "QmPhoto"}})
@@ -0,0 +1,43 @@
+from app.services.retrieval import BM25Index, tokenize
+
+
+def test_tokenize_latin_words_and_cjk_bigrams():
+    assert tokenize("Gin & Tonic!") == ["gin", "tonic"]
+    assert tokenize("金汤力") == ["金", "汤", "力", "金汤", "汤力"]
+
+
+def test_search_ranks_by_bm25():
+    index = BM25Index()
+    index.upsert("a", "gin tonic lime", "A")
+    index.upsert("b", "rum lime sugar", "B")
+    index.upsert("c", "gin gin martini vermouth", "C")
+
+    assert [snippet for _, snippet in index.search("gin")] == ["C", "A"]
+    # 罕见词的权重更高
+    assert index.search("martini lime")[0][1] == "C"
+    assert index.search("whisky") == []
+
+
+def test_upsert_replaces_and_remove_hides_documents():
+    index = BM25Index()
+    index.upsert("a", "gin tonic", "old")
+    index.upsert("a", "rum punch", "new")
+    assert len(index) == 1
+    assert index.search("gin") == []
+    assert index.search("rum")[0][1] == "new"
+
+    index.remove("a")
+    assert len(index) == 0
+    assert index.search("rum") == []
+
+
+def test_compaction_keeps_live_documents():
+    index = BM25Index()
+    for i in range(2500):
+        index.upsert(f"doc{i}", f"filler{i % 50} common", f"S{i}")
+    index.upsert("target", "rare common", "T")
+    for i in range(2400):
+        index.remove(f"doc{i}")
+    assert len(index) == 101
+    assert index.search("rare", k=1)[0][1] == "T"
+    assert len(index.search("common", k=200)) == 101
@@ -318,9 +318,13 @@ class APIService {
     }
 
     // Store recipe with path parameters
-    async storeRecipe(recipeAddress, metadataCid, ownerAddress, price) {
+    // tokenId (optional) lets the backend reconcile the row with the on-chain tokenURI
+    async storeRecipe(recipeAddress, metadataCid, ownerAddress, price, tokenId = null) {
         try {
-            const url = `${this.baseUrl}${this.recipeEndpoints.storeRecipe}/${recipeAddress}/${metadataCid}/${ownerAddress}/${price}`;
+            let url = `${this.baseUrl}${this.recipeEndpoints.storeRecipe}/${recipeAddress}/${metadataCid}/${ownerAddress}/${price}`;
+            if (tokenId !== null && tokenId !== undefined) {
+                url += `?token_id=${encodeURIComponent(tokenId)}`;
+            }
             
             const result = await this.makeRequest(url, {
                 method: 'POST'
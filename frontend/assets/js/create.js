@@ -479,7 +479,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 erc4907Address || tokenId || transaction.hash,  // recipeAddress (ERC-6551 account address)
                 finalCID,         // metadataCid (string)
                 walletAddress,    // ownerAddress (string - the user who initiated minting)
-                priceValue        // price (float/number)
+                priceValue,       // price (float/number)
+                tokenId           // RecipeNFT tokenId (lets the backend detect updateTokenURI)
             );
 
             if (success) {